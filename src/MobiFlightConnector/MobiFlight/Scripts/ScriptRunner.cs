@@ -7,6 +7,7 @@ using System.Collections.Generic;
 using System.Diagnostics;
 using System.IO;
 using System.Linq;
+using System.Text;
 using System.Text.RegularExpressions;
 using System.Threading;
 using System.Threading.Tasks;
@@ -24,6 +25,14 @@ namespace MobiFlight.Scripts
         private const int PROCESS_POLLING_DELAY_MS = 300;
         private const int PROCESS_KILL_TIMEOUT_MS = 1000;
 
+        // Resident Python host that runs the scripts of a directory in one long-lived process
+        private const string SCRIPT_HOST_PACKAGE = "mobiflight_cdu";
+        private const string SCRIPT_HOST_MODULE = "mobiflight_cdu.cdu_host";
+        private const string SCRIPT_HOST_NAME = "cdu_host";
+        private const string SCRIPT_HOST_STOPPED_MARKER = "cdu_host:stopped:";
+        private const int SCRIPT_HOST_QUIT_TIMEOUT_MS = 3000;
+        private const string SCRIPT_HOST_PROFILE_VARIABLE = "CDU_STARTUP_PROFILE";
+
         private JoystickManager JsManager;
         private SimConnectCacheInterface MsfsCache;
         private string AircraftName = string.Empty;
@@ -39,6 +48,11 @@ namespace MobiFlight.Scripts
 
         private IChildProcessMonitor ChildProcMon;
 
+        private Process ScriptHost;
+        private IChildProcessMonitor ScriptHostProcMon;
+        private bool ScriptHostHasScripts = false;
+        private readonly object ScriptHostLock = new object();
+
         private volatile bool IsInPlayMode = false;
 
         private ConcurrentBag<Joystick> GameControllersWithScripts = new ConcurrentBag<Joystick>();
@@ -152,6 +166,204 @@ namespace MobiFlight.Scripts
             }
         }
 
+        private static string PythonLogLevel()
+        {
+            LogSeverity severity = LogSeverity.Info;
+            Enum.TryParse(Properties.Settings.Default.LogLevel, /*ignoreCase=*/ true, out severity);
+            return severity.PythonLogLevel();
+        }
+
+        private bool IsHostedScript(string scriptPath)
+        {
+            string directory = Path.GetDirectoryName(scriptPath);
+            return File.Exists(Path.Combine(directory, SCRIPT_HOST_PACKAGE, "cdu_host.py"));
+        }
+
+        private bool EnsureScriptHost(string directory)
+        {
+            if (ScriptHost != null)
+            {
+                try
+                {
+                    if (!ScriptHost.HasExited && ScriptHost.StartInfo.WorkingDirectory == directory)
+                    {
+                        return true;
+                    }
+                }
+                catch (InvalidOperationException)
+                {
+                    // Process object no longer usable, start a new host
+                }
+                StopScriptHost();
+            }
+
+            ProcessStartInfo psi = new ProcessStartInfo
+            {
+                FileName = PythonExecutable,
+                Arguments = $"-m {SCRIPT_HOST_MODULE}",
+                WorkingDirectory = directory,
+                CreateNoWindow = true,
+                UseShellExecute = false,
+                RedirectStandardInput = true,
+                RedirectStandardOutput = true,
+                RedirectStandardError = true,
+                // Script paths are sent as UTF-8 (without BOM) whatever the console code page
+                StandardInputEncoding = new UTF8Encoding(false),
+            };
+            psi.EnvironmentVariables["LOGLEVEL"] = PythonLogLevel();
+            if (PythonLogLevel() == LogSeverity.Debug.PythonLogLevel())
+            {
+                // Log the time from each aircraft load to its first CDU frame
+                psi.EnvironmentVariables[SCRIPT_HOST_PROFILE_VARIABLE] = "1";
+            }
+
+            Process host = new Process
+            {
+                StartInfo = psi
+            };
+
+            host.EnableRaisingEvents = true;
+            host.OutputDataReceived += ScriptHost_OutputDataReceived;
+            host.ErrorDataReceived += Process_ErrorDataReceived;
+            host.Exited += ScriptHost_Exited;
+
+            Log.Instance.log($"ScriptRunner - Start script host in {directory}", LogSeverity.Info);
+
+            try
+            {
+                host.Start();
+                host.BeginOutputReadLine();
+                host.BeginErrorReadLine();
+            }
+            catch (Exception ex)
+            {
+                Log.Instance.log($"ScriptRunner - Failed to start script host, starting scripts as separate processes: {ex.Message}", LogSeverity.Error);
+                host.Dispose();
+                return false;
+            }
+
+            ScriptHost = host;
+            ScriptHostHasScripts = false;
+
+            try
+            {
+                // Scripts the host starts as child processes join the same job
+                ScriptHostProcMon = new ChildProcessMonitor();
+                ScriptHostProcMon.AddChildProcess(host);
+            }
+            catch (Exception ex)
+            {
+                Log.Instance.log($"ScriptRunner - Exception in ChildProcessMonitor AddChildProcess: {ex.Message}", LogSeverity.Error);
+            }
+
+            return true;
+        }
+
+        private bool SendScriptHostCommand(string command)
+        {
+            try
+            {
+                ScriptHost.StandardInput.WriteLine(command);
+                ScriptHost.StandardInput.Flush();
+                return true;
+            }
+            catch (Exception ex) when (ex is IOException || ex is InvalidOperationException || ex is ObjectDisposedException)
+            {
+                Log.Instance.log($"ScriptRunner - Cannot send '{command}' to script host: {ex.Message}", LogSeverity.Error);
+                return false;
+            }
+        }
+
+        private bool LoadInScriptHost(string script)
+        {
+            string scriptPath = ScriptDictionary[script];
+            if (!IsHostedScript(scriptPath))
+            {
+                return false;
+            }
+
+            lock (ScriptHostLock)
+            {
+                if (!EnsureScriptHost(Path.GetDirectoryName(scriptPath)) || !SendScriptHostCommand($"load {scriptPath}"))
+                {
+                    return false;
+                }
+                ScriptHostHasScripts = true;
+            }
+
+            Log.Instance.log($"ScriptRunner - Load in script host: {script}", LogSeverity.Info);
+            return true;
+        }
+
+        private void UnloadHostedScripts()
+        {
+            lock (ScriptHostLock)
+            {
+                if (ScriptHost != null && ScriptHostHasScripts)
+                {
+                    SendScriptHostCommand("unload");
+                    ScriptHostHasScripts = false;
+                }
+            }
+        }
+
+        private void StopScriptHost()
+        {
+            Process host = ScriptHost;
+            ScriptHost = null;
+            ScriptHostHasScripts = false;
+            if (host == null)
+            {
+                return;
+            }
+
+            host.OutputDataReceived -= ScriptHost_OutputDataReceived;
+            host.ErrorDataReceived -= Process_ErrorDataReceived;
+            host.Exited -= ScriptHost_Exited;
+
+            try
+            {
+                if (!host.HasExited)
+                {
+                    // Let the host unload its scripts and close its connections
+                    host.StandardInput.WriteLine("quit");
+                    host.StandardInput.Close();
+                    if (!host.WaitForExit(SCRIPT_HOST_QUIT_TIMEOUT_MS))
+                    {
+                        host.Kill();
+                        host.WaitForExit(PROCESS_KILL_TIMEOUT_MS);
+                    }
+                }
+            }
+            catch (Exception ex)
+            {
+                Log.Instance.log($"ScriptRunner - Error stopping script host: {ex.Message}", LogSeverity.Error);
+            }
+            finally
+            {
+                host.Dispose();
+            }
+        }
+
+        private void ScriptHost_OutputDataReceived(object sender, DataReceivedEventArgs e)
+        {
+            if (!string.IsNullOrEmpty(e.Data) && e.Data.StartsWith(SCRIPT_HOST_STOPPED_MARKER))
+            {
+                string script = e.Data.Substring(SCRIPT_HOST_STOPPED_MARKER.Length);
+                Log.Instance.log($"ScriptRunner - Script stopped in script host: {script}", LogSeverity.Error);
+                SendUserMessage(UserMessageCodes.PROCESS_TERMINATED, script);
+                return;
+            }
+
+            Process_OutputDataReceived(sender, e);
+        }
+
+        private void ScriptHost_Exited(object sender, EventArgs e)
+        {
+            Log.Instance.log("ScriptRunner - Script host exited", LogSeverity.Error);
+            SendUserMessage(UserMessageCodes.PROCESS_TERMINATED, SCRIPT_HOST_NAME);
+        }
+
         private void ExecuteScripts(List<string> executionList)
         {
 
@@ -169,6 +381,11 @@ namespace MobiFlight.Scripts
                     continue;
                 }
 
+                if (LoadInScriptHost(script))
+                {
+                    continue;
+                }
+
                 ProcessStartInfo psi = new ProcessStartInfo
                 {
                     FileName = PythonExecutable,
@@ -178,9 +395,7 @@ namespace MobiFlight.Scripts
                     RedirectStandardOutput = true,
                     RedirectStandardError = true,
                 };
-                LogSeverity severity = LogSeverity.Info;
-                Enum.TryParse(Properties.Settings.Default.LogLevel, /*ignoreCase=*/ true, out severity);
-                psi.EnvironmentVariables["LOGLEVEL"] = severity.PythonLogLevel();
+                psi.EnvironmentVariables["LOGLEVEL"] = PythonLogLevel();
 
                 Process process = new Process
                 {
@@ -265,6 +480,11 @@ namespace MobiFlight.Scripts
 
         private string ScriptName(object sender)
         {
+            if (ReferenceEquals(sender, ScriptHost))
+            {
+                return SCRIPT_HOST_NAME;
+            }
+
             Process process = (Process)sender;
             if (ProcessTable.TryGetValue(process.Id, out string script))
             {
@@ -384,6 +604,8 @@ namespace MobiFlight.Scripts
 
         private void StopActiveProcesses()
         {
+            UnloadHostedScripts();
+
             foreach (var process in ActiveProcesses)
             {
                 try
@@ -434,6 +656,11 @@ namespace MobiFlight.Scripts
         public void Shutdown()
         {
             Stop();
+
+            lock (ScriptHostLock)
+            {
+                StopScriptHost();
+            }
         }
 
         private async Task ProcessAircraftRequests(CancellationToken token)
@@ -1,15 +1,16 @@
 import asyncio
 import ctypes
 import functools
-import json
 import logging
-import struct
 from ctypes import wintypes
 from typing import Any, Optional
 
-import websockets.asyncio.client as ws_client
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, shared_client
 
 # --- MobiFlight endpoints ---
 CAPTAIN_CDU_URL: str = "ws://localhost:8320/winwing/cdu-captain"
@@ -82,41 +83,35 @@ def rgb_to_mobi_colour(r: int, g: int, b: int) -> str:
     return best_code
 
 
-def create_mobi_json(data: bytes) -> str:
-    message: dict = {"Target": "Display", "Data": [[] for _ in range(CDU_CELLS)]}
-
-    for row in range(CDU_ROWS):
-        for col in range(CDU_COLUMNS):
-            cell_idx = row * CDU_COLUMNS + col
-            src = cell_idx * CELL_BYTE_COUNT
-
-            if src + CELL_BYTE_COUNT > len(data):
-                continue
-
-            try:
-                char = chr(data[src])
-                if char in (" ", "\0"):
-                    continue
-
-                font_size = 1 if data[src + 1] else 0
-                fg_r, fg_g, fg_b = data[src + 2], data[src + 3], data[src + 4]
-                bg_r, bg_g, bg_b = data[src + 6], data[src + 7], data[src + 8]
+def is_reverse_background(r: int, g: int, b: int) -> bool:
+    return (r + g + b) > BG_BLACK_THRESHOLD
 
-                char = SPECIAL_CHARS.get(char, char)
-                colour = rgb_to_mobi_colour(fg_r, fg_g, fg_b)
-                reverse = 1 if (bg_r + bg_g + bg_b) > BG_BLACK_THRESHOLD else 0
 
-                message["Data"][cell_idx] = [char, colour, font_size, reverse]
+CDU_LAYOUT: GridLayout = GridLayout(
+    stride=CELL_BYTE_COUNT,
+    cell_size=CELL_BYTE_COUNT,
+    glyph=0,
+    flags=1,
+    colour=2,
+    background=6,
+    rgb=True,
+    rgb_colour=rgb_to_mobi_colour,
+    rgb_reverse=is_reverse_background,
+    flag_roles={0xFF: SMALL},  # FontSize: 0=Large, anything else small
+    glyphs=SPECIAL_CHARS,
+    reverse_field=True,
+)
+CDU_DECODER: GridDecoder = GridDecoder(CDU_LAYOUT)
 
-            except Exception as e:
-                logging.debug("Error processing cell (%d, %d): %s", row, col, e)
 
-    return json.dumps(message)
+@cached_frames()
+def create_mobi_json(data: bytes) -> str:
+    return CDU_DECODER.to_json(data)
 
 
 class SimConnectMobiFlight(SimConnect):
     def __init__(self, auto_connect: bool = True, library_path: Optional[str] = None) -> None:
-        self.client_data_handlers: list = []
+        self.client_data_handlers: ClientDataRoutes = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -125,13 +120,11 @@ class SimConnectMobiFlight(SimConnect):
             wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID
         ]
 
-    def register_client_data_handler(self, handler: Any) -> None:
-        if handler not in self.client_data_handlers:
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id: int, handler: Any) -> None:
+        self.client_data_handlers.register(define_id, handler)
 
-    def unregister_client_data_handler(self, handler: Any) -> None:
-        if handler in self.client_data_handlers:
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id: int, handler: Any) -> None:
+        self.client_data_handlers.unregister(define_id, handler)
 
     def my_dispatch_proc(self, pData: Any, cbData: Any, pContext: Any) -> None:
         dwID = pData.contents.dwID
@@ -139,60 +132,11 @@ class SimConnectMobiFlight(SimConnect):
             client_data = ctypes.cast(
                 pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)
             ).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(
-                        self.websocket_uri, ping_interval=None
-                    )
-                    logging.info("MobiFlight connected at %s", self.websocket_uri)
-                    await self.websocket.send('{"Target": "Font", "Data": "AirbusThales"}')
-                    await asyncio.sleep(1)
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e:
-                self.retries += 1
-                logging.info(
-                    "Connection not possible at %s: (attempt %d/%d)",
-                    self.websocket_uri, self.retries, self.max_retries,
-                )
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.info(
-            "Max retries reached for %s. "
-            "If you only have one CDU attached, you can ignore this message.",
-            self.websocket_uri,
-        )
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
-
 class AerosoftA340MCDUClient:
     def __init__(
         self,
@@ -203,17 +147,17 @@ class AerosoftA340MCDUClient:
         definition_id: int,
     ) -> None:
         self.sc = sc
-        self.mobiflight = MobiFlightClient(websocket_uri)
+        self.mobiflight = shared_client(websocket_uri, font="AirbusThales", frame_interval=FRAME_INTERVAL)
         self.mcdu_name = mcdu_name
         self.client_data_id = client_data_id
         self.definition_id = definition_id
-        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.screen = ClientDataBuffer(CDU_DATA_SIZE)
 
     def setup_simconnect(self) -> bool:
         try:
             h = self.sc.hSimConnect
             self.sc.dll.MapClientDataNameToID(h, self.mcdu_name.encode(), self.client_data_id)
-            self.sc.dll.AddToClientDataDefinition(h, self.definition_id, 0, CDU_DATA_SIZE, 0, 0)
+            add_client_data_definition(self.sc, self.definition_id, 0, CDU_DATA_SIZE)
             self.sc.dll.RequestClientData(
                 h,
                 self.client_data_id,
@@ -223,7 +167,7 @@ class AerosoftA340MCDUClient:
                 Enum.SIMCONNECT_CLIENT_DATA_REQUEST_FLAG.SIMCONNECT_CLIENT_DATA_REQUEST_FLAG_CHANGED,
                 0, 0, 0,
             )
-            self.sc.register_client_data_handler(self.handle_cdu_data)
+            self.sc.register_client_data_handler(self.definition_id, self.handle_cdu_data)
             logging.info("SimConnect initialised for %s", self.mcdu_name)
             return True
         except Exception as e:
@@ -231,27 +175,14 @@ class AerosoftA340MCDUClient:
             return False
 
     def handle_cdu_data(self, client_data: Any) -> None:
-        if self.event_loop is None:
-            return
-        if client_data.dwDefineID != self.definition_id or not hasattr(client_data, "dwData"):
-            return
         try:
-            int_count = CDU_DATA_SIZE // 4
-            if len(client_data.dwData) < int_count:
-                logging.warning(
-                    "Incomplete CDU data for %s: got %d ints, expected %d",
-                    self.mcdu_name, len(client_data.dwData), int_count,
-                )
+            if not self.screen.update(client_data):
                 return
-            data = struct.pack(f"{int_count}I", *client_data.dwData[:int_count])
-            asyncio.run_coroutine_threadsafe(
-                self.mobiflight.send(create_mobi_json(data)), self.event_loop
-            )
+            self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
         except Exception as e:
             logging.error("Error handling CDU data for %s: %s", self.mcdu_name, e)
 
     async def run(self) -> None:
-        self.event_loop = asyncio.get_running_loop()
         try:
             mobiflight_task = asyncio.create_task(self.mobiflight.run())
             await self.mobiflight.connected.wait()
@@ -265,30 +196,23 @@ class AerosoftA340MCDUClient:
         except Exception as e:
             logging.error("Error in MCDU client for %s: %s", self.mcdu_name, e)
         finally:
+            self.sc.unregister_client_data_handler(self.definition_id, self.handle_cdu_data)
+            cancel_client_data_request(self.sc, self.client_data_id, self.definition_id, self.definition_id)
             await self.mobiflight.close()
 
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-    )
-    # Startup log must remain after basicConfig to ensure the handler is registered
-    logging.info("---- Aerosoft Toliss A340 MCDU to WinWing CDU Integration ----")
-
-    sc = SimConnectMobiFlight()
-
-    mcdu1 = AerosoftA340MCDUClient(
-        sc, CAPTAIN_CDU_URL, MCDU1_NAME, MCDU1_CLIENT_DATA_ID, MCDU1_DEFINITION_ID
-    )
-    mcdu2 = AerosoftA340MCDUClient(
-        sc, CO_PILOT_CDU_URL, MCDU2_NAME, MCDU2_CLIENT_DATA_ID, MCDU2_DEFINITION_ID
-    )
-    mcdu3 = AerosoftA340MCDUClient(
-        sc, OBSERVER_CDU_URL, MCDU3_NAME, MCDU3_CLIENT_DATA_ID, MCDU3_DEFINITION_ID
-    )
+async def main() -> None:
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc:
+        mcdu1 = AerosoftA340MCDUClient(
+            sc, CAPTAIN_CDU_URL, MCDU1_NAME, MCDU1_CLIENT_DATA_ID, MCDU1_DEFINITION_ID
+        )
+        mcdu2 = AerosoftA340MCDUClient(
+            sc, CO_PILOT_CDU_URL, MCDU2_NAME, MCDU2_CLIENT_DATA_ID, MCDU2_DEFINITION_ID
+        )
+        mcdu3 = AerosoftA340MCDUClient(
+            sc, OBSERVER_CDU_URL, MCDU3_NAME, MCDU3_CLIENT_DATA_ID, MCDU3_DEFINITION_ID
+        )
 
-    async def main() -> None:
         results = await asyncio.gather(
             mcdu1.run(),
             mcdu2.run(),
@@ -299,9 +223,16 @@ if __name__ == "__main__":
             if isinstance(result, Exception):
                 logging.error("MCDU client failed: %s", result)
 
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    # Startup log must remain after basicConfig to ensure the handler is registered
+    logging.info("---- Aerosoft Toliss A340 MCDU to WinWing CDU Integration ----")
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down")
-    finally:
-        sc.exit()
@@ -1,20 +1,21 @@
 from ctypes import wintypes
 import ctypes
-import json
-import struct
 import logging
 import asyncio
 import os
-import websockets.asyncio.client as ws_client
-from typing import Optional, List, Dict, Union, Any
+from typing import Any
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, MobiFlightClient, shared_client
 
 
 class SimConnectMobiFlight(SimConnect):
 
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -23,24 +24,19 @@ class SimConnectMobiFlight(SimConnect):
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
 
-    def register_client_data_handler(self, handler):
-        if not handler in self.client_data_handlers:
-            logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         dwID = pData.contents.dwID
         if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 
@@ -82,106 +78,44 @@ CRJ_CDU_0_DEFINITION: int = 0 # CLIENT_DATA_DEFINE_ID_LCDU
 CRJ_CDU_1_DEFINITION: int = 1 # CLIENT_DATA_DEFINE_ID_RCDU
 
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(self.websocket_uri, ping_interval=None)
-                    logging.info("MobiFlight connected at %s", self.websocket_uri)
-                    # Load font                                        
-                    fontName = "Collins"
-                    await self.websocket.send(f'{{ "Target": "Font", "Data": "{fontName}" }}')
-                    logging.info(f"Setting font: {fontName}")
-                    await asyncio.sleep(1) # wait a second for font to be set
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e: 
-                self.retries += 1
-                logging.info(f"Failed to connect to {self.websocket_uri}: {e} with retries {self.retries}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.info("Max retries reached. Giving up connecting to MobiFlight at %s. If you only have one CDU attached, you can ignore this message.", self.websocket_uri)
-        self.connected.set()
-
-
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
+# Cells are stored row-major as (symbol, format), format holding the color and the small font bit
+CDU_LAYOUT: GridLayout = GridLayout(
+    stride=CDU_CELL_BYTE_COUNT,
+    glyph=0,
+    colour=1,
+    flags=1,
+    colours={
+        CDU_COLOR_BLACK: "e",  # use grey instead
+        CDU_COLOR_WHITE: "w",
+        CDU_COLOR_RED: "r",
+        CDU_COLOR_GREEN: "g",
+        CDU_COLOR_BLUE: "o",
+        CDU_COLOR_CYAN: "o", # is shown as blue on CDU
+        CDU_COLOR_MAGENTA: "m",
+        CDU_COLOR_YELLOW: "y"
+    },
+    colour_mask=0b01111111,
+    flag_roles={0b10000000: SMALL},
+    glyphs=subs,
+    # Heading lines should be small as well, except input line
+    small_rows=[y for y in range(CDU_ROWS) if y % 2 == 1 and y != 13]
+)
+CDU_DECODER: GridDecoder = GridDecoder(CDU_LAYOUT)
+
+
+@cached_frames()
 def create_mobi_json(data: bytes) -> str:
-    message: Dict[str, Union[str, List[List[Union[str, int]]]]] = {
-        "Target": "Display",
-        "Data": [[] for _ in range(CDU_CELLS)]
-    }
-
-    # Process each character - note we're using row-major order here since that's how the display expects it
-    for y in range(CDU_ROWS):
-        for x in range(CDU_COLUMNS):
-            # Convert from row-major to array index
-            src_idx = (y * CDU_COLUMNS + x) * CDU_CELL_BYTE_COUNT
-            dst_idx = y * CDU_COLUMNS + x 
-            
-            try:
-                symbol: str = chr(data[src_idx])
-                symbol = subs.get(symbol, symbol)
-                format = data[src_idx + 1]                      
-                color: int = format & 0b01111111
-                     
-                is_small: bool = (format & 0b10000000) == 128               
-                # Heading lines should be small as well, except input line
-                is_small = is_small or ((y % 2 == 1) and not (y == 13))    
-
-                color_str = {
-                    CDU_COLOR_BLACK: "e",  # use grey instead
-                    CDU_COLOR_WHITE: "w",
-                    CDU_COLOR_RED: "r",
-                    CDU_COLOR_GREEN: "g",
-                    CDU_COLOR_BLUE: "o", 
-                    CDU_COLOR_CYAN: "o", # is shown as blue on CDU
-                    CDU_COLOR_MAGENTA: "m",
-                    CDU_COLOR_YELLOW: "y"
-                }.get(color, "w")
-                
-                if symbol == ' ' or symbol == '\0':
-                    message["Data"][dst_idx] = []
-                else:
-                    message["Data"][dst_idx] = [
-                        symbol,
-                        color_str,
-                        1 if is_small else 0
-                    ]
-            except (ValueError, TypeError, IndexError) as e:
-                message["Data"][dst_idx] = []
-                logging.debug(f"Error processing cell at ({x}, {y}): {e}")
-
-    return json.dumps(message)                
+    return CDU_DECODER.to_json(data)
 
 
 class CRJCDUClient:
     def __init__(self, sc_mobiflight: SimConnectMobiFlight, websocket_uri: str, cdu_name: str, cdu_id: int, cdu_definition: int) -> None:
         self.sc_mobiflight: SimConnectMobiFlight = sc_mobiflight
-        self.mobiflight: MobiFlightClient = MobiFlightClient(websocket_uri)
-        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mobiflight: MobiFlightClient = shared_client(websocket_uri, font="Collins", frame_interval=FRAME_INTERVAL)
         self.cdu_definition: int = cdu_definition
         self.cdu_name: str = cdu_name
         self.cdu_id: int = cdu_id
+        self.screen: ClientDataBuffer = ClientDataBuffer(CDU_CELLS * CDU_CELL_BYTE_COUNT)
 
     def failed_to_connect(self) -> bool:
         return self.mobiflight.retries >= self.mobiflight.max_retries
@@ -195,14 +129,7 @@ class CRJCDUClient:
                 self.cdu_id
             )
 
-            self.sc_mobiflight.dll.AddToClientDataDefinition(
-                self.sc_mobiflight.hSimConnect,
-                self.cdu_definition,
-                0, # offset to start
-                CDU_COLUMNS * CDU_ROWS * CDU_CELL_BYTE_COUNT, # size client data in bytes
-                0,
-                0
-            )
+            add_client_data_definition(self.sc_mobiflight, self.cdu_definition, 0, CDU_COLUMNS * CDU_ROWS * CDU_CELL_BYTE_COUNT)
 
             # Request data updates
             self.sc_mobiflight.dll.RequestClientData(
@@ -216,7 +143,7 @@ class CRJCDUClient:
             )
 
             # Set up the handler
-            self.sc_mobiflight.register_client_data_handler(self.handle_cdu_data)
+            self.sc_mobiflight.register_client_data_handler(self.cdu_definition, self.handle_cdu_data)
             logging.info("SimConnect initialized for %s", self.cdu_name)
             return True
         except Exception as e:
@@ -226,21 +153,14 @@ class CRJCDUClient:
 
     def handle_cdu_data(self, client_data: Any) -> None:
         try:
-            if client_data.dwDefineID == self.cdu_definition and hasattr(client_data, 'dwData'):                
-                int_count : int = int(CDU_COLUMNS * CDU_ROWS * CDU_CELL_BYTE_COUNT / 4)              
-                if len(client_data.dwData) >= int_count:
-                    data_list : bytearray = bytearray()                  
-                    for i in range(int_count): 
-                        my_bytes : bytes = struct.pack("I", client_data.dwData[i])
-                        data_list.extend(my_bytes)                
-                    data: bytes = bytes(data_list)                                       
-                    asyncio.run_coroutine_threadsafe(self.mobiflight.send(create_mobi_json(data)), self.event_loop)
+            # Skip frames that did not change the screen
+            if self.screen.update(client_data):
+                self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
         except Exception as e:
             logging.error(f"Error handling CDU data: {e}")
 
 
     async def run(self) -> None:
-        self.event_loop = asyncio.get_running_loop()
         logging.info("Starting CDU client")
         
         try:
@@ -261,31 +181,32 @@ class CRJCDUClient:
         except Exception as e:
             logging.error(f"Error: {e}")
         finally:
+            self.sc_mobiflight.unregister_client_data_handler(self.cdu_definition, self.handle_cdu_data)
+            cancel_client_data_request(self.sc_mobiflight, self.cdu_id, self.cdu_id, self.cdu_definition)
             await self.mobiflight.close()
 
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
-        format='%(levelname)s:%(message)s'
-    )
+async def main() -> None:
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc_mobiflight:
+        captain_client: CRJCDUClient = CRJCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, CRJ_CDU_0_NAME, CRJ_CDU_0_CLIENT_DATA_ID, CRJ_CDU_0_DEFINITION)
+        co_pilot_client: CRJCDUClient = CRJCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, CRJ_CDU_1_NAME, CRJ_CDU_1_CLIENT_DATA_ID, CRJ_CDU_1_DEFINITION)
 
-    sc_mobiflight: SimConnectMobiFlight = SimConnectMobiFlight()
-    captain_client: CRJCDUClient = CRJCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, CRJ_CDU_0_NAME, CRJ_CDU_0_CLIENT_DATA_ID, CRJ_CDU_0_DEFINITION)
-    co_pilot_client: CRJCDUClient = CRJCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, CRJ_CDU_1_NAME, CRJ_CDU_1_CLIENT_DATA_ID, CRJ_CDU_1_DEFINITION)
-    
-    async def run_clients():
         await asyncio.gather(
             captain_client.run(), 
             co_pilot_client.run(),
             return_exceptions=True
         )
-    
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+
     try:
-        asyncio.run(run_clients())
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down")
     except Exception as e:
         logging.error(f"Error: {e}")
-    finally:
-        sc_mobiflight.exit()
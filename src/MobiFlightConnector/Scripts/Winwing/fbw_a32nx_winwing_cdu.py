@@ -7,8 +7,10 @@ import logging
 from math import ceil, floor
 import os
 import re
-from typing import Literal, Never, Optional, List, Dict, Union
+from typing import Literal, Never, List, Dict, Union
 import websockets.asyncio.client as ws_client
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import MobiFlightClient, shared_client
 
 
 class MfCharSize(IntEnum):
@@ -59,52 +61,6 @@ REPLACED_CHARS = {
 }
 
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(
-                        self.websocket_uri, ping_interval=None
-                    )
-                    logging.info("MobiFlight connected at %s", self.websocket_uri)
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e:
-                self.retries += 1
-                logging.debug(f"Retrying MobiFlight websocket, attempt {self.retries}: {e}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.info(
-            "Max retries reached. Giving up connecting to MobiFlight at %s. "
-            "If you only have one CDU attached, you can ignore this message.",
-            self.websocket_uri,
-        )
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
-    def is_connected(self) -> bool:
-        return self.websocket and self.connected.is_set()
-
-
 FormatStack = deque[Union[MfCharSize, MfColour, Literal["left", "right"]]]
 
 
@@ -256,6 +212,7 @@ def place_chars_in_row(
     assert len(row) == CDU_COLUMNS
 
 
+@cached_frames()
 def create_mobi_json(content: Dict) -> str:
     """Convert FlyByWire MCDU data to MobiFlight JSON format"""
 
@@ -446,8 +403,8 @@ async def main():
 
     logging.info("----STARTED FBW A32NX MCDU to WinWing CDU Integration----")
 
-    mobiflight_left = MobiFlightClient(CAPTAIN_CDU_URL)
-    mobiflight_right = MobiFlightClient(CO_PILOT_CDU_URL)
+    mobiflight_left = shared_client(CAPTAIN_CDU_URL)
+    mobiflight_right = shared_client(CO_PILOT_CDU_URL)
     mobiflight_left_task = asyncio.create_task(mobiflight_left.run())
     mobiflight_right_task = asyncio.create_task(mobiflight_right.run())
     mobiflight_clients = (mobiflight_left, mobiflight_right)
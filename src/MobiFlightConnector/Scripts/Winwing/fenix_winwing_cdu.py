@@ -1,11 +1,13 @@
 import asyncio, json
+import importlib
 import xml.etree.ElementTree as ET
 import logging
 import os
 import websockets.asyncio.client as ws_client
 import websockets.exceptions
-from gql import Client, gql
-from gql.transport.websockets import WebsocketsTransport
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.transport import frame_sent
 
 subs = {'#': '☐',    # ballot box \u2610
         '¤': '↑',    # up arrow    \u2191
@@ -17,6 +19,7 @@ subs = {'#': '☐',    # ballot box \u2610
 replace_chars =  ['£', '¢', '¥', '¤', '#', '&' ]
 format_chars = ['s', 'l', 'a', 'c', 'y', 'w', 'g', 'm']
 
+@cached_frames()
 def create_mobi_json(xml_string):   
     message =  {}
     message["Target"] = "Display"
@@ -48,7 +51,13 @@ def create_mobi_json(xml_string):
 
 
 async def run_fenix_graphql_client(mobi_client1, mobi_client2):
-    await asyncio.sleep(1)
+    # Import gql (slow) off the event loop while the MobiFlight clients connect
+    await asyncio.gather(
+        asyncio.sleep(1),
+        asyncio.to_thread(importlib.import_module, "gql.transport.websockets"),
+    )
+    from gql import Client, gql
+    from gql.transport.websockets import WebsocketsTransport
     transport = WebsocketsTransport(url="ws://localhost:8083/graphql/")
     client = Client(transport=transport)
     op_name = "OnDataRefChanged"
@@ -85,6 +94,7 @@ class Mobiflight_Client:
         self.uri = uri
         self.id = id
         self.websocket_connection = None
+        self.patcher = DisplayPatcher()
 
     async def run_mobiflight_websocket_client(self):  
         while (True):
@@ -97,6 +107,7 @@ class Mobiflight_Client:
                     await self.websocket_connection.send(f'{{ "Target": "Font", "Data": "{fontName}" }}')
                     logging.info(f"Setting font: {fontName}")
                     await asyncio.sleep(1) # wait a second for font to be set
+                    self.patcher.reset()
                 # Wait for disconnection or data
                 await self.websocket_connection.recv()    
             except websockets.exceptions.InvalidStatus as invalid:      
@@ -114,7 +125,10 @@ class Mobiflight_Client:
 
     async def send_json_data(self, mobi_json):
         if self.websocket_connection is not None:
-            await self.websocket_connection.send(mobi_json)  
+            payload = self.patcher.encode(mobi_json)
+            if payload is not None:
+                await self.websocket_connection.send(payload)
+                frame_sent()
 
     
 
@@ -134,4 +148,5 @@ async def main():
     
 
 # --------- MAIN -----------
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
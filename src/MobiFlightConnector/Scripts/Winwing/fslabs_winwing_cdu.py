@@ -4,7 +4,18 @@ import json
 import logging
 import logging.handlers
 import websockets.asyncio.client as ws_client
-import http.client
+
+from mobiflight_cdu.http_client import HttpError, KeepAliveClient
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.poll_schedule import PollSchedule
+from mobiflight_cdu.transport import frame_sent
+
+FSL_HOST = "localhost"
+FSL_PORT = 8080
+# Seconds between polls right after a screen changed and once both are static
+FSL_POLL_FAST = 0.05
+FSL_POLL_INTERVAL = 0.3
+FSL_REQUEST_TIMEOUT = 1.0
 
 FSL_COLOR_MAP = {
     0: "w",  # black (ignore)
@@ -29,6 +40,122 @@ subs = {
     112: "*",
 }
 
+CDU_COLUMNS = 24
+
+# Log decoding statistics every this many polls (at debug level)
+REPORT_INTERVAL = 1000
+
+
+def encode_cell(ascii_value, color_value, font_size):
+    """JSON of one display cell, as json.dumps would write it in the frame."""
+    if ascii_value == 0:
+        char = "-"
+    else:
+        char = subs.get(ascii_value, chr(ascii_value))
+
+    color = FSL_COLOR_MAP.get(color_value, "w")
+
+    return json.dumps([char, color, font_size], separators=(',', ':'))
+
+
+# JSON of every (ascii, colour, size) cell the MCDU normally shows, worked out once
+CELL_FRAGMENTS = {
+    (ascii_value, color_value, font_size): encode_cell(ascii_value, color_value, font_size)
+    for ascii_value in range(256)
+    for color_value in FSL_COLOR_MAP
+    for font_size in (0, 1)
+}
+
+
+class McduDecoder:
+    """
+    Display JSON of one MCDU from the raw responses of /MCDU/Display/<id>.
+
+    A response identical to the previous one is not parsed at all. Otherwise
+    only the rows whose cells changed are encoded again, cell by cell from
+    CELL_FRAGMENTS; the other rows reuse their JSON from the previous frame.
+    """
+
+    def __init__(self, mcdu):
+        self.mcdu = mcdu
+        self.polls = 0
+        self.unchanged = 0
+        self.rows_decoded = 0
+        self._body = None
+        self._rows = []
+        self._row_json = []
+        self._frame = None
+
+    def decode(self, body):
+        """The new display JSON, or None if the screen did not change."""
+        self.polls += 1
+        if self.polls % REPORT_INTERVAL == 0:
+            logging.debug(self.summary())
+
+        if body == self._body:
+            self.unchanged += 1
+            return None
+
+        new_data = json.loads(body)
+        if "Value" not in new_data:
+            return None
+        # Remember the body only once it decoded, so a bad one is tried again
+        self._body = body
+
+        cells = new_data["Value"]
+        rows = [cells[start:start + CDU_COLUMNS] for start in range(0, len(cells), CDU_COLUMNS)]
+        del self._rows[len(rows):]
+        del self._row_json[len(rows):]
+
+        changed = False
+        for index, row in enumerate(rows):
+            if index < len(self._rows):
+                if row == self._rows[index]:
+                    continue
+                self._rows[index] = row
+                self._row_json[index] = self._encode_row(row)
+            else:
+                self._rows.append(row)
+                self._row_json.append(self._encode_row(row))
+            self.rows_decoded += 1
+            changed = True
+
+        if not changed and self._frame is not None:
+            # Only the formatting of the response changed
+            self.unchanged += 1
+            return None
+
+        data = ",".join(row_json for row_json in self._row_json if row_json)
+        self._frame = f'{{"Target":"Display","Data":[{data}]}}'
+        return self._frame
+
+    def _encode_row(self, row):
+        fragments = []
+        for cell in row:
+            if cell == []:
+                fragments.append("[]")
+                continue
+
+            if len(cell) != 3:
+                logging.warning(f"Invalid MCDU row format: {cell}")
+                continue
+
+            ascii_value, color_value, font_size = cell
+            try:
+                fragment = CELL_FRAGMENTS.get((ascii_value, color_value, font_size))
+            except TypeError:
+                fragment = None
+            if fragment is None:
+                fragment = encode_cell(ascii_value, color_value, font_size)
+            fragments.append(fragment)
+
+        return ",".join(fragments)
+
+    def summary(self):
+        return (f"MCDU {self.mcdu}: {self.polls} polls, {self.unchanged} unchanged, "
+                f"{self.rows_decoded} rows decoded")
+
+
 mobi_websocket_connections = {"captain": None, "co-pilot": None}
 data_queues = {"3CA1": asyncio.Queue(), "3CA2": asyncio.Queue()}
 
@@ -36,48 +163,65 @@ data_queues = {"3CA1": asyncio.Queue(), "3CA2": asyncio.Queue()}
 # (re)connects -- otherwise a static display stays blank until it next changes.
 last_frames = {"3CA1": None, "3CA2": None}
 
+# MCDUs whose display is polled, for as long as their CDU task runs
+polled_mcdus = set()
+
 MAX_WS_RETRIES = 3   # <--- Added retry limit
 
 
-async def fetch_fsl_mcdu(mcdu):
-    """Fetch MCDU data using a persistent HTTP connection, avoiding redundant updates."""
+async def fetch_fsl_mcdus():
+    """
+    Fetch the data of all polled MCDUs, avoiding redundant updates. Both
+    requests are pipelined on one persistent, non-blocking HTTP connection,
+    so a slow aircraft never holds up the event loop (and the CDU websockets).
+    """
     global data_queues
     global last_frames
 
-    last_fetched_data = None
-    conn = http.client.HTTPConnection("localhost", 8080, timeout=1)
+    decoders = {}
+    client = KeepAliveClient(FSL_HOST, FSL_PORT, timeout=FSL_REQUEST_TIMEOUT)
+    schedule = PollSchedule("FSLabs MCDUs", fast=FSL_POLL_FAST, idle=FSL_POLL_INTERVAL)
 
-    while True:
-        try:
-            conn.request("GET", f"/MCDU/Display/{mcdu}")
-            response = conn.getresponse()
+    try:
+        while True:
+            mcdus = sorted(polled_mcdus)
+            if not mcdus:
+                await asyncio.sleep(FSL_POLL_INTERVAL)
+                continue
 
-            if response.status == 200:
-                new_data = json.load(response)
+            try:
+                responses = await client.get_many([f"/MCDU/Display/{mcdu}" for mcdu in mcdus])
+            except (OSError, TimeoutError, asyncio.TimeoutError, HttpError) as ex:
+                logging.warning(f"fetch_fsl_mcdus: Connection to FSLabs aircraft not possible. Timeout or HTTP error: {ex}")
+                await asyncio.sleep(2)
+                continue
+
+            changed = False
+            for mcdu, response in zip(mcdus, responses):
+                if response.status != 200:
+                    continue
+                try:
+                    decoder = decoders.get(mcdu)
+                    if decoder is None:
+                        decoder = decoders[mcdu] = McduDecoder(mcdu)
 
-                if "Value" in new_data:
-                    parsed_data = parse_fsl_mcdu(new_data["Value"])
+                    parsed_data = decoder.decode(response.body)
 
-                    if parsed_data != last_fetched_data:
-                        last_fetched_data = parsed_data
+                    if parsed_data is not None:
+                        changed = True
                         last_frames[mcdu] = parsed_data
                         await data_queues[mcdu].put(parsed_data)
-            else:
-                # Drain the body even on errors, otherwise the persistent
-                # HTTPConnection is left in a bad state and the next request
-                # raises ResponseNotReady.
-                response.read()
-
-        except (http.client.HTTPException, TimeoutError) as ex:
-            logging.warning(f"fetch_fsl_mcdu: Connection to FSLabs aircraft not possible. Timeout or HTTP error: {ex}")
-            await asyncio.sleep(2)
-            conn = http.client.HTTPConnection("localhost", 8080, timeout=1)
 
-        except Exception as ex:
-            logging.error(f"fetch_fsl_mcdu: {ex}")
-            conn = http.client.HTTPConnection("localhost", 8080, timeout=1)
+                except Exception as ex:
+                    logging.error(f"fetch_fsl_mcdus: {mcdu}: {ex}")
 
-        await asyncio.sleep(0.3)
+            await schedule.sleep(changed)
+    finally:
+        logging.info(client.summary())
+        logging.info(schedule.summary())
+        for decoder in decoders.values():
+            logging.info(decoder.summary())
+        await client.close()
 
 
 async def run_fsl_http_client(mcdu, cdu):
@@ -86,6 +230,7 @@ async def run_fsl_http_client(mcdu, cdu):
     global last_frames
 
     was_connected = False
+    patcher = DisplayPatcher()
 
     while True:
         conn = mobi_websocket_connections[cdu]
@@ -101,13 +246,16 @@ async def run_fsl_http_client(mcdu, cdu):
         # away. This is what stops the screen loading blank on startup/reconnect.
         if not was_connected:
             was_connected = True
+            patcher.reset()
             while not data_queues[mcdu].empty():
                 data_queues[mcdu].get_nowait()
             if last_frames[mcdu] is not None:
                 try:
-                    await conn.send(last_frames[mcdu])
+                    await conn.send(patcher.encode(last_frames[mcdu]))
+                    frame_sent()
                 except Exception as ex:
                     logging.warning(f"[{cdu}] resend on connect failed, will resync: {ex}")
+                    patcher.reset()
                     continue
 
         # Wait for new frames, but time out so a disconnect is noticed promptly.
@@ -118,12 +266,17 @@ async def run_fsl_http_client(mcdu, cdu):
 
         conn = mobi_websocket_connections[cdu]
         if mobi_json and conn:
+            payload = patcher.encode(mobi_json)
+            if payload is None:
+                continue
             try:
-                await conn.send(mobi_json)
+                await conn.send(payload)
+                frame_sent()
             except Exception as ex:
                 # Socket dropped between the check and the send; the ws task
                 # will reset the connection and we'll resync on reconnect.
                 logging.warning(f"[{cdu}] send failed, will resync on reconnect: {ex}")
+                patcher.reset()
 
 
 async def run_mobiflight_websocket_client(cdu_type):
@@ -175,6 +328,8 @@ async def run_mobiflight_websocket_client(cdu_type):
                     pass
             finally:
                 mobi_websocket_connections[cdu_type] = None
+                # Also closes the socket when the script is stopped by cancelling it
+                await connection.close()
                 logging.info(f"[{cdu_type}] Connection closed -> will reconnect.")
 
         except Exception as ex:
@@ -184,66 +339,42 @@ async def run_mobiflight_websocket_client(cdu_type):
             await asyncio.sleep(2)
 
 
-def parse_fsl_mcdu(value_list):
-    message = {"Target": "Display", "Data": []}
-
-    for row in value_list:
-        if row == []:
-            message["Data"].append([])
-            continue
-
-        if len(row) != 3:
-            logging.warning(f"Invalid MCDU row format: {row}")
-            continue
-
-        ascii_value, color_value, font_size = row
-
-        if ascii_value == 0:
-            char = "-"
-        else:
-            char = subs.get(ascii_value, chr(ascii_value))
-
-        color = FSL_COLOR_MAP.get(color_value, "w")
-
-        message["Data"].append([char, color, font_size])
-
-    return json.dumps(message, separators=(',', ':'))
-
-
-
 # Wrapper to run all tasks for a CDU and cancel fetch/process if websocket exits
 async def run_cdu_tasks(mcdu, cdu):
-    fetch_task = asyncio.create_task(fetch_fsl_mcdu(mcdu))
+    polled_mcdus.add(mcdu)
     process_task = asyncio.create_task(run_fsl_http_client(mcdu, cdu))
     ws_task = asyncio.create_task(run_mobiflight_websocket_client(cdu))
 
-    done, pending = await asyncio.wait([ws_task], return_when=asyncio.FIRST_COMPLETED)
-
-    # If ws_task is done (returns early), cancel the others
-    if ws_task in done:
-        fetch_task.cancel()
-        process_task.cancel()
-        try:
-            await fetch_task
-        except asyncio.CancelledError:
-            pass
-        try:
-            await process_task
-        except asyncio.CancelledError:
-            pass
+    # Runs until the websocket task returns early or the script is cancelled
+    # (the resident host stops it that way); either way stop polling this
+    # MCDU and cancel both tasks, so no socket outlives the script
+    try:
+        await ws_task
+    finally:
+        polled_mcdus.discard(mcdu)
+        for task in (process_task, ws_task):
+            task.cancel()
+        await asyncio.gather(process_task, ws_task, return_exceptions=True)
 
 
 async def main():
-    setup_logging(logging.INFO, os.path.join(os.getcwd(), "logs/fslMcduLogging.log"))
     logging.info("----- STARTED FSLWinwingCdu.py (FSLabs MCDU Bridge) ----")
 
     capt_cdu_task = asyncio.create_task(run_cdu_tasks("3CA1", "captain"))
     fo_cdu_task = asyncio.create_task(run_cdu_tasks("3CA2", "co-pilot"))
-
-    await asyncio.gather(
-        capt_cdu_task,
-        fo_cdu_task,
-    )
+    fetch_task = asyncio.create_task(fetch_fsl_mcdus())
+
+    try:
+        await asyncio.gather(
+            capt_cdu_task,
+            fo_cdu_task,
+        )
+    finally:
+        fetch_task.cancel()
+        try:
+            await fetch_task
+        except asyncio.CancelledError:
+            pass
 
 
 def setup_logging(log_level, log_file_full_path):
@@ -264,4 +395,6 @@ def setup_logging(log_level, log_file_full_path):
     root_logger.addHandler(console_handler)
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    setup_logging(logging.INFO, os.path.join(os.getcwd(), "logs/fslMcduLogging.log"))
+    asyncio.run(main())
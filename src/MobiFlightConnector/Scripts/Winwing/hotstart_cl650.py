@@ -13,13 +13,13 @@ CL650/CDU/<CDU Number>/screen/style_lineX - character styles lines where X is fr
 Upon script start, MobiFlight is probed (get_available_devices()) to detect the devices connected to the PC. Any device that returns a successful response is then tracked.
 
 Two tasks are started independently for each available CDU device.
-1. handle_dataref_updates -> Listens to X-Plane's WebSocket server for dataref updates for that specific CDU and pushes an event to a queue
-2. handle_device_update   -> Listens to the queue and dispatches updates to MobiFlight to update that CDU
+1. handle_dataref_updates -> Receives that CDU's dataref updates from the script's single X-Plane WebSocket subscription (XPLANE) and stores them in that CDU's DatarefStore, which only decodes values that changed
+2. handle_device_update   -> Takes the latest values at most once per interval and dispatches them to MobiFlight to update that CDU
 
 Tasks are started independently for each CDU device to ensure each device can update quickly, particularly when players might be performing shared cockpit flights.
 
-Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function uses `async for` with the websockets client. The failed message is put back in the queue, the loop continues to the next iteration which then reconnects again.
-The failed message is picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
+Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function uses `async for` with the websockets client. The values are marked for sending again (store.retry()), the loop continues to the next iteration which then reconnects again.
+The latest values are picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
 """
 
 import asyncio
@@ -28,18 +28,24 @@ import re
 import json
 import logging
 import os
-import urllib.request
 import websockets
+from dataclasses import dataclass
 from enum import StrEnum, IntEnum
 from typing import TypedDict, TypeAlias
 
+from mobiflight_cdu.latest_state import DatarefStore
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.row_render import DatarefPlan, RowRenderer
+from mobiflight_cdu.transport import frame_sent
+from mobiflight_cdu.xplane_datarefs import DatarefIds
+from mobiflight_cdu.xplane_subscription import DatarefSubscription
+
 CDU_COLUMNS = 24
 CDU_ROWS = 14
 
 WEBSOCKET_HOST = "localhost"
 WEBSOCKET_PORT = 8320
 
-BASE_REST_URL = "http://localhost:8086/api/v2/datarefs"
 BASE_WEBSOCKET_URI = f"ws://{WEBSOCKET_HOST}:8086/api/v2"
 
 WS_CAPTAIN = f"ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}/winwing/cdu-captain"
@@ -131,83 +137,80 @@ DATAREF_FILTER_PATTERNS = {
 DATAREF_PROCESS_PATTERN = re.compile("^(text|style)_line([0-9]{1,2})$") # regex group 1 will be "text" or "style", group 2 will be line number
 DATAREF_LINE_COUNT = 15 # total of 15 lines in dataref, 0 through 14, last line is a Message line which is not displayed on Winwing
 
-def fetch_dataref_mapping(device: CduDevice):
-    with urllib.request.urlopen(BASE_REST_URL, timeout=5) as response:
-        response_json = json.load(response)
-        data = list(response_json["data"])
-
-        dataref_map = filter(
-            lambda x: DATAREF_FILTER_PATTERNS[device].match(x["name"]),
-            data,
-        )
+def is_device_dataref(device: CduDevice, name: str) -> bool:
+    return DATAREF_FILTER_PATTERNS[device].match(name) is not None
 
-        return dict(
-            map(
-                lambda dataref: (int(dataref["id"]), str(dataref["name"])),
-                dataref_map,
-            )
-        )
 
-def generate_display_json(cdu_data: CduData) -> str:
-    display_data: list[tuple[str, CduCharacterColor, CduCharacterSize]] = []
+DATAREFS = DatarefIds("hotstart_cl650", lambda name: any(is_device_dataref(device, name) for device in CduDevice))
+XPLANE = DatarefSubscription(BASE_WEBSOCKET_URI, DATAREFS)
 
-    for row in range(CDU_ROWS):
 
-        if row in cdu_data:
-            character_styles = list(cdu_data[row]["style"])
-            row_text = cdu_data[row]["text"]
+@dataclass(frozen=True)
+class Cl650Dataref(DatarefPlan):
+    line_type: str # "text" or "style"
 
-            if len(row_text) == 0:
-                for _ in range(CDU_COLUMNS):
-                    display_data.append((" ", CduCharacterColor.WHITE, CduCharacterSize.SMALL)) # fill up empty line if text was empty
-            else: 
-                for character_index in range(CDU_COLUMNS):
-                    if character_index < len(row_text): # or populate text with styles
-                        display_data.append((row_text[character_index], CduCharacterColor.from_style(character_styles[character_index]), CduCharacterSize.from_style(character_styles[character_index])))
-                    else:
-                        display_data.append((" ", CduCharacterColor.WHITE, CduCharacterSize.SMALL)) # fill up rest of characters, but this is very unlikely to hit as datarefs have full characters
 
-    return json.dumps({"Target": "Display", "Data": display_data})
+def compile_dataref(dataref_name: str) -> Cl650Dataref | None:
+    short_name = dataref_name[dataref_name.rfind('/')+1:] # strip everything before last '/', CL650/CDU/1/screen/text_line0 becomes text_line0
+    re_match = DATAREF_PROCESS_PATTERN.fullmatch(short_name) # applies compiled regular expression to extract part of name
+    if re_match is None:
+        # no match
+        logging.error("error trying to extract type and line number from dataref: %s", short_name)
+        return None
 
+    line_number = int(re_match.group(2))
+    if line_number >= CDU_ROWS:
+        return None # the Message line is not displayed on Winwing
 
-def process_datarefs(values: dict[str, str]) -> CduData:
-    results: CduData = {}
+    return Cl650Dataref(line_number, re_match.group(1))
 
-    for dataref_name, dataref_value in values.items():
-        short_name = dataref_name[dataref_name.rfind('/')+1:] # strip everything before last '/', CL650/CDU/1/screen/text_line0 becomes text_line0
-        re_match = DATAREF_PROCESS_PATTERN.fullmatch(short_name) # applies compiled regular expression to extract part of name
-        if re_match is None:
-            # no match
-            logging.error("error trying to extract type and line number from dataref: %s", short_name)
-            continue
 
-        line_number = int(re_match.group(2))
-        line_type = re_match.group(1)
+def process_line_datarefs(datarefs: list[tuple[Cl650Dataref, str]]) -> LineData:
+    result: LineData = {"text": "", "style": bytes()}
 
-        if line_number not in results:
-            results[line_number] = {"text": "", "style": bytes()} # initialize line data to be filled later if not already initialized
-
-
-        if line_type == "text":
+    for dataref, dataref_value in datarefs:
+        if dataref.line_type == "text":
             # if this is text dataref , then base64 encoded value is a string, so we decode it
             try:
                 value = base64.b64decode(dataref_value).decode().replace("\x00","")
-                results[line_number]["text"] = value
+                result["text"] = value
             except Exception:
                 logging.exception("error decoding text line dataref value from base64: %s", dataref_value)
                 continue
 
-        elif line_type == "style":
+        elif dataref.line_type == "style":
             # if this is style dataref, then base64 encoded value is bytes
             try:
                 value = base64.b64decode(dataref_value)
-                results[line_number]["style"] = bytes(value)
+                result["style"] = bytes(value)
             except Exception:
                 logging.exception("error decoding style line dataref value from base64: %s", dataref_value)
                 continue
 
+    return result
+
 
-    return results
+def render_row(datarefs: list[tuple[Cl650Dataref, str]]) -> list[tuple[str, CduCharacterColor, CduCharacterSize]]:
+    row_data: list[tuple[str, CduCharacterColor, CduCharacterSize]] = []
+
+    if not datarefs:
+        return row_data # no datarefs for this line (yet), it is left out of the display data
+
+    line_data = process_line_datarefs(datarefs)
+    character_styles = list(line_data["style"])
+    row_text = line_data["text"]
+
+    if len(row_text) == 0:
+        for _ in range(CDU_COLUMNS):
+            row_data.append((" ", CduCharacterColor.WHITE, CduCharacterSize.SMALL)) # fill up empty line if text was empty
+    else: 
+        for character_index in range(CDU_COLUMNS):
+            if character_index < len(row_text): # or populate text with styles
+                row_data.append((row_text[character_index], CduCharacterColor.from_style(character_styles[character_index]), CduCharacterSize.from_style(character_styles[character_index])))
+            else:
+                row_data.append((" ", CduCharacterColor.WHITE, CduCharacterSize.SMALL)) # fill up rest of characters, but this is very unlikely to hit as datarefs have full characters
+
+    return row_data
 
 def print_cdu_data(data: CduData):
 
@@ -215,92 +218,36 @@ def print_cdu_data(data: CduData):
         print(row, f"({len(data[row]['text'])}):", data[row]["text"], "****", f"({len(data[row]['style'])})", [hex(v) for v in list(data[row]["style"])])
 
 
-async def handle_device_update(queue: asyncio.Queue, device: CduDevice):
+async def handle_device_update(store: DatarefStore, device: CduDevice):
     """
     Translates and sends dataref updates to MobiFlight.
     """
-
-    last_run_time = 0
-    rate_limit_time = 0.1
-
     endpoint = device.get_endpoint()
     logging.info("Connecting to CDU device %s", device)
+    patcher = DisplayPatcher()
+    display = RowRenderer(compile_dataref, render_row, CDU_ROWS)
     async for websocket in websockets.connect(endpoint):
+        patcher.reset()
         logging.info("Connected successfully to CDU device %s", device)
         while True:
-            values = await queue.get()
+            changed = await store.take()
 
             try:
-                elapsed = asyncio.get_event_loop().time() - last_run_time
-
-                # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
-                # This rate limits the number of active websocket requests to MobiFlight.
-                # The delay should not be noticeable unless a user heavily spams page changes, but it should be enough that too many messages won't be pushed at once.
-                if elapsed < rate_limit_time:
-                    await asyncio.sleep(rate_limit_time - elapsed)
-
-                cdu_data = process_datarefs(values)
-
-                display_json = generate_display_json(cdu_data)
-                await websocket.send(display_json)
-                last_run_time = asyncio.get_event_loop().time()
+                display_json = display.render(store.values, changed)
+                payload = patcher.encode(display_json)
+                if payload is not None:
+                    await websocket.send(payload)
+                    frame_sent()
 
             except websockets.exceptions.ConnectionClosed:
                 logging.error("MobiFlight websocket connection was closed... Attempting to reconnect")
-                await queue.put(values)
+                store.retry()
                 break
 
 
-async def handle_dataref_updates(queue: asyncio.Queue[dict[str,str]], device: CduDevice):
-    last_known_values: dict[str, str] = {}
-
-    dataref_map = fetch_dataref_mapping(device) # contains mapping between int id of dataref and name of dataref in X-Plane, values received only related to ids
-    logging.info("Connecting to X-Plane websocket server")
-    async for websocket in websockets.connect(
-        BASE_WEBSOCKET_URI,
-    ):
-        logging.info("Connected successfully to X-Plane websocket server")
-        try:
-            await websocket.send(
-                json.dumps(
-                    {
-                        "type": "dataref_subscribe_values",
-                        "req_id": 1,
-                        "params": {
-                            "datarefs": [
-                                {"id": id_value} for id_value in dataref_map.keys()
-                            ]
-                        },
-                    }
-                )
-            )
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
-
-                if "data" not in data:
-                    continue
-
-                new_values: dict[str, str] = dict(last_known_values)
-
-                for dataref_id, value in data["data"].items():
-                    dataref_id = int(dataref_id)
-                    if dataref_id not in dataref_map:
-                        continue
-
-                    dataref_name = dataref_map[dataref_id]
-                    new_values[dataref_name] = value
-
-                if new_values == last_known_values:
-                    continue
-
-                last_known_values = new_values
-                await queue.put(new_values)
-        except websockets.exceptions.ConnectionClosed:
-            logging.error(
-                "X-Plane websocket connection was closed... Attempting to reconnect"
-            )
-            continue
+async def handle_dataref_updates(store: DatarefStore, device: CduDevice):
+    async for changes in XPLANE.updates(lambda name: is_device_dataref(device, name)):
+        store.update(changes)
 
 
 async def get_available_devices() -> list[CduDevice]:
@@ -342,10 +289,12 @@ async def main():
 
     tasks = []
     for device in available_devices:
-        queue = asyncio.Queue()
+        # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
+        # The values are therefore rendered at most once per interval; changes arriving in between replace each other instead of queueing up.
+        store = DatarefStore(0.1, f"CDU {device}")
 
-        tasks.append(asyncio.create_task(handle_dataref_updates(queue, device)))
-        tasks.append(asyncio.create_task(handle_device_update(queue, device)))
+        tasks.append(asyncio.create_task(handle_dataref_updates(store, device)))
+        tasks.append(asyncio.create_task(handle_device_update(store, device)))
 
     logging.info("Started background tasks for %s", available_devices)
 
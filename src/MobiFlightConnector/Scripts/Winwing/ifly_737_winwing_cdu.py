@@ -1,11 +1,14 @@
-from ctypes import Structure, c_int, c_int32, c_long, c_ubyte, c_double, c_bool, c_char, c_wchar
+from ctypes import Structure, c_int, c_int32, c_long, c_ubyte, c_uint16, c_double, c_bool, c_char
 from enum import Enum
 import ctypes
+import hashlib
 import json
 import logging
 import asyncio
+import time
 from typing import Dict, List, Optional, Union
-from websockets.asyncio.client import connect
+from mobiflight_cdu.poll_schedule import PollSchedule
+from mobiflight_cdu.transport import shared_client
 import mmap
 import os
 
@@ -21,6 +24,19 @@ CELLS = COLUMNS * ROWS
 NG_SDK2_MEMORY_MAP_NAME = "iFly737NG_SDK2_FileMappingObject"
 MAX_SDK_MEMORY_MAP_NAME = "iFly737MAX_SDK_FileMappingObject"
 
+# When set, the memory maps are read from files of the same name in this
+# directory instead, e.g. written by `python -m mobiflight_cdu.ifly_standin`
+SDK_DIR_VARIABLE = "IFLY_SDK_DIR"
+
+# Seconds between reads of the memory map: right after the screen changed,
+# once it has been static, and while iFly is not running or the CDU is off
+POLL_FAST = 0.025
+POLL_IDLE = 0.2
+POLL_OFF = 1.0
+# The screen is decoded and handed to MobiFlight at least this often even
+# when its bytes did not change (the transport drops it if the CDU shows it)
+KEEPALIVE_INTERVAL = 5.0
+
 class iFlySDK_Identifier(Enum):
     SDK_UNKNOWN = 1
     SDK_NG = 2
@@ -31,7 +47,7 @@ class ShareMemory737NGSDK2(ctypes.Structure):
     _fields_ = [
         # Manually gathered from SDK_CDU.h
 
-        ("LSKChar", ((c_wchar * 24) * 14) * 2),         # <WCHAR> = 16bit unicode character (2 bytes)
+        ("LSKChar", ((c_uint16 * 24) * 14) * 2),        # <WCHAR> = 16bit unicode character (2 bytes); c_wchar is 4 bytes outside Windows
         ("LSK_SmallFont", ((c_int32 * 24) * 14) * 2),   # <BOOL> = 32bit int (4 bytes)
         ("LSK_Color", ((c_int * 24) * 14) * 2),
         ("CDU_Can_Display", c_int32 * 2),               # <BOOL> # FALSE: the screen is blank due to power loss or other situation: TRUE: the screen can display normally
@@ -65,46 +81,6 @@ class ShareMemory737MAXSDK(ctypes.Structure):
     ]
 
 
-class MobiFlightClient:
-    def __init__(self, url: str) -> None:
-        self.url: str = url
-        self.websocket = None
-        self._was_connected: bool = False
-
-    async def connect(self) -> None:
-        try:
-            self.websocket = await connect(self.url)            
-            logging.info(f"Connected to WebSocket at {self.url}")
-            # Load font           
-            fontName: str = "Boeing"
-            await self.websocket.send(f'{{ "Target": "Font", "Data": "{fontName}" }}')
-            logging.info(f"Setting font: {fontName}")
-            await asyncio.sleep(1) # wait a second for font to be set
-            self._was_connected = True
-        except Exception as e:
-            logging.error(f"Failed to connect to WebSocket: {e}")
-            self._was_connected = False
-
-    async def send(self, data: Dict) -> None:
-        if not self.websocket:
-            if self._was_connected:
-                # Try to reconnect if we were previously connected
-                await self.connect()
-            if not self.websocket:
-                return
-        
-        try:
-            await self.websocket.send(json.dumps(data))
-        except Exception as e:
-            logging.error(f"Failed to send data: {e}")
-            self._was_connected = False
-            self.websocket = None
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-
 #
 #       CDU: Display "WAITING FOR IFLY 737" while waiting to connect to iFly
 #
@@ -148,90 +124,154 @@ def create_ng_nopower_cdu_json() -> Dict:
     message["Data"] = data
                 
     return message
+# The static screens never change, so they are only serialized once
+WAIT_IFLY_JSON: str = json.dumps(create_wait_ifly_json())
+NG_NOPOWER_CDU_JSON: str = json.dumps(create_ng_nopower_cdu_json())
+
+
+class CduScreenView:
+    """
+    The bytes of one CDU's screen in the SDK memory map, viewed in place.
+
+    Only the fields the display depends on are looked at: the SDK state, the
+    NG's CDU_Can_Display flag and this CDU's characters, font sizes and
+    colours. `fingerprint()` hashes them straight from the mapping, without
+    copying the rest of the structure.
+    """
+
+    def __init__(self, memory_map: mmap.mmap, sdk: iFlySDK_Identifier, cdu_index: int) -> None:
+        if sdk == iFlySDK_Identifier.SDK_MAX:
+            structure, state_field, power_field = ShareMemory737MAXSDK, "iFly737MAX_State", None
+            char_format, attribute_format, self.encoding = "B", "B", "ascii"
+        else:
+            structure, state_field, power_field = ShareMemory737NGSDK2, "iFly737NG_State", "CDU_Can_Display"
+            char_format, attribute_format, self.encoding = "H", "i", "utf-16-le"
+
+        self._buffer: memoryview = memoryview(memory_map)
+        self._views: List[memoryview] = []
+        self.state: memoryview = self._field(structure, state_field, None, "i")
+        self.power: Optional[memoryview] = self._field(structure, power_field, cdu_index, "i") if power_field else None
+        self.chars: memoryview = self._field(structure, "LSKChar", cdu_index, char_format)
+        self.small_font: memoryview = self._field(structure, "LSK_SmallFont", cdu_index, attribute_format)
+        self.color: memoryview = self._field(structure, "LSK_Color", cdu_index, attribute_format)
+
+    def _field(self, structure: type, name: str, cdu_index: Optional[int], item_format: str) -> memoryview:
+        """The bytes of a field (of one CDU's half of a per-CDU array), cast to item_format."""
+        field = getattr(structure, name)
+        size = field.size if cdu_index is None else field.size // 2
+        start = field.offset + (cdu_index or 0) * size
+        view = self._buffer[start:start + size]
+        self._views.append(view)
+        return view.cast(item_format)
+
+    def fingerprint(self) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        for view in self._views:
+            digest.update(view)
+        return digest.digest()
+
+    def text(self) -> str:
+        """The screen's characters, row by row."""
+        return self.chars.tobytes().decode(self.encoding, errors="replace" if self.encoding == "ascii" else "surrogatepass")
+
+    def release(self) -> None:
+        """Release the views, which keep the memory map from being closed."""
+        for view in (self.state, self.power, self.chars, self.small_font, self.color, *self._views, self._buffer):
+            if view is not None:
+                view.release()
+
+
+# Color mapping from iFly to MobiFlight format
+COLOR_MAP = {
+    0: "w",  # White
+    1: "g",  # Green
+    2: "c",  # Cyan
+    3: "m",  # Magenta
+    4: "e",  # Grey (for reverse video/background)
+    5: "w",  # Box (using grey)
+    6: "w",  # Degree Symbol (White)
+    7: "e",  # Degree Symbol (Grey)
+    8: "m",  # Degree Symbol (Magenta)
+    9: "w",  # Left Arrow (White)
+    10: "w"  # Right Arrow (White)
+}
+
+# Color codes that stand for a special character rather than the one in LSKChar
+COLOR_GLYPHS = {
+    5: "\u2610",  # Unicode box
+    6: "\u00B0",  # Unicode degree symbol
+    7: "\u00B0",
+    8: "\u00B0",
+    9: "\u2190",  # Unicode left arrow
+    10: "\u2192",  # Unicode right arrow
+}
+
+BLANK_CDU_JSON: str = json.dumps({"Target": "Display", "Data": [[] for _ in range(CELLS)]})
+
+
+class _CellTable(dict):
+    """(char, color, small font) -> JSON of the display cell, computed on first use of each."""
+
+    def __missing__(self, key: tuple) -> str:
+        char, color, small_font = key
+        if color == 0 and char in (" ", "\0"):
+            cell = []
+        else:
+            cell = [COLOR_GLYPHS.get(color, char), COLOR_MAP.get(color, "w"), 1 if small_font else 0]
+        value = self[key] = json.dumps(cell)
+        return value
+
+
+CELL_JSON = _CellTable()
+
+
 #
 #       CDU: Display contents of the iFly CDU (works for both NG and MAX)
 #
-def create_cdu_mobi_json(memory_map: Union[ShareMemory737NGSDK2, ShareMemory737MAXSDK], cdu_index: int) -> Dict:
+def create_cdu_mobi_json(screen: CduScreenView) -> str:
     """Create JSON message for MobiFlight WebSocket from memory map data
     
+    The characters, font sizes and colors are taken from the memory map
+    an array at a time (see CduScreenView) and every cell is looked up in
+    CELL_JSON, so no cell is converted more than once per run.
+
     Args:
-        memory_map: Either ShareMemory737NGSDK2 or ShareMemory737MAXSDK structure
-        cdu_index: 0 for captain, 1 for first officer
+        screen: View of one CDU's screen in either the NG or the MAX memory map
         
     Returns:
-        Dictionary with Target and Data fields for MobiFlight WebSocket
+        JSON with Target and Data fields for MobiFlight WebSocket
     """
-    message: Dict[str, Union[str, List[List[Union[str, int]]]]] = {
-        "Target": "Display",
-        "Data": [[] for _ in range(CELLS)]
-    }
-    
-    # Color mapping from iFly to MobiFlight format
-    color_map = {
-        0: "w",  # White
-        1: "g",  # Green
-        2: "c",  # Cyan
-        3: "m",  # Magenta
-        4: "e",  # Grey (for reverse video/background)
-        5: "w",  # Box (using grey)
-        6: "w",  # Degree Symbol (White)
-        7: "e",  # Degree Symbol (Grey)
-        8: "m",  # Degree Symbol (Magenta)
-        9: "w",  # Left Arrow (White)
-        10: "w"  # Right Arrow (White)
-    }
-
     try:
-        data = []        
-        for row in range(ROWS):
-            for col in range(COLUMNS):
-                    char_raw = memory_map.LSKChar[cdu_index][row][col]
-                    # Handle both c_char (bytes) from MAX and c_wchar (str) from NG
-                    if isinstance(char_raw, bytes):
-                        char = char_raw.decode('ascii', errors='replace')
-                    else:
-                        char = char_raw
-                    
-                    small_font = memory_map.LSK_SmallFont[cdu_index][row][col]
-                    color = memory_map.LSK_Color[cdu_index][row][col]
-                    
-                    if color == 0 and char in [' ', '\0']:
-                        data.append([])
-                    else:
-                        # Handle special characters
-                        if color == 5:  # Box character
-                            char = "\u2610"  # Unicode box
-                        elif color == 9:  # Left arrow
-                            char = "\u2190"  # Unicode left arrow
-                        elif color == 10:  # Right arrow
-                            char = "\u2192"  # Unicode right arrow
-                        elif color in (6, 7, 8):  # Degree symbol
-                            char = "\u00B0"  # Unicode degree symbol
-
-                        data.append([
-                            char,
-                            color_map.get(color, "w"),
-                            1 if small_font else 0
-                        ])
-
-        message["Data"] = data
+        cells = CELL_JSON
+        # Rows of COLUMNS cells each, in the order they are laid out in memory
+        data = ", ".join([cells[cell] for cell in zip(screen.text(), screen.color, screen.small_font)])
                 
     except Exception as e:
         logging.error(f"Error processing CDU data: {e}")
-        return {"Target": "Display", "Data": [[] for _ in range(CELLS)]}
+        return BLANK_CDU_JSON
     
-    return message
+    return f'{{"Target": "Display", "Data": [{data}]}}'
 
 class IFlyCDUClient:
     def __init__(self, cdu_index: int) -> None:
         self.cdu_index: int = cdu_index  # 0 for captain, 1 for F/O
-        self.client = MobiFlightClient(CAPTAIN_CDU_URL if cdu_index == 0 else FO_CDU_URL)
+        self.client = shared_client(CAPTAIN_CDU_URL if cdu_index == 0 else FO_CDU_URL, font="Boeing")
         self.memory_map: Optional[mmap.mmap] = None
+        self.screen: Optional[CduScreenView] = None
         self._running: bool = False
         self.iflySDK: iFlySDK_Identifier = iFlySDK_Identifier.SDK_UNKNOWN
+        self.frames: int = 0
+        self.unchanged: int = 0
+        self._fingerprint: Optional[bytes] = None
+        self._last_sent: float = 0.0
+        self.powered: bool = False
+        self.schedule: PollSchedule = PollSchedule(f"iFly CDU {cdu_index}", fast=POLL_FAST, idle=POLL_IDLE, off=POLL_OFF)
 
     def _memory_map_exists(self, name: str) -> bool:
         """Check if a named memory map exists without creating it"""
+        sdk_dir = os.environ.get(SDK_DIR_VARIABLE)
+        if sdk_dir:
+            return os.path.isfile(os.path.join(sdk_dir, name))
         try:
             kernel32 = ctypes.windll.kernel32
             # Try to open existing mapping (FILE_MAP_READ = 0x0004)
@@ -249,15 +289,21 @@ class IFlyCDUClient:
             logging.debug(f"Error checking memory map '{name}': {e}")
             return False
 
+    def _open_memory_map(self, name: str, size: int) -> mmap.mmap:
+        """Open a named memory map for reading, or its stand-in file"""
+        sdk_dir = os.environ.get(SDK_DIR_VARIABLE)
+        if sdk_dir:
+            with open(os.path.join(sdk_dir, name), "rb") as f:
+                return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return mmap.mmap(-1, size, name, access=mmap.ACCESS_READ)
+
     def setup_memory_map(self) -> bool:
         """Setup memory map by detecting which iFly variant is running"""
         try:
             # Check MAX first
             if self._memory_map_exists(MAX_SDK_MEMORY_MAP_NAME):
                 try:
-                    self.memory_map = mmap.mmap(-1, ctypes.sizeof(ShareMemory737MAXSDK),
-                                              MAX_SDK_MEMORY_MAP_NAME,
-                                              access=mmap.ACCESS_READ)
+                    self.memory_map = self._open_memory_map(MAX_SDK_MEMORY_MAP_NAME, ctypes.sizeof(ShareMemory737MAXSDK))
                     data = self.memory_map.read(ctypes.sizeof(ShareMemory737MAXSDK))
                     self.memory_map.seek(0)
                     memory_struct = ShareMemory737MAXSDK.from_buffer_copy(data)
@@ -280,9 +326,7 @@ class IFlyCDUClient:
             # Check NG
             if self._memory_map_exists(NG_SDK2_MEMORY_MAP_NAME):
                 try:
-                    self.memory_map = mmap.mmap(-1, ctypes.sizeof(ShareMemory737NGSDK2),
-                                              NG_SDK2_MEMORY_MAP_NAME,
-                                              access=mmap.ACCESS_READ)
+                    self.memory_map = self._open_memory_map(NG_SDK2_MEMORY_MAP_NAME, ctypes.sizeof(ShareMemory737NGSDK2))
                     data = self.memory_map.read(ctypes.sizeof(ShareMemory737NGSDK2))
                     self.memory_map.seek(0)
                     memory_struct = ShareMemory737NGSDK2.from_buffer_copy(data)
@@ -313,66 +357,85 @@ class IFlyCDUClient:
                 self.memory_map = None
             return False
 
-    async def process_memory_map(self) -> None:
+    async def process_memory_map(self) -> bool:
+        """Send the screen if it changed. Returns True if it did."""
         if not self.memory_map:
-            return
+            return False
         
         try:
-            # Get the appropriate structure type and size based on SDK
-            if self.iflySDK == iFlySDK_Identifier.SDK_MAX:
-                structure_class = ShareMemory737MAXSDK
-                state_field = 'iFly737MAX_State'
-                has_power_check = False
-            elif self.iflySDK == iFlySDK_Identifier.SDK_NG:
-                structure_class = ShareMemory737NGSDK2
-                state_field = 'iFly737NG_State'
-                has_power_check = True
-            else:
-                return
-            
-            # Read and parse memory structure (common code)
-            data = self.memory_map.read(ctypes.sizeof(structure_class))
-            self.memory_map.seek(0)
-            memory_struct = structure_class.from_buffer_copy(data)
-            
+            if self.screen is None:
+                if self.iflySDK not in (iFlySDK_Identifier.SDK_MAX, iFlySDK_Identifier.SDK_NG):
+                    return False
+                self.screen = CduScreenView(self.memory_map, self.iflySDK, self.cdu_index)
+            screen = self.screen
+
+            # Skip the screen while its bytes are unchanged, but hand it out
+            # again now and then in case a change was read half-written
+            fingerprint = screen.fingerprint()
+            now = time.monotonic()
+            changed = fingerprint != self._fingerprint
+            if not changed and now - self._last_sent < KEEPALIVE_INTERVAL:
+                self.unchanged += 1
+                return False
+
             # Determine which JSON to generate based on state
-            state_value = getattr(memory_struct, state_field)
+            state_value = screen.state[0]
+            self.powered = state_value != 0 and (screen.power is None or screen.power[0] != 0)
             
             if state_value == 0:
                 # iFly unavailable
-                json_data = create_wait_ifly_json()
-            elif has_power_check and memory_struct.CDU_Can_Display[self.cdu_index] == 0:
+                json_data = WAIT_IFLY_JSON
+            elif screen.power is not None and screen.power[0] == 0:
                 # NG only: CDU powered off
-                json_data = create_ng_nopower_cdu_json()
+                json_data = NG_NOPOWER_CDU_JSON
             else:
                 # Normal operation
-                json_data = create_cdu_mobi_json(memory_struct, self.cdu_index)
+                json_data = create_cdu_mobi_json(screen)
 
             await self.client.send(json_data)
+            self._fingerprint = fingerprint
+            self._last_sent = now
+            self.frames += 1
+            return changed
             
         except Exception as e:
             logging.error(f"Error processing memory map for CDU {self.cdu_index}: {e}")
+            return False
+
+    def close_memory_map(self) -> None:
+        if self.screen is not None:
+            self.screen.release()
+            self.screen = None
+        if self.memory_map:
+            self.memory_map.close()
+            self.memory_map = None
 
     async def run(self) -> None:
         if not self.setup_memory_map():
             return
         
         self._running = True
-        await self.client.connect()
-        
+        client_task = asyncio.create_task(self.client.run())
+        await self.client.connected.wait()
+        if self.client.retries >= self.client.max_retries:
+            logging.info(f"Failed to connect to MobiFlight for CDU {self.cdu_index}")
+            self.close_memory_map()
+            return
+
         try:
             while self._running:
-                await self.process_memory_map()
-                await asyncio.sleep(0.1)  # Update 10 times per second
+                changed = await self.process_memory_map()
+                await self.schedule.sleep(changed, self.powered)
         except asyncio.CancelledError:
             logging.info(f"CDU {self.cdu_index} client was cancelled")
         except Exception as e:
             logging.error(f"Error in run loop for CDU {self.cdu_index}: {e}")
         finally:
+            client_task.cancel()
             await self.client.close()
-            if self.memory_map:
-                self.memory_map.close()
-                self.memory_map = None
+            logging.debug(f"CDU {self.cdu_index}: {self.frames} frames sent, {self.unchanged} unchanged reads skipped")
+            logging.debug(self.schedule.summary())
+            self.close_memory_map()
 
     def stop(self) -> None:
         self._running = False
@@ -1,15 +1,16 @@
 import asyncio
 import ctypes
-import json
 import logging
-import struct
 from ctypes import wintypes, Structure, c_ubyte, sizeof
 from pathlib import Path
 from typing import Any
 
-import websockets.asyncio.client as ws_client
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, shared_client
 
 
 CAPTAIN_MCDU_URL = "ws://localhost:8320/winwing/cdu-captain"
@@ -99,7 +100,7 @@ def ascii_preview(data: bytes, limit: int = 120) -> str:
 
 class SimConnectMobiFlight(SimConnect):
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
 
         if library_path:
             super().__init__(auto_connect, library_path)
@@ -112,13 +113,11 @@ class SimConnectMobiFlight(SimConnect):
             SIMCONNECT_CLIENT_DATA_ID,
         ]
 
-    def register_client_data_handler(self, handler):
-        if handler not in self.client_data_handlers:
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         if not pData:
@@ -136,11 +135,10 @@ class SimConnectMobiFlight(SimConnect):
                     pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)
                 ).contents
 
-                for handler in self.client_data_handlers:
-                    try:
-                        handler(client_data)
-                    except Exception as exc:
-                        logging.error("Client data handler failed: %s", exc)
+                try:
+                    self.client_data_handlers.dispatch(client_data)
+                except Exception as exc:
+                    logging.error("Client data handler failed: %s", exc)
             except Exception as exc:
                 logging.error("CLIENT_DATA dispatch failed: %s", exc)
             return
@@ -166,105 +164,29 @@ class SimConnectMobiFlight(SimConnect):
             pass
 
 
-class MobiFlightClient:
-    def __init__(self, uri: str, max_retries: int = 5):
-        self.uri = uri
-        self.max_retries = max_retries
-        self.retries = 0
-        self.connected = asyncio.Event()
-        self.websocket = None
-        self.last_data = None
-
-    async def run(self):
-        while self.retries < self.max_retries:
-            try:
-                logging.info("Connecting to %s", self.uri)
-                self.websocket = await ws_client.connect(self.uri, ping_interval=None)
-
-                await self.websocket.send(
-                    json.dumps({"Target": "Font", "Data": "AirbusThales"})
-                )
-                logging.info("Setting font: AirbusThales")
-
-                self.connected.set()
-
-                if self.last_data:
-                    await self.websocket.send(self.last_data)
-
-                async for _ in self.websocket:
-                    pass
-
-            except Exception as exc:
-                self.retries += 1
-                logging.warning(
-                    "WebSocket failure: %s (%s/%s)",
-                    exc,
-                    self.retries,
-                    self.max_retries,
-                )
-                self.websocket = None
-                self.connected.clear()
-                await asyncio.sleep(3)
-
-        logging.error("Max retries reached. Could not connect to %s", self.uri)
-        self.connected.set()
-
-    async def send(self, data: str):
-        self.last_data = data
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self):
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
+MCDU_LAYOUT = GridLayout(
+    stride=MCDU_CHAR_SIZE,  # row-major MCDUChar array
+    glyph=MCDUChar.Symbol.offset,
+    colour=MCDUChar.Color.offset,
+    flags=MCDUChar.Flags.offset,
+    colours=MCDU_COLOR_MAP,
+    flag_roles={MCDU_FLAG_SMALL_FONT: SMALL},
+    glyphs=SPECIAL_CHARS,
+)
+MCDU_DECODER = GridDecoder(MCDU_LAYOUT)
 
 
+@cached_frames()
 def create_mobi_json(data: bytes) -> str:
-    out = {"Target": "Display", "Data": [[] for _ in range(MCDU_CHARS)]}
-
-    for row in range(MCDU_ROWS):
-        for col in range(MCDU_COLUMNS):
-            display_idx = row * MCDU_COLUMNS + col
-            buf_idx = display_idx * MCDU_CHAR_SIZE  # stride=3, offset=0
-
-            if buf_idx + 2 >= len(data):
-                continue
-
-            try:
-                sym = chr(data[buf_idx])
-                colr = data[buf_idx + 1]
-                flg = data[buf_idx + 2]
-
-                if sym in (" ", "\0"):
-                    continue
-
-                sym = SPECIAL_CHARS.get(sym, sym)
-
-                out["Data"][display_idx] = [
-                    sym,
-                    MCDU_COLOR_MAP.get(colr, "w"),
-                    int(bool(flg & MCDU_FLAG_SMALL_FONT)),
-                ]
-            except Exception as exc:
-                logging.warning(
-                    "Display conversion warning row=%s col=%s: %s",
-                    row,
-                    col,
-                    exc,
-                )
-
-    return json.dumps(out)
+    return MCDU_DECODER.to_json(data)
 
 
 class A300MCDUClient:
     def __init__(self, sc: SimConnectMobiFlight, uri: str):
         self.sc = sc
         self.uri = uri
-        self.mobiflight = MobiFlightClient(uri)
-        self.loop = None
-        self.last_raw = None
+        self.mobiflight = shared_client(uri, font="AirbusThales", max_retries=5, retry_delay=3, font_delay=0, frame_interval=FRAME_INTERVAL)
+        self.screen = ClientDataBuffer(MCDU_DATA_SIZE)
         self.last_preview = None
         self.registered = False
 
@@ -278,14 +200,7 @@ class A300MCDUClient:
         )
         logging.info("MapClientDataNameToID(%s) -> %s", A300_MCDU_STREAM_NAME, hr)
 
-        hr = self.sc.dll.AddToClientDataDefinition(
-            h,
-            DEFINITION_ID,
-            0,
-            MCDU_DATA_SIZE,
-            0,
-            0,
-        )
+        hr = add_client_data_definition(self.sc, DEFINITION_ID, 0, MCDU_DATA_SIZE)
         logging.info(
             "AddToClientDataDefinition(def=%s, size=%s) -> %s",
             DEFINITION_ID,
@@ -313,34 +228,23 @@ class A300MCDUClient:
         )
 
         if not self.registered:
-            self.sc.register_client_data_handler(self.on_data)
+            self.sc.register_client_data_handler(DEFINITION_ID, self.on_data)
             self.registered = True
 
     def on_data(self, d: Any):
         try:
-            define_id = getattr(d, "dwDefineID", None)
-            request_id = getattr(d, "dwRequestID", None)
-
-            if define_id != DEFINITION_ID or request_id != REQUEST_ID:
+            if getattr(d, "dwRequestID", None) != REQUEST_ID:
                 return
 
-            raw_words = list(d.dwData[:MCDU_DWORDS])
-            packed = b"".join(struct.pack("I", x) for x in raw_words)
-
-            if len(packed) < MCDU_DATA_SIZE:
+            if not self.screen.update(d):
                 return
 
-            payload = packed[:MCDU_DATA_SIZE]
-
-            if payload == self.last_raw:
-                return
-
-            self.last_raw = payload
+            payload = self.screen.data
 
             preview = ascii_preview(payload)
             if preview != self.last_preview:
                 self.last_preview = preview
-                non_zero = sum(1 for b in payload if b != 0)
+                non_zero = len(payload) - payload.count(0)
                 logging.info(
                     "MCDU update | non_zero=%s/%s | preview=%s",
                     non_zero,
@@ -348,20 +252,12 @@ class A300MCDUClient:
                     preview,
                 )
 
-            json_data = create_mobi_json(payload)
-
-            if self.loop:
-                asyncio.run_coroutine_threadsafe(
-                    self.mobiflight.send(json_data),
-                    self.loop,
-                )
+            self.mobiflight.post_threadsafe(bytes(payload), create_mobi_json)
 
         except Exception as exc:
             logging.error("on_data failed: %s", exc)
 
     async def run(self):
-        self.loop = asyncio.get_running_loop()
-
         ws_task = asyncio.create_task(self.mobiflight.run())
         await self.mobiflight.connected.wait()
 
@@ -376,29 +272,32 @@ class A300MCDUClient:
             await ws_task
         finally:
             if self.registered:
-                self.sc.unregister_client_data_handler(self.on_data)
+                self.sc.unregister_client_data_handler(DEFINITION_ID, self.on_data)
+                cancel_client_data_request(self.sc, CLIENT_DATA_ID, REQUEST_ID, DEFINITION_ID)
             await self.mobiflight.close()
 
 
-if __name__ == "__main__":
-    setup_logging()
-    logging.info("A300 WinWing CDU bridge starting")
+def close_simconnect(sc: SimConnectMobiFlight) -> None:
+    try:
+        sc.exit()
+    except Exception:
+        pass
+    logging.info("SIM CLOSED")
 
-    sc = SimConnectMobiFlight()
-    logging.info("SIM OPEN")
 
-    client = A300MCDUClient(sc, CAPTAIN_MCDU_URL)
+async def main():
+    with warm_simconnect(SimConnectMobiFlight, close_simconnect) as sc:
+        logging.info("SIM OPEN")
 
-    async def main():
+        client = A300MCDUClient(sc, CAPTAIN_MCDU_URL)
         await client.run()
 
+
+if __name__ == "__main__":
+    setup_logging()
+    logging.info("A300 WinWing CDU bridge starting")
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Interrupted by user")
-    finally:
-        try:
-            sc.exit()
-        except Exception:
-            pass
-        logging.info("SIM CLOSED")
\ No newline at end of file
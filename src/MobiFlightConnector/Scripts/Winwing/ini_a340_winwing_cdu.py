@@ -1,9 +1,12 @@
-import asyncio, ctypes, json, logging, os, struct
+import asyncio, ctypes, logging, os
 from ctypes import wintypes, Structure, c_ubyte, sizeof
 from typing import Any
-import websockets.asyncio.client as ws_client
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, shared_client
 
 # --- Config ---
 CAPTAIN_MCDU_URL = "ws://localhost:8320/winwing/cdu-captain"
@@ -29,79 +32,32 @@ A340_MCDU_CPT_DEFINITION, A340_MCDU_FO_DEFINITION = 0, 1
 # --- SimConnect Wrapper ---
 class SimConnectMobiFlight(SimConnect):
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         super().__init__(auto_connect, library_path) if library_path else super().__init__(auto_connect)
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
-    def register_client_data_handler(self, h): 
-        if h not in self.client_data_handlers: self.client_data_handlers.append(h)
+    def register_client_data_handler(self, define_id, h):
+        self.client_data_handlers.register(define_id, h)
 
-    def unregister_client_data_handler(self, h): 
-        if h in self.client_data_handlers: self.client_data_handlers.remove(h)
+    def unregister_client_data_handler(self, define_id, h):
+        self.client_data_handlers.unregister(define_id, h)
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         if not pData: return
         if pData.contents.dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 
-# --- MobiFlight WebSocket Client ---
-class MobiFlightClient:
-    def __init__(self, uri:str, max_retries=3):
-        self.uri, self.max_retries, self.retries = uri, max_retries, 0
-        self.connected, self.websocket = asyncio.Event(), None
-        self._was_connected, self.last_data = False, None
-
-    async def run(self):
-        while self.retries < self.max_retries:
-            try:
-                logging.info(f"Connecting to {self.uri}")
-                self.websocket = await ws_client.connect(self.uri, ping_interval=None)                
-                await self.websocket.send(json.dumps({"Target":"Font","Data":"AirbusThales"}))
-                logging.info(f"Setting font: AirbusThales")
-                await asyncio.sleep(1) # wait a second for font to be set
-                self.connected.set()
-                if self._was_connected and self.last_data: await self.send(self.last_data)
-                self._was_connected, self.retries = True, 0
-                async for _ in self.websocket: pass
-            except Exception as e:
-                self.retries += 1               
-                logging.info(f"WebSocket failure: {e} ({self.retries}/{self.max_retries})")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)     
-        logging.info("Max retries reached. Giving up connecting to MobiFlight at %s. If you only have one CDU attached, you can ignore this message.", self.uri)
-        self.connected.set()
-        
-    async def send(self, data:str):
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-            self.last_data = data
-            
-    async def close(self):
-        if self.websocket: 
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
 # --- Data Conversion ---
+MCDU_DECODER = GridDecoder(GridLayout(
+    stride=MCDU_CHAR_SIZE, glyph=MCDUChar.Symbol.offset, colour=MCDUChar.Color.offset, flags=MCDUChar.Flags.offset,
+    colours=MCDU_COLOR_MAP, flag_roles={MCDU_FLAG_SMALL_FONT: SMALL}, glyphs=special_chars))
+
+@cached_frames()
 def create_mobi_json(data:bytes)->str:
-    out = {"Target":"Display","Data":[[] for _ in range(MCDU_CHARS)]}
-    
-    for i in range(MCDU_CHARS):
-        idx = (i//MCDU_ROWS*MCDU_ROWS + i%MCDU_ROWS)*MCDU_CHAR_SIZE
-        if idx+2 >= len(data): continue
-        try:
-            sym, col, flg = chr(data[idx]), data[idx+1], data[idx+2]
-            if sym in (" ","\0"): continue
-            sym = special_chars.get(sym, sym)
-            out["Data"][i] = [sym, MCDU_COLOR_MAP.get(col,"w"), int(bool(flg&MCDU_FLAG_SMALL_FONT))]
-        except Exception as e:  
-            logging.error(f"Error processing character at index {i}: {e}")
-    return json.dumps(out)
+    return MCDU_DECODER.to_json(data)
 
 # --- MCDU Client ---
 class A340MCDUClient:
@@ -111,7 +67,7 @@ class A340MCDUClient:
         self.def_id = def_id
         self.CA_NAME = client_area_name
         self.CA_ID = client_area_id
-        self.mobiflight, self.last_data, self.loop = MobiFlightClient(uri), None, None
+        self.mobiflight, self.screen = shared_client(uri, font="AirbusThales", reset_retries_on_connect=True, frame_interval=FRAME_INTERVAL), ClientDataBuffer(MCDU_DATA_SIZE)
         logging.info(f"Connecting to {self.uri}")
 
     def setup(self):
@@ -119,53 +75,46 @@ class A340MCDUClient:
             sc = self.sc
             h = sc.hSimConnect
             sc.dll.MapClientDataNameToID(h, self.CA_NAME.encode(), self.CA_ID)
-            sc.dll.AddToClientDataDefinition(h, self.def_id, 0, MCDU_DATA_SIZE, 0, 0)
+            add_client_data_definition(sc, self.def_id, 0, MCDU_DATA_SIZE)
             sc.dll.RequestClientData(h, self.CA_ID, self.def_id, self.def_id,
                 Enum.SIMCONNECT_CLIENT_DATA_PERIOD.SIMCONNECT_CLIENT_DATA_PERIOD_VISUAL_FRAME,
                 Enum.SIMCONNECT_CLIENT_DATA_REQUEST_FLAG.SIMCONNECT_CLIENT_DATA_REQUEST_FLAG_CHANGED,0,0,0)
-            sc.register_client_data_handler(self.on_data)
+            sc.register_client_data_handler(self.def_id, self.on_data)
             return True
         except Exception as e: 
             logging.error(f"SimConnect setup failed: {e}")
             return False
 
     def on_data(self, d:Any):
-        if d.dwDefineID!=self.def_id or not hasattr(d,"dwData"): return
-        count=int(MCDU_DATA_SIZE/4)
-        try: data=struct.pack(f"{count}I",*d.dwData[:count])
-        except: data=b"".join(struct.pack("I",x) for x in d.dwData[:count])
-        if data==self.last_data: return
-        self.last_data=data
-        json_data=create_mobi_json(data)
-        asyncio.run_coroutine_threadsafe(self.mobiflight.send(json_data), self.loop)
+        if not self.screen.update(d): return
+        self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
 
     async def run(self):
         try:
-            self.loop=asyncio.get_running_loop()
             task_ws=asyncio.create_task(self.mobiflight.run())
             await self.mobiflight.connected.wait()
             if self.mobiflight.retries>=self.mobiflight.max_retries: return
             if not self.setup(): return
             await asyncio.gather(task_ws)
         finally:
+            self.sc.unregister_client_data_handler(self.def_id, self.on_data)
+            cancel_client_data_request(self.sc, self.CA_ID, self.def_id, self.def_id)
             await self.mobiflight.close()
             
 # --- Main ---
+async def main():
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc:
+        mcdu_cpt=A340MCDUClient(sc, CAPTAIN_MCDU_URL, A340_MCDU_CPT_DEFINITION, A340_MCDU_CPT_NAME, A340_CPT_MCDU_CLIENT_DATA_ID)
+        mcdu_fo=A340MCDUClient(sc, FO_MCDU_URL, A340_MCDU_FO_DEFINITION, A340_MCDU_FO_NAME, A340_FO_MCDU_CLIENT_DATA_ID)
+        await asyncio.gather(
+            mcdu_cpt.run(),
+            mcdu_fo.run()
+        )
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=os.environ.get("LOGLEVEL", "WARNING").upper(),
         format='%(levelname)s:%(message)s'
     )
-    sc=SimConnectMobiFlight()
-
-    mcdu_cpt=A340MCDUClient(sc, CAPTAIN_MCDU_URL, A340_MCDU_CPT_DEFINITION, A340_MCDU_CPT_NAME, A340_CPT_MCDU_CLIENT_DATA_ID)
-    mcdu_fo=A340MCDUClient(sc, FO_MCDU_URL, A340_MCDU_FO_DEFINITION, A340_MCDU_FO_NAME, A340_FO_MCDU_CLIENT_DATA_ID)
-
-    async def main(): 
-        await asyncio.gather(
-            mcdu_cpt.run(),
-            mcdu_fo.run()
-        )
     try: asyncio.run(main())
     except KeyboardInterrupt: pass
-    finally: sc.exit()
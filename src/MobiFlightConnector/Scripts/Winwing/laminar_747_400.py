@@ -10,13 +10,13 @@ Each enum member is assigned a value that is used to construct the X-Plane datar
 Upon script start, MobiFlight is probed (get_available_devices()) to detect the devices connected to the PC. Any device that returns a successful response is then tracked.
 
 Two tasks are started independently for each available CDU device.
-1. handle_dataref_updates -> Listens to X-Plane's WebSocket server for dataref updates for that specific CDU and pushes an event to a queue
-2. handle_device_update   -> Listens to the queue and dispatches updates to MobiFlight to update that CDU
+1. handle_dataref_updates -> Receives that CDU's dataref updates from the script's single X-Plane WebSocket subscription (XPLANE) and stores them in that CDU's DatarefStore, which only decodes values that changed
+2. handle_device_update   -> Takes the latest values at most once per interval and dispatches them to MobiFlight to update that CDU
 
 Tasks are started independently for each CDU device to ensure each device can update quickly, particularly when players might be performing shared cockpit flights.
 
-Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function uses `async for` with the websockets client. The failed message is put back in the queue, the loop continues to the next iteration which then reconnects again.
-The failed message is picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
+Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function uses `async for` with the websockets client. The values are marked for sending again (store.retry()), the loop continues to the next iteration which then reconnects again.
+The latest values are picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
 """
 
 import asyncio
@@ -24,11 +24,17 @@ import base64
 import json
 import logging
 import os
-import urllib.request
 from enum import StrEnum
 
 import websockets
 
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.latest_state import DatarefStore
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.transport import frame_sent
+from mobiflight_cdu.xplane_datarefs import DatarefIds
+from mobiflight_cdu.xplane_subscription import DatarefSubscription
+
 CDU_COLUMNS = 24
 CDU_ROWS = 14
 CDU_CELLS = CDU_COLUMNS * CDU_ROWS
@@ -36,7 +42,6 @@ CDU_CELLS = CDU_COLUMNS * CDU_ROWS
 WEBSOCKET_HOST = "localhost"
 WEBSOCKET_PORT = 8320
 
-BASE_REST_URL = "http://localhost:8086/api/v2/datarefs"
 BASE_WEBSOCKET_URI = f"ws://{WEBSOCKET_HOST}:8086/api/v2"
 
 WS_CAPTAIN = f"ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}/winwing/cdu-captain"
@@ -78,21 +83,15 @@ class CduDevice(StrEnum):
         return f"laminar/B747/{self}/Line{line+1:02d}_S"
 
 
-def fetch_dataref_mapping(device: CduDevice):
-    with urllib.request.urlopen(BASE_REST_URL, timeout=5) as response:
-        response_json = json.load(response)
+def is_device_dataref(device: CduDevice, name: str) -> bool:
+    return device.get_dataref_prefix() in name
 
-        return dict(
-            map(
-                lambda dataref: (int(dataref["id"]), str(dataref["name"])),
-                filter(
-                    lambda x: device.get_dataref_prefix() in str(x["name"]),
-                    response_json["data"],
-                ),
-            )
-        )
+
+DATAREFS = DatarefIds("laminar_747_400", lambda name: any(is_device_dataref(device, name) for device in CduDevice))
+XPLANE = DatarefSubscription(BASE_WEBSOCKET_URI, DATAREFS)
 
 
+@cached_frames()
 def generate_display_json(device: CduDevice, values: dict[str, str | bytes]):
     display_data = [[] for _ in range(CDU_CELLS)]
 
@@ -129,91 +128,41 @@ def generate_display_json(device: CduDevice, values: dict[str, str | bytes]):
     return json.dumps({"Target": "Display", "Data": display_data})
 
 
-async def handle_device_update(queue: asyncio.Queue, device: CduDevice):
+async def handle_device_update(store: DatarefStore, device: CduDevice):
     """
     Translates and sends dataref updates to MobiFlight.
     """
-    last_run_time = 0
-    rate_limit_time = 0.1
-
     endpoint = device.get_endpoint()
     logging.info("Connecting to CDU device %s", device)
+    patcher = DisplayPatcher()
     async for websocket in websockets.connect(endpoint):
+        patcher.reset()
         logging.info("Connected successfully to CDU device %s", device)
         while True:
-            values = await queue.get()
+            await store.take()
 
             try:
-                elapsed = asyncio.get_running_loop().time() - last_run_time
-
-                # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
-                # This rate limits the number of active websocket requests to MobiFlight.
-                # The delay should not be noticeable unless a user heavily spams page changes, but it should be enough that too many messages won't be pushed at once.
-                if elapsed < rate_limit_time:
-                    await asyncio.sleep(rate_limit_time - elapsed)
-
-                display_json = generate_display_json(device, values)
-                await websocket.send(display_json)
-                last_run_time = asyncio.get_running_loop().time()
+                display_json = generate_display_json(device, store.values)
+                payload = patcher.encode(display_json)
+                if payload is not None:
+                    await websocket.send(payload)
+                    frame_sent()
 
             except websockets.exceptions.ConnectionClosed:
                 logging.error(
                     "MobiFlight websocket connection was closed... Attempting to reconnect"
                 )
-                await queue.put(values)
+                store.retry()
                 break
 
 
-async def handle_dataref_updates(queue: asyncio.Queue, device: CduDevice):
-    last_known_values = {}
+def decode_dataref(dataref_name: str, value: str) -> str:
+    return base64.b64decode(value).decode(errors='replace').replace("\x00", " ")
 
-    dataref_map = fetch_dataref_mapping(device)
-    logging.info("Connecting to X-Plane websocket server")
-    async for websocket in websockets.connect(BASE_WEBSOCKET_URI):
-        logging.info("Connected successfully to X-Plane websocket server")
-        try:
-            await websocket.send(
-                json.dumps(
-                    {
-                        "type": "dataref_subscribe_values",
-                        "req_id": 1,
-                        "params": {
-                            "datarefs": [
-                                {"id": id_value} for id_value in dataref_map.keys()
-                            ]
-                        },
-                    }
-                )
-            )
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
 
-                if "data" not in data:
-                    continue
-
-                new_values = dict(last_known_values)
-
-                for dataref_id, value in data["data"].items():
-                    dataref_id = int(dataref_id)
-                    if dataref_id not in dataref_map:
-                        continue
-
-                    dataref_name = dataref_map[dataref_id]
-
-                    new_values[dataref_name] = base64.b64decode(value).decode(errors='replace').replace("\x00", " ")
- 
-
-                if new_values == last_known_values:
-                    continue
-
-                last_known_values = new_values
-                await queue.put(new_values)
-        except websockets.exceptions.ConnectionClosed:
-            logging.error(
-                "X-Plane websocket connection was closed... Attempting to reconnect"
-            )
-            continue
+async def handle_dataref_updates(store: DatarefStore, device: CduDevice):
+    async for changes in XPLANE.updates(lambda name: is_device_dataref(device, name)):
+        store.update(changes)
 
 
 async def get_available_devices() -> list[CduDevice]:
@@ -254,10 +203,12 @@ async def main():
     tasks = []
 
     for device in available_devices:
-        queue = asyncio.Queue()
+        # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
+        # The values are therefore rendered at most once per interval; changes arriving in between replace each other instead of queueing up.
+        store = DatarefStore(0.1, f"CDU {device}", decode_dataref)
 
-        tasks.append(asyncio.create_task(handle_dataref_updates(queue, device)))
-        tasks.append(asyncio.create_task(handle_device_update(queue, device)))
+        tasks.append(asyncio.create_task(handle_dataref_updates(store, device)))
+        tasks.append(asyncio.create_task(handle_device_update(store, device)))
 
     logging.info("Started background tasks for %s", available_devices)
 
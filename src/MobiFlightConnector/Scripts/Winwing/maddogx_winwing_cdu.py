@@ -1,20 +1,21 @@
 from ctypes import wintypes
 import ctypes
-import json
 import logging
 import asyncio
 import os
-import struct
-import websockets.asyncio.client as ws_client
-from typing import Optional, List, Dict, Union, Any
+from typing import Dict, Any
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, MobiFlightClient, shared_client
 
 
 class SimConnectMobiFlight(SimConnect):
 
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -23,24 +24,19 @@ class SimConnectMobiFlight(SimConnect):
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
 
-    def register_client_data_handler(self, handler):
-        if not handler in self.client_data_handlers:
-            logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         dwID = pData.contents.dwID
         if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 # URLs
@@ -97,111 +93,64 @@ MDX_CDU_1_NAME: str = "MaddogX CDU2 Data Atrb"
 MDX_CDU_1_ID: int = 86
 MDX_CDU_1_DEFINITION: int = 801
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(self.websocket_uri, ping_interval=None)
-                    logging.info("MobiFlight connected at %s", self.websocket_uri)
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e: 
-                self.retries += 1
-                logging.info(f"WebSocket error: {e} with retries {self.retries}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.info("Max retries reached. Giving up connecting to MobiFlight at %s", self.websocket_uri)
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
+# Glyphs and attributes are stored as two row-major arrays
+CDU_GLYPHS: Dict[str, str] = {
+    '{': "[",
+    '}': "]",
+    '[': "\u2610"  # box
+}
+CDU_LAYOUT_CM: GridLayout = GridLayout(
+    stride=1,
+    offset=CDU_DATA_OFFSET,
+    glyph=0,
+    colour=CDU_ATRB_OFFSET - CDU_DATA_OFFSET,
+    flags=CDU_ATRB_OFFSET - CDU_DATA_OFFSET,
+    colours={
+        CDU_COLOR_WHITE: "w",
+        CDU_COLOR_AMBER: "a",
+        CDU_COLOR_CYAN: "c",
+        CDU_COLOR_GREEN: "g",
+        CDU_COLOR_MAGENTA: "m",
+        CDU_COLOR_RED: "r",
+    },
+    colour_mask=CDU_COLOR_MASK,
+    flag_roles={CDU_FLAG_SMALL_FONT: SMALL},
+    glyphs=CDU_GLYPHS
+)
+# The Honeywell CDU is monochrome green and uses '$' and '!' for degrees and down arrow
+CDU_LAYOUT_HW: GridLayout = GridLayout(
+    stride=1,
+    offset=CDU_DATA_OFFSET,
+    glyph=0,
+    flags=CDU_ATRB_OFFSET - CDU_DATA_OFFSET,
+    default_colour="g",
+    flag_roles={CDU_FLAG_SMALL_FONT: SMALL},
+    glyphs={
+        **CDU_GLYPHS,
+        '$': "\u00B0",  # degrees
+        '!': "\u2193"   # down arrow
+    }
+)
+CDU_DECODERS: Dict[int, GridDecoder] = {
+    CDU_TYPE_HW: GridDecoder(CDU_LAYOUT_HW),
+    CDU_TYPE_CM: GridDecoder(CDU_LAYOUT_CM)
+}
 
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
 
+@cached_frames()
 def create_mobi_json(data: bytes) -> str:
-    message: Dict[str, Union[str, List[List[Union[str, int]]]]] = {
-        "Target": "Display",
-        "Data": [[] for _ in range(CDU_CELLS)]
-    }
-    
     # 0 = Honeywell, 1 = Canadian
     cdutype = data[CDU_TYPE_OFFSET]
-    
-    # Process data in row-major order as received from MaddogX
-    for y in range(CDU_ROWS):
-        for x in range(CDU_COLUMNS):
-            src_idx: int = y * CDU_COLUMNS + x + CDU_DATA_OFFSET
-            src_iax: int = y * CDU_COLUMNS + x + CDU_ATRB_OFFSET
-            dst_idx: int = y * CDU_COLUMNS + x
-            
-            if src_idx >= CDU_ATRB_OFFSET or src_iax >= len(data):
-                message["Data"][dst_idx] = []
-                continue
-                
-            try:
-                symbol: str = chr(data[src_idx])
-                color: int = data[src_iax] & CDU_COLOR_MASK
-                flags: int = data[src_iax] & CDU_FLAG_MASK
-
-                if symbol == ' ' or symbol == '\0':
-                    message["Data"][dst_idx] = []
-                else:
-                    # Handle special characters
-                    if symbol == '{': symbol = "["
-                    elif symbol == '}': symbol = "]"
-                    elif symbol == '[': symbol = "\u2610"                   # box
-                    elif cdutype == CDU_TYPE_HW and symbol == '$': symbol = "\u00B0"  # degrees
-                    elif cdutype == CDU_TYPE_HW and symbol == '!': symbol = "\u2193"  # down arrow
-                    
-                    # Handle color
-                    if cdutype == CDU_TYPE_HW:
-                        color_str: str = "g" # always green
-                    #elif flags & CDU_FLAG_REVERSE:
-                    #    color_str = "e"  # Gray for reverse video
-                    else:
-                        color_str = {
-                            CDU_COLOR_WHITE: "w",
-                            CDU_COLOR_AMBER: "a",
-                            CDU_COLOR_CYAN: "c",
-                            CDU_COLOR_GREEN: "g",
-                            CDU_COLOR_MAGENTA: "m",
-                            CDU_COLOR_RED: "r",
-                        }.get(color, "w")
-
-                    message["Data"][dst_idx] = [
-                        symbol,
-                        color_str,
-                        1 if (flags & CDU_FLAG_SMALL_FONT) else 0
-                    ]
-            except (ValueError, TypeError, IndexError) as e:
-                message["Data"][dst_idx] = []
-                logging.debug(f"Error processing cell: {e}")
-    
-    return json.dumps(message)
+    return CDU_DECODERS.get(cdutype, CDU_DECODERS[CDU_TYPE_CM]).to_json(data)
 
 class MDXCDUClient:
     def __init__(self, sc_mobiflight: SimConnectMobiFlight, websocket_uri: str, cdu_name: str, cdu_id: int, cdu_definition: int) -> None:
         self.sc_mobiflight: SimConnectMobiFlight = sc_mobiflight
-        self.mobiflight: MobiFlightClient = MobiFlightClient(websocket_uri)
-        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mobiflight: MobiFlightClient = shared_client(websocket_uri, frame_interval=FRAME_INTERVAL)
         self.cdu_definition: int = cdu_definition
         self.cdu_name: str = cdu_name
         self.cdu_id: int = cdu_id
+        self.screen: ClientDataBuffer = ClientDataBuffer(CDU_SC_DATA_SIZE)
 
     def failed_to_connect(self) -> bool:
         return self.mobiflight.retries >= self.mobiflight.max_retries
@@ -215,14 +164,7 @@ class MDXCDUClient:
                 self.cdu_id
             )
 
-            self.sc_mobiflight.dll.AddToClientDataDefinition(
-                self.sc_mobiflight.hSimConnect,
-                self.cdu_definition,
-                0,
-                CDU_SC_DATA_SIZE,
-                0,
-                0
-            )
+            add_client_data_definition(self.sc_mobiflight, self.cdu_definition, 0, CDU_SC_DATA_SIZE)
 
             # Request data updates
             self.sc_mobiflight.dll.RequestClientData(
@@ -236,7 +178,7 @@ class MDXCDUClient:
             )
 
             # Set up the handler
-            self.sc_mobiflight.register_client_data_handler(self.handle_cdu_data)
+            self.sc_mobiflight.register_client_data_handler(self.cdu_definition, self.handle_cdu_data)
             logging.info("SimConnect initialized for %s", self.cdu_name)
             return True
         except Exception as e:
@@ -245,20 +187,13 @@ class MDXCDUClient:
         
     def handle_cdu_data(self, client_data: Any) -> None:
         try:
-            if client_data.dwDefineID == self.cdu_definition and hasattr(client_data, 'dwData'):                
-                int_count : int = int(CDU_SC_DATA_SIZE/ 4)              
-                if len(client_data.dwData) >= int_count:
-                    data_list : bytearray = bytearray()                  
-                    for i in range(int_count): 
-                        my_bytes : bytes = struct.pack("I", client_data.dwData[i])
-                        data_list.extend(my_bytes)                
-                    data: bytes = bytes(data_list)                                       
-                    asyncio.run_coroutine_threadsafe(self.mobiflight.send(create_mobi_json(data)), self.event_loop)
+            # Skip frames that did not change the screen
+            if self.screen.update(client_data):
+                self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
         except Exception as e:
             logging.error(f"Error handling CDU data: {e}")
 
     async def run(self) -> None:
-        self.event_loop = asyncio.get_running_loop()
         logging.info("Starting CDU client")
         
         try:
@@ -278,29 +213,32 @@ class MDXCDUClient:
         except Exception as e:
             logging.error(f"Error: {e}")
         finally:
+            self.sc_mobiflight.unregister_client_data_handler(self.cdu_definition, self.handle_cdu_data)
+            cancel_client_data_request(self.sc_mobiflight, self.cdu_id, self.cdu_id, self.cdu_definition)
             await self.mobiflight.close()
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
-        format='%(levelname)s:%(message)s'
-    )
-    
-    sc_mobiflight: SimConnectMobiFlight = SimConnectMobiFlight()
-    captain_client: MDXCDUClient = MDXCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, MDX_CDU_0_NAME, MDX_CDU_0_ID, MDX_CDU_0_DEFINITION)
-    co_pilot_client: MDXCDUClient = MDXCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, MDX_CDU_1_NAME, MDX_CDU_1_ID, MDX_CDU_1_DEFINITION)
-    
-    async def run_clients():
+
+async def main() -> None:
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc_mobiflight:
+        captain_client: MDXCDUClient = MDXCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, MDX_CDU_0_NAME, MDX_CDU_0_ID, MDX_CDU_0_DEFINITION)
+        co_pilot_client: MDXCDUClient = MDXCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, MDX_CDU_1_NAME, MDX_CDU_1_ID, MDX_CDU_1_DEFINITION)
+
         await asyncio.gather(
             captain_client.run(), 
             co_pilot_client.run(),
             return_exceptions=True
         )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+
     try:
-        asyncio.run(run_clients())
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down")
     except Exception as e:
         logging.error(f"Error: {e}")
-    finally:
-        sc_mobiflight.exit()
@@ -19,8 +19,16 @@ Aircraft/Simulators:
 Architecture:
     - SimConnectMobiFlight extends SimConnect to register client data handlers.
     - MobiFlightVariableRequests manages LVAR subscriptions and value caching.
-    - McduSocket runs an asyncio websocket sender loop in a background thread.
-    - Two display threads render grids and send payloads to WinWing displays.
+      In bulk mode (used here) it subscribes the MobiFlight.LVars float area in
+      blocks of 128 variables instead of one request per variable.
+    - Everything but SimConnect runs on one asyncio event loop: both McduSocket
+      websocket senders and the two display renderers are tasks on it. The
+      SimConnect dispatch thread only hands variable changes over to the loop.
+    - Two display tasks render grids and send payloads to WinWing displays.
+    - main() also runs inside the resident CDU host (mobiflight_cdu.cdu_host),
+      which keeps the SimConnect connection warm between loads; on unload the
+      variable requests are stopped, their handlers unregistered and the loop
+      is no longer woken.
     - The cds_Swap LVAR can swap CDS/CPDS output between captain/copilot MCDUs.
       cds_Swap is a custom LVAR that needs to be explicitly set by User Custom code
       Recommended usage of MobiFlight Input Config with a Custom Preset Code "(L:cds_Swap) ! (>L:cds_Swap, Bool)"
@@ -28,7 +36,8 @@ Architecture:
 
 Displays:
     - CDS1 (captain side) and CPDS (copilot side) are rendered separately.
-    - Each display thread builds a grid and sends it at a fixed tick interval.
+    - Each display task re-renders only when a variable it read last time has
+      changed (at most every tick), plus a keepalive every few seconds.
     - The CDS swap LVAR (cds_Swap) can route CDS/CPDS output to the opposite
       MCDU, allowing quick display handover between captain and copilot units.
 """
@@ -39,7 +48,7 @@ import logging
 import logging.handlers
 import struct
 import ctypes
-from time import sleep
+from time import monotonic
 from typing import List, Union
 from itertools import chain
 import asyncio
@@ -47,6 +56,10 @@ import threading
 from websockets import connect
 from websockets.exceptions import WebSocketException as WsWebSocketException
 
+from mobiflight_cdu.client_data import ClientDataRoutes, add_client_data_definition, cancel_client_data_request, payload_view, warm_simconnect
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.transport import frame_sent
+
 # ========================= SimConnectMobiFlight =========================
 from SimConnect import SimConnect
 from SimConnect.Enum import (
@@ -54,7 +67,6 @@ from SimConnect.Enum import (
     SIMCONNECT_RECV_ID,
     SIMCONNECT_RECV_CLIENT_DATA,
     SIMCONNECT_CLIENT_DATA_PERIOD,
-    SIMCONNECT_UNUSED,
 )
 
 class SimConnectMobiFlight(SimConnect):
@@ -62,9 +74,10 @@ class SimConnectMobiFlight(SimConnect):
     Extends SimConnect to support MobiFlight client data handlers.
     This class allows registration and management of client data handlers,
     enabling custom processing of MobiFlight client data received from the simulator.
+    Each message goes to the handler registered for its definition ID.
     """
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -72,26 +85,31 @@ class SimConnectMobiFlight(SimConnect):
         # Fix missing types
         self.dll.MapClientDataNameToID.argtypes = [ctypes.wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
-    def register_client_data_handler(self, handler):
-        if handler not in self.client_data_handlers:
-            logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         dwID = pData.contents.dwID
         if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 
 # ========================= MobiFlightVariableRequests =========================
+LVARS_AREA_SIZE = 4096  # bytes of MobiFlight.LVars, one float per variable in the order added
+LVARS_BLOCK_SIZE = 512  # bytes per bulk definition (128 variables)
+LVARS_BLOCK_DEFINITION_ID = 0x1000  # definition/request ID of the first bulk block
+# Seconds get() waits for the first value of a variable it adds. In bulk mode a value
+# that stays 0 does not change the area, so this is kept short; later reads are live.
+LVAR_ADD_TIMEOUT = 0.5
+LVAR_BULK_ADD_TIMEOUT = 0.05
+# Seconds register_many() waits for all variables together
+LVAR_REGISTER_TIMEOUT = 2.0
+
 class SimVariable:
     """
     Represents a simulation variable used in MobiFlight variable requests.
@@ -101,12 +119,18 @@ class SimVariable:
         name (str): Name of the simulation variable.
         float_value (float, optional): The current value of the variable as a float.
         initialized (bool): Indicates whether the variable has been initialized.
+        ready (threading.Event): Set once the first value has arrived; in bulk
+            mode once the variable's block has updated, which does not tell
+            whether MobiFlight has written this variable yet.
+        missing (bool): Nothing arrived before the wait for it ran out.
     """
     def __init__(self, init_id, name, float_value=None):
         self.id = init_id
         self.name = name
         self.float_value = float_value
         self.initialized = False
+        self.ready = threading.Event()
+        self.missing = False
     def __str__(self):
         return f"Id={self.id}, value={self.float_value}, name={self.name}"
 
@@ -118,13 +142,51 @@ class MobiFlightVariableRequests:
     variable subscriptions, and callbacks for MobiFlight LVARs. It provides methods
     to add variable definitions, subscribe to data changes, and process incoming
     client data from the simulator.
+
+    With bulk=True the LVars area is subscribed in blocks of LVARS_BLOCK_SIZE
+    bytes, one definition and request per block, instead of one per variable.
+    Each block update is copied in one go into `lvar_area`, which
+    `lvar_values` views as a float per variable, so a frame in which many
+    variables change costs one SimConnect message and one callback.
+
+    `register_many()` adds a list of variables up front and waits on the event
+    loop for their first values together, instead of `get()` adding and
+    waiting for them one at a time.
+
+    `watch()` sets an asyncio.Event whenever one of the given variables
+    changes or gets its first value. The handlers run on the SimConnect
+    dispatch thread and hand the events over to the loop that called
+    `watch()`; a burst of changes costs one `call_soon_threadsafe`.
+
+    `snapshot()` copies the whole value table in one operation and returns it
+    as an `LvarSnapshot`, so a render reads all its variables from the same
+    instant without taking `_vr_lock` per read. The snapshot records the names
+    read from it, which a display passes to `watch()` to depend on exactly the
+    variables it reads. `get()` only locks to add a variable it has not seen;
+    with wait=False it does not wait for the first value either.
     """
-    def __init__(self, simConnect: SimConnectMobiFlight):
-        logging.info("MobiFlightVariableRequests __init__")
+    def __init__(self, simConnect: SimConnectMobiFlight, bulk: bool = False):
+        logging.info("MobiFlightVariableRequests __init__ bulk=%s", bulk)
         self.sm = simConnect
         self.sim_vars = {}
         self.sim_var_name_to_id = {}
         self._vr_lock = threading.Lock()
+        self.bulk = bulk
+        self.lvar_area = bytearray(LVARS_AREA_SIZE)
+        self.lvar_values = memoryview(self.lvar_area).cast("f")
+        self.lvar_updates = 0
+        self._lvar_blocks = set()
+        # Bulk mode: variables added that have not seen an update of their block yet
+        self._lvars_pending = []
+        self._pending_lock = threading.Lock()
+        # asyncio.Events to set when a variable changes, by variable id
+        self._watchers = {}
+        # Hand-off of events to set from the dispatch thread to the loop
+        self._loop = None
+        self._handoff_lock = threading.Lock()
+        self._woken = set()
+        self._wake_scheduled = False
+        self.wakeups = 0
         self.CLIENT_DATA_AREA_LVARS    = 0
         self.CLIENT_DATA_AREA_CMD      = 1
         self.CLIENT_DATA_AREA_RESPONSE = 2
@@ -133,19 +195,12 @@ class MobiFlightVariableRequests:
         self.DATA_STRING_SIZE = 256
         self.DATA_STRING_OFFSET = 0
         self.DATA_STRING_DEFINITION_ID = 0
-        self.sm.register_client_data_handler(self.client_data_callback_handler)
         self.initialize_client_data_areas()
 
     def add_to_client_data_definition(self, definition_id, offset, size):
         logging.info("add_to_client_data_definition definition_id=%s, offset=%s, size=%s", definition_id, offset, size)
-        self.sm.dll.AddToClientDataDefinition(
-            self.sm.hSimConnect,
-            definition_id,
-            offset,
-            size,
-            0,  # fEpsilon
-            SIMCONNECT_UNUSED,  # DatumId
-        )
+        # Skipped on a connection reused by the resident host, which already has it
+        add_client_data_definition(self.sm, definition_id, offset, size)
 
     def subscribe_to_data_change(self, data_area_id, request_id, definition_id):
         logging.info("subscribe_to_data_change data_area_id=%s, request_id=%s, definition_id=%s", data_area_id, request_id, definition_id)
@@ -201,54 +256,266 @@ class MobiFlightVariableRequests:
             float_data = struct.unpack('<f', data_bytes)[0]
             float_value = round(float_data, 5)
             sim_var = self.sim_vars[client_data.dwDefineID]
+            changed = float_value != sim_var.float_value or not sim_var.initialized
+            self.sim_vars[client_data.dwDefineID].float_value = float_value
+            # Keep the value table current for snapshot()
+            struct.pack_into("I", self.lvar_area, (sim_var.id - 1) * ctypes.sizeof(ctypes.wintypes.FLOAT), client_data.dwData[0])
+            self.lvar_updates += 1
             if not sim_var.initialized:
                 sim_var.initialized = True
-            self.sim_vars[client_data.dwDefineID].float_value = float_value
+                sim_var.ready.set()
+            if changed and sim_var.id in self._watchers:
+                self._wake(self._watchers[sim_var.id])
             logging.debug("client_data_callback_handler %s, raw=%s", sim_var, float_value)
         else:
             logging.warning("client_data_callback_handler DefinitionID %s not found!", client_data.dwDefineID)
 
-    def get(self, variableString: str):
+    def lvar_block_handler(self, client_data):
+        """Bulk mode: copy one block of the LVars area into the value table."""
+        offset = (client_data.dwDefineID - LVARS_BLOCK_DEFINITION_ID) * LVARS_BLOCK_SIZE
+        view = payload_view(client_data, LVARS_BLOCK_SIZE)
+        if view is None:
+            logging.warning("lvar_block_handler short payload for DefinitionID %s", client_data.dwDefineID)
+            return
+        events = self._changed_watchers(offset, view) if self._watchers else set()
+        self.lvar_area[offset:offset + LVARS_BLOCK_SIZE] = view
+        self.lvar_updates += 1
+        if self._lvars_pending:
+            # The block has updated; whether MobiFlight wrote a given variable
+            # in it cannot be told, so readiness is per block (see register_many)
+            block = client_data.dwDefineID - LVARS_BLOCK_DEFINITION_ID
+            with self._pending_lock:
+                pending = []
+                for sim_var in self._lvars_pending:
+                    if self._lvar_block(sim_var.id) == block:
+                        sim_var.initialized = True
+                        sim_var.ready.set()
+                        events.update(self._watchers.get(sim_var.id, ()))
+                    else:
+                        pending.append(sim_var)
+                self._lvars_pending = pending
+        if events:
+            self._wake(events)
+
+    def _changed_watchers(self, offset, view):
+        """Return the watchers of the variables whose slot in this block is about to change."""
+        size = ctypes.sizeof(ctypes.wintypes.FLOAT)
+        first = offset // size
+        events = set()
+        for var_id, watchers in list(self._watchers.items()):
+            slot = (var_id - 1 - first) * size
+            if 0 <= slot < LVARS_BLOCK_SIZE and view[slot:slot + size] != self.lvar_area[offset + slot:offset + slot + size]:
+                events.update(watchers)
+        return events
+
+    def _wake(self, events):
+        """Dispatch thread: have the loop set events, waking it once per batch."""
+        with self._handoff_lock:
+            self._woken.update(events)
+            if self._wake_scheduled or self._loop is None:
+                return
+            self._wake_scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._set_woken)
+        except RuntimeError as e:
+            # The loop has been closed on shutdown
+            logging.debug("MobiFlightVariableRequests wake-up dropped: %s", e)
+
+    def _set_woken(self):
+        with self._handoff_lock:
+            events, self._woken = self._woken, set()
+            self._wake_scheduled = False
+        self.wakeups += 1
+        for event in events:
+            event.set()
+
+    def watch(self, variableStrings, event: asyncio.Event):
+        """Set event whenever one of the (already added) variables changes. Call on the event loop."""
+        self._loop = asyncio.get_running_loop()
         with self._vr_lock:
-            if variableString not in self.sim_var_name_to_id:
-                # add new variable
-                var_id = len(self.sim_vars) + 1
-                self.sim_vars[var_id] = SimVariable(var_id, variableString)
-                self.sim_var_name_to_id[variableString] = var_id
-                # subscribe to variable data change
-                offset = (var_id - 1) * ctypes.sizeof(ctypes.wintypes.FLOAT)
-                self.add_to_client_data_definition(var_id, offset, ctypes.sizeof(ctypes.wintypes.FLOAT))
-                self.subscribe_to_data_change(self.CLIENT_DATA_AREA_LVARS, var_id, var_id)
-                self.send_command("MF.SimVars.Add." + variableString)
-            # determine id and return value
-            variable_id = self.sim_var_name_to_id[variableString]
-            sim_var = self.sim_vars[variable_id]
-            wait_counter = 0  # 10ms ticks, max ~500ms
-            # NOTE: SimConnect Python wrapper runs CallDispatch() in a background thread.
-            # The wait loop below relies on async callbacks and is safe.
-            while wait_counter < 50:  # wait max 500ms
-                if sim_var.float_value is None:
-                    sleep(0.01)  # wait 10ms
-                    wait_counter += 1
-                else:
+            for name in variableStrings:
+                var_id = self.sim_var_name_to_id.get(name)
+                if var_id is not None:
+                    self._watchers.setdefault(var_id, set()).add(event)
+
+    def unwatch(self, variableStrings, event: asyncio.Event):
+        with self._vr_lock:
+            for name in variableStrings:
+                events = self._watchers.get(self.sim_var_name_to_id.get(name))
+                if events is not None:
+                    events.discard(event)
+
+    def snapshot(self) -> "LvarSnapshot":
+        """Return the current values of all added variables, read without locking."""
+        # Copying the bytearray is one memcpy under the GIL, so it cannot
+        # interleave with a handler writing a block or a value
+        return LvarSnapshot(self, bytes(self.lvar_area), self.sim_var_name_to_id, self.lvar_updates)
+
+    @staticmethod
+    def _lvar_block(var_id):
+        return (var_id - 1) * ctypes.sizeof(ctypes.wintypes.FLOAT) // LVARS_BLOCK_SIZE
+
+    def _subscribe_lvar_block(self, var_id):
+        block = self._lvar_block(var_id)
+        if block in self._lvar_blocks:
+            return
+        definition_id = LVARS_BLOCK_DEFINITION_ID + block
+        self.add_to_client_data_definition(definition_id, block * LVARS_BLOCK_SIZE, LVARS_BLOCK_SIZE)
+        self.sm.register_client_data_handler(definition_id, self.lvar_block_handler)
+        self.subscribe_to_data_change(self.CLIENT_DATA_AREA_LVARS, definition_id, definition_id)
+        self._lvar_blocks.add(block)
+
+    def _add(self, variableString: str):
+        """Return the SimVariable for variableString, adding it first if new. Call with _vr_lock held."""
+        variable_id = self.sim_var_name_to_id.get(variableString)
+        if variable_id is not None:
+            return self.sim_vars[variable_id]
+        var_id = len(self.sim_vars) + 1
+        if self.bulk and var_id > len(self.lvar_values):
+            logging.error("add %s: the LVars area holds %s variables", variableString, len(self.lvar_values))
+            return None
+        sim_var = self.sim_vars[var_id] = SimVariable(var_id, variableString)
+        self.sim_var_name_to_id[variableString] = var_id
+        # subscribe to variable data change
+        if self.bulk:
+            with self._pending_lock:
+                self._lvars_pending.append(sim_var)
+            self._subscribe_lvar_block(var_id)
+        else:
+            offset = (var_id - 1) * ctypes.sizeof(ctypes.wintypes.FLOAT)
+            self.add_to_client_data_definition(var_id, offset, ctypes.sizeof(ctypes.wintypes.FLOAT))
+            self.sm.register_client_data_handler(var_id, self.client_data_callback_handler)
+            self.subscribe_to_data_change(self.CLIENT_DATA_AREA_LVARS, var_id, var_id)
+        self.send_command("MF.SimVars.Add." + variableString)
+        return sim_var
+
+    async def register_many(self, variableStrings, timeout: float = LVAR_REGISTER_TIMEOUT):
+        """
+        Add all variables up front, then wait until their first values have
+        arrived or timeout has passed. Returns the names of the variables that
+        did not arrive in time; reading them does not wait again.
+
+        In bulk mode an update only says that a block changed, not which of
+        its variables MobiFlight has written (one that reads 0 never changes
+        the block), so this waits for every block to update once and only
+        reports the blocks that did not; it returns no names.
+        """
+        with self._vr_lock:
+            sim_vars = [sim_var for sim_var in map(self._add, variableStrings) if sim_var is not None]
+        # The dispatch thread wakes this task through watch() as values arrive
+        names = [sim_var.name for sim_var in sim_vars]
+        arrived = asyncio.Event()
+        self.watch(names, arrived)
+        deadline = monotonic() + timeout
+        try:
+            while True:
+                arrived.clear()
+                remaining = deadline - monotonic()
+                if remaining <= 0 or all(sim_var.ready.is_set() for sim_var in sim_vars):
                     break
-            if sim_var.float_value is None and sim_var.initialized:
-                sim_var.float_value = 0.0
-            logging.debug("get %s. wait_counter=%s, Return=%s", variableString, wait_counter, sim_var.float_value)
-            return sim_var.float_value
+                try:
+                    await asyncio.wait_for(arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self.unwatch(names, arrived)
+        missing = [sim_var for sim_var in sim_vars if not sim_var.ready.is_set()]
+        for sim_var in missing:
+            sim_var.missing = True
+        if self.bulk:
+            blocks = sorted({self._lvar_block(sim_var.id) for sim_var in missing})
+            if blocks:
+                logging.warning("register_many: no update within %ss of LVars blocks %s; their variables read 0 until the block changes",
+                                timeout, ", ".join(map(str, blocks)))
+            else:
+                logging.info("register_many: %s variables added, their LVars blocks have updated", len(sim_vars))
+            return []
+        if missing:
+            logging.warning("register_many: no value within %ss for %s of %s variables: %s",
+                            timeout, len(missing), len(sim_vars), ", ".join(sim_var.name for sim_var in missing))
+        else:
+            logging.info("register_many: %s variables ready", len(sim_vars))
+        return [sim_var.name for sim_var in missing]
+
+    def get(self, variableString: str, wait: bool = True):
+        # Variables already added are looked up without the lock
+        var_id = self.sim_var_name_to_id.get(variableString)
+        sim_var = self.sim_vars.get(var_id) if var_id is not None else None
+        if sim_var is None:
+            with self._vr_lock:
+                sim_var = self._add(variableString)
+            if sim_var is None:
+                return None
+        if wait and not sim_var.ready.is_set() and not sim_var.missing:
+            # First read of a variable that was not registered up front
+            if not sim_var.ready.wait(LVAR_BULK_ADD_TIMEOUT if self.bulk else LVAR_ADD_TIMEOUT):
+                sim_var.missing = True
+        if self.bulk:
+            sim_var.float_value = round(self.lvar_values[sim_var.id - 1], 5)
+        return sim_var.float_value
 
     def set(self, variable_string):
         with self._vr_lock:
             logging.debug("set: %s", variable_string)
             self.send_command("MF.SimVars.Set." + variable_string)
 
+    def close(self):
+        """Stop the requests, unregister the handlers and stop waking the loop; the connection may be reused."""
+        with self._vr_lock:
+            for var_id in self.sim_vars:
+                if not self.bulk:
+                    cancel_client_data_request(self.sm, self.CLIENT_DATA_AREA_LVARS, var_id, var_id)
+                self.sm.unregister_client_data_handler(var_id, self.client_data_callback_handler)
+            for block in self._lvar_blocks:
+                definition_id = LVARS_BLOCK_DEFINITION_ID + block
+                cancel_client_data_request(self.sm, self.CLIENT_DATA_AREA_LVARS, definition_id, definition_id)
+                self.sm.unregister_client_data_handler(definition_id, self.lvar_block_handler)
+            cancel_client_data_request(self.sm, self.CLIENT_DATA_AREA_RESPONSE, self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_DEFINITION_ID)
+            self._watchers.clear()
+        with self._handoff_lock:
+            self._loop = None
+            self._woken.clear()
+
     def clear_sim_variables(self):
         with self._vr_lock:
             logging.info("clear_sim_variables")
+            for var_id in self.sim_vars:
+                self.sm.unregister_client_data_handler(var_id, self.client_data_callback_handler)
             self.sim_vars.clear()
-            self.sim_var_name_to_id.clear()
+            # A new mapping, so snapshots taken before keep theirs
+            self.sim_var_name_to_id = {}
+            self._watchers.clear()
+            # Bulk blocks stay subscribed; their slots are reused from the start
+            with self._pending_lock:
+                self._lvars_pending = []
+            self.lvar_area[:] = bytes(LVARS_AREA_SIZE)
             self.send_command("MF.SimVars.Clear")
 
+class LvarSnapshot:
+    """
+    Read-only values of all variables at one instant, from
+    MobiFlightVariableRequests.snapshot(). `get()` reads like
+    MobiFlightVariableRequests.get(); a variable that was not added yet is
+    added through the live requests object, without waiting for its value.
+    `reads` holds the names read. Until its first value arrives a variable
+    reads 0.0 (None if it was just added).
+    """
+    __slots__ = ("_requests", "_values", "_ids", "version", "reads")
+
+    def __init__(self, requests: MobiFlightVariableRequests, area: bytes, ids: dict, version: int):
+        self._requests = requests
+        self._values = memoryview(area).cast("f")
+        self._ids = ids
+        self.version = version
+        self.reads = set()
+
+    def get(self, variableString: str):
+        self.reads.add(variableString)
+        var_id = self._ids.get(variableString)
+        if var_id is None or var_id > len(self._values):
+            return self._requests.get(variableString, wait=False)
+        return round(self._values[var_id - 1], 5)
+
 # ========================= Logging =========================
 def setup_logging(log_file_name):
     """Configure root logging to a rotating file and console."""
@@ -304,6 +571,9 @@ def grid_to_payload(grid: List[List[Cell]]) -> str:
     """Serialize the grid into a WinWing websocket payload."""
     return json.dumps({"Target": "Display", "Data": list(chain(*grid))})
 
+# Seconds between renders of a display none of whose variables changed
+KEEPALIVE_TICK = 5.0
+
 def select_mcdu(mcdu_primary: "McduSocket", mcdu_alt: "McduSocket", cds_swap: int) -> "McduSocket":
     """Pick the active MCDU based on the CDS swap LVAR value."""
     return mcdu_alt if cds_swap == 1 else mcdu_primary
@@ -408,11 +678,10 @@ def get_state(v) -> int:
 # ========================= Simple persistent WebSocket =========================
 class McduSocket:
     """
-    Persistent WebSocket sender using the `websockets` library (async) while keeping
-    a synchronous API for the rest of the script.
+    Persistent WebSocket sender using the `websockets` library, run as a task
+    on the bridge's event loop (`await mcdu.run()`).
 
-    - Runs an asyncio event loop in a background thread
-    - `send_grid(grid)` is synchronous and just queues the latest payload
+    - `send_grid(grid)` is called on the loop and just keeps the latest payload
     - Automatically reconnects
     - Uses built-in ping/keepalive from `websockets`
     """
@@ -421,38 +690,15 @@ class McduSocket:
         self.url = url
         self.connect_timeout = connect_timeout
 
-        self._loop = None
-        self._queue = None
-        self._ready = threading.Event()
-        self._stop = threading.Event()
-
-        self._thread = threading.Thread(target=self._thread_main, name="McduSocketThread", daemon=True)
-        self._thread.start()
-
-        # Wait briefly for loop/queue to exist (avoid first-send race)
-        self._ready.wait(timeout=self.connect_timeout)
-
-    def _thread_main(self):
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            self._loop = loop
-            self._queue = asyncio.Queue()
-            self._ready.set()
-            loop.run_until_complete(self._run())
-        except Exception as e:
-            logging.exception("MCDU thread crashed: %s", e)
-        finally:
-            try:
-                if self._loop:
-                    self._loop.stop()
-                    self._loop.close()
-            except Exception:
-                pass
+        # Latest payload not sent yet; newer ones replace it
+        self._payload = None
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._patcher = DisplayPatcher()
 
-    async def _run(self):
+    async def run(self):
         # Reconnect loop
-        while not self._stop.is_set():
+        while not self._closed:
             try:
                 logging.info("Connecting to MCDU at %s", self.url)
 
@@ -466,29 +712,25 @@ class McduSocket:
                     max_queue=1,  # keep internal queue small
                 ) as ws:
                     logging.info("MCDU connected.")
-
-                    while not self._stop.is_set():
-                        # Wait for next payload; we coalesce to "latest only"
-                        payload = await self._queue.get()
+                    self._patcher.reset()  # first frame after (re)connect goes out in full
+                    if self._payload is not None:
+                        self._wake.set()
+
+                    while True:
+                        await self._wake.wait()
+                        self._wake.clear()
+                        if self._closed:
+                            return
+                        payload, self._payload = self._payload, None
                         if payload is None:
-                            break
-
-                        # Drain any newer payloads (keep only the latest)
-                        try:
-                            while True:
-                                next_payload = self._queue.get_nowait()
-                                if next_payload is None:
-                                    payload = None
-                                    break
-                                payload = next_payload
-                        except asyncio.QueueEmpty:
-                            pass
+                            continue
 
+                        # Send only the cells that changed since the last frame
+                        payload = self._patcher.encode(payload)
                         if payload is None:
-                            break
-
-                        # Send
+                            continue
                         await ws.send(payload)
+                        frame_sent()
                         logging.debug("→ MCDU SEND %s bytes", len(payload))
 
             except (OSError, WsWebSocketException, asyncio.TimeoutError) as e:
@@ -501,29 +743,13 @@ class McduSocket:
                 await asyncio.sleep(0.5)
 
     def send_grid(self, grid: List[List[Cell]]):
-        payload = grid_to_payload(grid)
-
-        # If the thread/loop isn't ready yet, just drop the frame (next tick will resend)
-        if not self._ready.is_set() or self._loop is None or self._queue is None:
-            return
-
-        # Thread-safe enqueue into asyncio.Queue
-        try:
-            self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
-        except Exception as e:
-            logging.debug("MCDU enqueue failed: %s", e)
+        # Coalesce to "latest only"; while disconnected the last frame waits for the connection
+        self._payload = grid_to_payload(grid)
+        self._wake.set()
 
     def close(self):
-        # Optional explicit shutdown if you ever want it
-        self._stop.set()
-        try:
-            if self._loop and self._queue:
-                # Unblock _queue.get() so the async loop can exit cleanly.
-                self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
-        except Exception as e:
-            logging.debug("MCDU close encountered error during shutdown: %s", e)
-            pass
-            # Best-effort shutdown: log at debug level but do not raise during close().
+        self._closed = True
+        self._wake.set()
 
 # ========================= CPDS (COPILOT) RENDERER =========================
 def _safe_float(v, default: float = 0.0) -> float:
@@ -604,7 +830,7 @@ def _cpds_separator(grid, row: int):
     put_text(grid, "-" * CDU_COLUMNS, row, 0, colour="k", size=SMALL)
 
 def build_cpds_grid(
-    vr: MobiFlightVariableRequests,
+    vr: LvarSnapshot,
     knob_cds: int,
     cpds_scroll: int,
     volt_amp: int,
@@ -906,7 +1132,7 @@ def cpds_pick_msg(pairs):
             return CPDS_MSG_ABBR.get(label, None)
     return None
 
-def _get_cds1_pairs(vr: MobiFlightVariableRequests):
+def _get_cds1_pairs(vr: LvarSnapshot):
     """Collect CDS1 left/right annunciator pairs from LVARs."""
     # LEFT
     engine1_fail      = get_state(vr.get("(L:engine1Fail)"))       # ENG FAIL
@@ -1000,7 +1226,7 @@ def _get_cds1_pairs(vr: MobiFlightVariableRequests):
 
     return left_pairs, right_pairs
 
-def _get_cds1_misc_pairs(vr: MobiFlightVariableRequests):
+def _get_cds1_misc_pairs(vr: LvarSnapshot):
     """Collect CDS1 miscellaneous annunciator pairs from LVARs."""
     xmsn_oil_temp     = get_state(vr.get("(L:xmsnOilTemp)"))       # XMSN OIL T
     rotor_brake       = get_state(vr.get("(L:rotorBrake)"))        # ROTOR BRAKE
@@ -1022,7 +1248,7 @@ def _get_cds1_misc_pairs(vr: MobiFlightVariableRequests):
         (shed_emer,     "SHED EMER"),
     ]
 
-def _get_cds1_green_states(vr: MobiFlightVariableRequests):
+def _get_cds1_green_states(vr: LvarSnapshot):
     """Collect CDS1 green status annunciator states."""
     pitot_pilot       = get_state(vr.get("(L:pitotPilot)"))        # P/S-HTR-P
     pitot_copilot     = get_state(vr.get("(L:pitotCoPilot)"))      # P/S-HTR-C
@@ -1033,49 +1259,86 @@ def _get_cds1_green_states(vr: MobiFlightVariableRequests):
 
     return pitot_pilot, pitot_copilot, cds_ack, land_light, land_light_ext, air_cond
 
-class Cds1DisplayThread:
-    """Background renderer for CDS1/MISC pages on the MCDU."""
+# ========================= Variables read by the displays =========================
+# Registered together at startup (see MobiFlightVariableRequests.register_many);
+# a variable missing here still works, it is just added on its first read.
+EC135_VARIABLES = (
+    "(A:GENERAL ENG ELAPSED TIME:1,number)", "(A:GENERAL ENG ELAPSED TIME:2,number)",
+    "(A:ENG N1 RPM:1,number)", "(A:ENG N1 RPM:2,number)", "(A:ENG ROTOR RPM:1,number)",
+    "(A:ENG ROTOR RPM:2,number)", "(A:GENERAL ENG EXHAUST GAS TEMPERATURE:1,number)",
+    "(A:GENERAL ENG EXHAUST GAS TEMPERATURE:2,number)", "(A:TURB ENG ITT:1,number)",
+    "(A:TURB ENG ITT:2,number)", "(A:COLLECTIVE POSITION,number)", "(A:BAROMETER PRESSURE,number)",
+    "(A:ENG TORQUE PERCENT:1,number)", "(A:ENG TORQUE PERCENT:2,number)",
+    "(A:ELECTRICAL MAIN BUS VOLTAGE:1,number)", "(A:ELECTRICAL MAIN BUS VOLTAGE:2,number)",
+    "(A:ELECTRICAL GENALT BUS AMPS:1,number)", "(A:ELECTRICAL GENALT BUS AMPS:2,number)",
+    "(A:ELECTRICAL BATTERY LOAD,number)", "(A:AMBIENT TEMPERATURE,number)",
+    "(A:FUELSYSTEM TANK WEIGHT:2,number)", "(A:FUELSYSTEM TANK WEIGHT:1,number)",
+    "(A:FUELSYSTEM TANK WEIGHT:3,number)", "(A:FUELSYSTEM TANK LEVEL:2,number)",
+    "(A:FUELSYSTEM TANK LEVEL:1,number)", "(A:FUELSYSTEM TANK LEVEL:3,number)", "(A:RADIO HEIGHT,number)",
+    "(A:CIRCUIT GENERAL PANEL ON,Bool)",
+    "(L:radioHeightMkr)", "(L:engine1Fail)", "(L:engine1OilPress)", "(L:fadecFail1)", "(L:fuelPress1)",
+    "(L:eng1Idle)", "(L:train1)", "(L:trainIdle1)", "(L:eng1Manual)", "(L:twinsgrip1)", "(L:fuelValve1)",
+    "(L:primePump1)", "(L:degraded1)", "(L:redund1)", "(L:hydraulic1)", "(L:genDiscon1)", "(L:inv1)",
+    "(L:fireTest1Ext)", "(L:fireTest1)", "(L:bustie1)", "(L:starter1)", "(L:engine2Fail)",
+    "(L:engine2OilPress)", "(L:fadecFail2)", "(L:fuelPress2)", "(L:eng2Idle)", "(L:train2)", "(L:trainIdle2)",
+    "(L:eng2Manual)", "(L:twinsgrip2)", "(L:fuelValve2)", "(L:primePump2)", "(L:degraded2)", "(L:redund2)",
+    "(L:hydraulic2)", "(L:genDiscon2)", "(L:inv2)", "(L:fireTest2Ext)", "(L:fireTest2)", "(L:bustie2)",
+    "(L:starter2)", "(L:xmsnOilTemp)", "(L:rotorBrake)", "(L:autopilot)", "(L:fuelPumpAft)",
+    "(L:fuelPumpFwd)", "(L:batDisc)", "(L:extPower)", "(L:shedEmer)", "(L:pitotPilot)", "(L:pitotCoPilot)",
+    "(L:cdsSelfTestAcknoledge)", "(L:landLight)", "(L:landLightExtr)", "(L:airCond)", "(L:cds_Swap)",
+    "(L:cdsPage)", "(L:brkCDS1)", "(L:brkCDS2)", "(L:knobCdsMode)", "(L:cdsDisplayScroll)",
+    "(L:voltampScroll)", "(L:cdsVneRadAltScroll)", "(L:switchCDStest)",
+)
+
+class Cds1Display:
+    """Renderer task for CDS1/MISC pages on the MCDU."""
     def __init__(self, vr: MobiFlightVariableRequests, mcdu_primary: McduSocket, mcdu_alt: McduSocket, tick: float = 0.1):
         self.vr = vr
         self.mcdu = mcdu_primary
         self.mcdu_alt = mcdu_alt
         self.tick = tick
-        self._stop = threading.Event()
-        self._thread = threading.Thread(target=self._run, name="CDS1Thread", daemon=True)
-
-    def start(self):
-        self._send_initial()
-        self._thread.start()
-
-    def stop(self):
-        self._stop.set()
-        self._thread.join(timeout=1.0)
+        # Set when a variable read by the last render changes
+        self._dirty = asyncio.Event()
+        self._watched = set()
+        self.renders = 0
+
+    def _watch(self, names):
+        """Have changes of newly read variables wake the next render."""
+        new = names - self._watched
+        if new:
+            self.vr.watch(new, self._dirty)
+            self._watched |= new
+            # A change before watch() took effect would go unnoticed; render once more
+            self._dirty.set()
 
     def _send_initial(self):
         cds1_grid = empty_grid()
         clear_area_with_spaces(cds1_grid, 0, CDU_ROWS-1)  # full screen spaces
         put_text_center(cds1_grid, "MISC", 6, colour="k", size=LARGE)
-        cds_swap = get_state(self.vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
+        cds_swap = get_state(self.vr.snapshot().get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
         select_mcdu(self.mcdu, self.mcdu_alt, cds_swap).send_grid(cds1_grid)
 
-    def _run(self):
+    async def run(self):
+        self._send_initial()
         row_11 = row_12 = row_13 = None  # pylint: disable=invalid-name
-
-        while not self._stop.is_set():
+        while True:
+            self._dirty.clear()
+            self.renders += 1
+            vr = self.vr.snapshot()
             try:
                 # NOTE: "CIRCUIT GENERAL PANEL ON" is a general panel power circuit SimVar.
                 # In MSFS it indicates whether the main/panel bus is supplying power to the
                 # cockpit panels, not a dedicated "avionics master" line. For the EC135
                 # profile we treat this as "display power available" for the CPDS and
                 # blank the display whenever this SimVar is 0.
-                avionics_on  = get_state(self.vr.get("(A:CIRCUIT GENERAL PANEL ON,Bool)"))
-                cds1_page    = get_state(self.vr.get("(L:cdsPage)")) # 0 - 2
-                cds1_breaker = get_state(self.vr.get("(L:brkCDS1)"))
-                cds_swap     = get_state(self.vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs                
+                avionics_on  = get_state(vr.get("(A:CIRCUIT GENERAL PANEL ON,Bool)"))
+                cds1_page    = get_state(vr.get("(L:cdsPage)")) # 0 - 2
+                cds1_breaker = get_state(vr.get("(L:brkCDS1)"))
+                cds_swap     = get_state(vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs                
 
-                left_pairs, right_pairs = _get_cds1_pairs(self.vr)
-                misc_pairs = _get_cds1_misc_pairs(self.vr)
-                pitot_pilot, pitot_copilot, cds_ack, land_light, land_light_ext, air_cond = _get_cds1_green_states(self.vr)
+                left_pairs, right_pairs = _get_cds1_pairs(vr)
+                misc_pairs = _get_cds1_misc_pairs(vr)
+                pitot_pilot, pitot_copilot, cds_ack, land_light, land_light_ext, air_cond = _get_cds1_green_states(vr)
 
                 left_labels  = compact_labels(left_pairs)
                 right_labels = compact_labels(right_pairs)
@@ -1132,51 +1395,66 @@ class Cds1DisplayThread:
                 else:
                     clear_area_with_spaces(cds1_grid, 0, CDU_ROWS-1)
                     put_text_center(cds1_grid, "MISC", 6, colour="k", size=LARGE)
-                select_mcdu(self.mcdu, self.mcdu_alt, cds_swap).send_grid(cds1_grid)
+                mcdu = select_mcdu(self.mcdu, self.mcdu_alt, cds_swap)
+                mcdu.send_grid(cds1_grid)
 
             except Exception as e:
                 logging.exception("CDS1 loop error: %s", e)
 
-            sleep(self.tick)
+            self._watch(vr.reads)
 
-class CpdsDisplayThread:
-    """Background renderer for the CPDS (copilot) display."""
+            # At most one render per tick; without changes only a keepalive
+            await asyncio.sleep(self.tick)
+            try:
+                await asyncio.wait_for(self._dirty.wait(), KEEPALIVE_TICK)
+            except asyncio.TimeoutError:
+                pass
+
+class CpdsDisplay:
+    """Renderer task for the CPDS (copilot) display."""
     def __init__(self, vr: MobiFlightVariableRequests, mcdu_primary: McduSocket, mcdu_alt: McduSocket, tick: float = 0.1):
         self.vr = vr
         self.mcdu = mcdu_primary
         self.mcdu_alt = mcdu_alt
         self.tick = tick
-        self._stop = threading.Event()
-        self._thread = threading.Thread(target=self._run, name="CPDSThread", daemon=True)
-
-    def start(self):
-        self._send_initial()
-        self._thread.start()
-
-    def stop(self):
-        self._stop.set()
-        self._thread.join(timeout=1.0)
+        # Set when a variable read by the last render changes
+        self._dirty = asyncio.Event()
+        self._watched = set()
+        self.renders = 0
+
+    def _watch(self, names):
+        """Have changes of newly read variables wake the next render."""
+        new = names - self._watched
+        if new:
+            self.vr.watch(new, self._dirty)
+            self._watched |= new
+            # A change before watch() took effect would go unnoticed; render once more
+            self._dirty.set()
 
     def _send_initial(self):
         cpds_grid = empty_grid()
         clear_area_with_spaces(cpds_grid, 0, CDU_ROWS-1)
         put_text_center(cpds_grid, "CPDS", 6, colour="k", size=LARGE)
-        cds_swap = get_state(self.vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
+        cds_swap = get_state(self.vr.snapshot().get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
         select_mcdu(self.mcdu, self.mcdu_alt, cds_swap).send_grid(cpds_grid)
 
-    def _run(self):
-        while not self._stop.is_set():
+    async def run(self):
+        self._send_initial()
+        while True:
+            self._dirty.clear()
+            self.renders += 1
+            vr = self.vr.snapshot()
             try:
-                avionics_on  = get_state(self.vr.get("(A:CIRCUIT GENERAL PANEL ON,Bool)"))
-                cpds_breaker = get_state(self.vr.get("(L:brkCDS2)"))
-                knob_cds     = get_state(self.vr.get("(L:knobCdsMode)"))  # Range: 0-5
-                cpds_scroll  = get_state(self.vr.get("(L:cdsDisplayScroll)"))  # Range: 0-5
-                volt_amp     = get_state(self.vr.get("(L:voltampScroll)")) # 0 - 2
-                rad_alt_scrl = get_state(self.vr.get("(L:cdsVneRadAltScroll)"))  # toggle RAD ALT vs VNE/KT display
-                cds_test     = get_state(self.vr.get("(L:switchCDStest)"))
-                cds_swap     = get_state(self.vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
-
-                left_pairs, right_pairs = _get_cds1_pairs(self.vr)
+                avionics_on  = get_state(vr.get("(A:CIRCUIT GENERAL PANEL ON,Bool)"))
+                cpds_breaker = get_state(vr.get("(L:brkCDS2)"))
+                knob_cds     = get_state(vr.get("(L:knobCdsMode)"))  # Range: 0-5
+                cpds_scroll  = get_state(vr.get("(L:cdsDisplayScroll)"))  # Range: 0-5
+                volt_amp     = get_state(vr.get("(L:voltampScroll)")) # 0 - 2
+                rad_alt_scrl = get_state(vr.get("(L:cdsVneRadAltScroll)"))  # toggle RAD ALT vs VNE/KT display
+                cds_test     = get_state(vr.get("(L:switchCDStest)"))
+                cds_swap     = get_state(vr.get("(L:cds_Swap)"))  # Swap CDS display between captain/copilot MCDUs
+
+                left_pairs, right_pairs = _get_cds1_pairs(vr)
                 msg1 = cpds_pick_msg(left_pairs)
                 msg2 = cpds_pick_msg(right_pairs)
 
@@ -1184,48 +1462,57 @@ class CpdsDisplayThread:
                 if avionics_on == 0:
                     clear_area_with_spaces(cpds_grid, 0, CDU_ROWS-1)
                 elif cpds_breaker == 1:
-                    cpds_grid = build_cpds_grid(self.vr, knob_cds, cpds_scroll, volt_amp, rad_alt_scrl, cds_test, msg1, msg2)
+                    cpds_grid = build_cpds_grid(vr, knob_cds, cpds_scroll, volt_amp, rad_alt_scrl, cds_test, msg1, msg2)
                 else:
                     clear_area_with_spaces(cpds_grid, 0, CDU_ROWS-1)
                     # Intentionally disabled: older behavior showed an explicit "CPDS OFF" label when the CPDS breaker was out.
                     # Keep this call commented so users can re-enable the overlay for debugging or custom setups without changing defaults.
                     # put_text_center(cpds_grid, "CPDS OFF", 6, colour="k", size=LARGE)
 
-                select_mcdu(self.mcdu, self.mcdu_alt, cds_swap).send_grid(cpds_grid)
+                mcdu = select_mcdu(self.mcdu, self.mcdu_alt, cds_swap)
+                mcdu.send_grid(cpds_grid)
 
             except Exception as e:
                 logging.exception("CPDS loop error: %s", e)
 
-            sleep(self.tick)
+            self._watch(vr.reads)
+
+            # At most one render per tick; without changes only a keepalive
+            await asyncio.sleep(self.tick)
+            try:
+                await asyncio.wait_for(self._dirty.wait(), KEEPALIVE_TICK)
+            except asyncio.TimeoutError:
+                pass
 
 
 # ========================= MAIN =========================
-if __name__ == "__main__":
-    # Uncomment to log to file + console:
-    # setup_logging("SimConnectMobiFlight.log")
-
+async def main():
     # SimConnect / MobiFlight var reader
-    sm = SimConnectMobiFlight()
-    vr = MobiFlightVariableRequests(sm)
-    vr.clear_sim_variables()
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sm:
+        vr = MobiFlightVariableRequests(sm, bulk=True)
 
-    # MCDU sockets (captain and copilot)
-    mcdu_capt = McduSocket(CAPT_MCDU_URL)
-    mcdu_copi = McduSocket(COPI_MCDU_URL)
+        # MCDU sockets (captain and copilot)
+        mcdu_capt = McduSocket(CAPT_MCDU_URL)
+        mcdu_copi = McduSocket(COPI_MCDU_URL)
 
-    cds1_display = Cds1DisplayThread(vr, mcdu_capt, mcdu_copi)
-    cpds_display = CpdsDisplayThread(vr, mcdu_copi, mcdu_capt)
-    cds1_display.start()
-    cpds_display.start()
+        try:
+            vr.clear_sim_variables()
+            await vr.register_many(EC135_VARIABLES)
+
+            cds1_display = Cds1Display(vr, mcdu_capt, mcdu_copi)
+            cpds_display = CpdsDisplay(vr, mcdu_copi, mcdu_capt)
+
+            await asyncio.gather(mcdu_capt.run(), mcdu_copi.run(), cds1_display.run(), cpds_display.run())
+        finally:
+            mcdu_capt.close()
+            mcdu_copi.close()
+            vr.close()
+
+if __name__ == "__main__":
+    # Uncomment to log to file + console:
+    # setup_logging("SimConnectMobiFlight.log")
 
     try:
-        while True:
-            sleep(1.0)
+        asyncio.run(main())
     except KeyboardInterrupt:
         pass
-    finally:
-        cds1_display.stop()
-        cpds_display.stop()
-        mcdu_capt.close()
-        mcdu_copi.close()
-
@@ -0,0 +1,12 @@
+"""
+Shared building blocks for the WinWing CDU scripts.
+
+The aircraft scripts in the parent directory run either as standalone
+programs or as plugins of the resident host (``cdu_host``), so this package
+sits next to them and is imported by plain module name (e.g.
+``from mobiflight_cdu.transport import MobiFlightClient``).
+
+MobiFlight indexes every ``*.py`` file below ``Scripts`` by file name, so
+module names in this package must stay unique across the whole tree and the
+package must not contain sub-packages.
+"""
@@ -0,0 +1,366 @@
+"""
+Declarative decoder for CDU screens that aircraft publish as raw byte grids.
+
+Most SimConnect aircraft expose their CDU as a client data area of
+fixed-size cells: a glyph byte followed by colour and flag bytes, sometimes
+column-major, sometimes split into separate glyph and attribute arrays. A
+`GridLayout` describes where those fields live and how they map to MobiFlight
+glyphs, colour codes and font sizes:
+
+    PMDG_LAYOUT = GridLayout(
+        stride=3, glyph=0, colour=1, flags=2, column_major=True,
+        colours={0: "w", 1: "c", 2: "g"},
+        flag_roles={0x01: SMALL, 0x02: REVERSE, 0x04: "e"},
+        glyphs={"\\xA1": "\\u2190"},
+        uppercase=True, reverse_field=True,
+    )
+    DECODER = GridDecoder(PMDG_LAYOUT)
+    json_data = DECODER.to_json(data)
+
+`GridDecoder` compiles the layout once into per-byte translation tables. A
+frame is then decoded field by field over the whole buffer (strided
+memoryview slices, `bytes.translate`, `str.translate`) and only the final
+cell list is built in Python, instead of running a Python loop with `chr()`,
+dict lookups and if-chains for every cell.
+"""
+import json
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from mobiflight_cdu.patch import DISPLAY_TARGET, Cell
+
+CDU_COLUMNS: int = 24
+CDU_ROWS: int = 14
+
+# Roles for `flag_roles`. Any other role value is a colour code that
+# replaces the cell colour while the flag is set.
+SMALL = "small"      # small font while the bit is set
+LARGE = "large"      # small font while the bit is clear
+REVERSE = "reverse"  # reverse video while the bit is set
+
+
+class GridLayout:
+    """
+    Byte layout of one CDU screen buffer and how to translate it.
+
+    Cell `i` of the source grid starts at `offset + i * stride`; `glyph`,
+    `colour` and `flags` are byte offsets of the fields within a cell. Split
+    layouts (all glyphs followed by all attributes) use `stride=1` and put
+    the attribute array offset in `colour` / `flags`. `colour` and `flags`
+    may point at the same byte, `colour_mask` selects the colour bits.
+
+    `flag_roles` tests bits of the flag byte (mask -> role); `flag_values`
+    compares the whole flag byte (value -> colour code) for layouts whose
+    flag byte is a state rather than a bit field.
+
+    In a short buffer, cells that end past the data are left blank. A cell
+    ends after its last field unless `cell_size` says the whole record must
+    be present.
+
+    `glyph_width` 2 reads the glyph as a little-endian UTF-16 code unit.
+    `rgb=True` reads `colour` as three bytes (red, green, blue) and maps
+    them with `rgb_colour`; `background` then points at a background colour
+    triple that sets reverse video when `rgb_reverse` returns true.
+
+    The source grid of `rows` x `columns` cells is placed at
+    (`dest_row`, `dest_column`) of the CDU_ROWS x CDU_COLUMNS display.
+    """
+
+    def __init__(
+        self,
+        stride: int,
+        glyph: int = 0,
+        colour: Optional[int] = None,
+        flags: Optional[int] = None,
+        offset: int = 0,
+        rows: int = CDU_ROWS,
+        columns: int = CDU_COLUMNS,
+        column_major: bool = False,
+        glyph_width: int = 1,
+        cell_size: Optional[int] = None,
+        colours: Optional[Mapping[int, str]] = None,
+        colour_mask: int = 0xFF,
+        default_colour: str = "w",
+        rgb: bool = False,
+        rgb_colour: Optional[Callable[[int, int, int], str]] = None,
+        background: Optional[int] = None,
+        rgb_reverse: Optional[Callable[[int, int, int], bool]] = None,
+        flag_roles: Optional[Mapping[int, str]] = None,
+        flag_values: Optional[Mapping[int, str]] = None,
+        glyphs: Optional[Mapping[str, str]] = None,
+        blanks: str = " \0",
+        uppercase: bool = False,
+        small_glyphs: str = "",
+        small_rows: Iterable[int] = (),
+        reverse_field: bool = False,
+        dest_row: int = 0,
+        dest_column: int = 0,
+    ) -> None:
+        self.stride: int = stride
+        self.glyph: int = glyph
+        self.colour: Optional[int] = colour
+        self.flags: Optional[int] = flags
+        self.offset: int = offset
+        self.rows: int = rows
+        self.columns: int = columns
+        self.column_major: bool = column_major
+        self.glyph_width: int = glyph_width
+        self.cell_size: Optional[int] = cell_size
+        self.colours: Mapping[int, str] = colours or {}
+        self.colour_mask: int = colour_mask
+        self.default_colour: str = default_colour
+        self.rgb: bool = rgb
+        self.rgb_colour: Optional[Callable[[int, int, int], str]] = rgb_colour
+        self.background: Optional[int] = background
+        self.rgb_reverse: Optional[Callable[[int, int, int], bool]] = rgb_reverse
+        self.flag_roles: Mapping[int, str] = flag_roles or {}
+        self.flag_values: Mapping[int, str] = flag_values or {}
+        self.glyphs: Mapping[str, str] = glyphs or {}
+        self.blanks: str = blanks
+        self.uppercase: bool = uppercase
+        self.small_glyphs: str = small_glyphs
+        self.small_rows: Tuple[int, ...] = tuple(small_rows)
+        self.reverse_field: bool = reverse_field
+        self.dest_row: int = dest_row
+        self.dest_column: int = dest_column
+
+    @property
+    def cells(self) -> int:
+        return self.rows * self.columns
+
+    @property
+    def cell_end(self) -> int:
+        """Bytes of a cell, from its start, that must be present to decode it."""
+        if self.cell_size is not None:
+            return self.cell_size
+        ends = [self.glyph + self.glyph_width]
+        if self.colour is not None:
+            ends.append(self.colour + (3 if self.rgb else 1))
+        if self.flags is not None:
+            ends.append(self.flags + 1)
+        if self.background is not None:
+            ends.append(self.background + 3)
+        return max(ends)
+
+    @property
+    def size(self) -> int:
+        """Smallest buffer size that holds every field of every cell."""
+        return self.offset + (self.cells - 1) * self.stride + self.cell_end
+
+
+class _RgbTable(dict):
+    """Packed RGB key -> result, computed on first use of each colour."""
+
+    def __init__(self, convert: Callable[[int, int, int], Any]) -> None:
+        super().__init__()
+        self._convert = convert
+
+    def __missing__(self, key: int) -> Any:
+        r, g, b, _ = key.to_bytes(4, sys.byteorder)
+        value = self[key] = self._convert(r, g, b)
+        return value
+
+
+class _ZeroDefault(dict):
+    """str.translate table mapping every character it does not know to NUL."""
+
+    def __missing__(self, key: int) -> str:
+        self[key] = "\0"
+        return "\0"
+
+
+def _or(a: bytes, b: bytes) -> bytes:
+    """Byte-wise OR of two equally long byte strings."""
+    return (int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def _select(base: bytes, override: bytes, mask: bytes) -> bytes:
+    """Byte-wise `override if mask else base`, mask bytes being 0x00 or 0xFF."""
+    length = len(base)
+    base_int = int.from_bytes(base, "little")
+    mask_int = int.from_bytes(mask, "little")
+    return ((base_int & ~mask_int) | int.from_bytes(override, "little")).to_bytes(length, "little")
+
+
+def _table(function: Callable[[int], int]) -> bytes:
+    return bytes(function(value) for value in range(256))
+
+
+class GridDecoder:
+    """A GridLayout compiled into whole-buffer translation tables."""
+
+    def __init__(self, layout: GridLayout) -> None:
+        self.layout: GridLayout = layout
+        self.size: int = layout.size
+        cells = layout.cells
+
+        # Glyphs: blanks become spaces, substitutions and case folding are
+        # folded into one str.translate table.
+        glyph_table: Dict[int, str] = {}
+        glyph_bits = bytearray(256)
+        if layout.glyph_width == 1:
+            for value in range(256):
+                glyph = chr(value)
+                if layout.uppercase and glyph.islower():
+                    glyph_bits[value] = 1
+                    if len(glyph.upper()) == 1:
+                        glyph = glyph.upper()
+                glyph = " " if glyph in layout.blanks else layout.glyphs.get(glyph, glyph)
+                if glyph != chr(value):
+                    glyph_table[value] = glyph
+        else:
+            glyph_table.update((ord(source), target) for source, target in layout.glyphs.items())
+            glyph_table.update((ord(blank), " ") for blank in layout.blanks)
+        self._glyph_table: Dict[int, str] = glyph_table
+        for glyph in layout.small_glyphs:
+            if ord(glyph) < 256:
+                glyph_bits[ord(glyph)] = 1
+        self._glyph_bits: Optional[bytes] = bytes(glyph_bits) if any(glyph_bits) else None
+        self._wide_glyph_bits: Optional[_ZeroDefault] = None
+        if layout.glyph_width != 1 and layout.small_glyphs:
+            self._wide_glyph_bits = _ZeroDefault({ord(glyph): "\x01" for glyph in layout.small_glyphs})
+
+        # Colours: one ASCII colour code per cell.
+        self._fixed_colours: bytes = layout.default_colour.encode("ascii") * cells
+        self._colour_table: Optional[bytes] = None
+        self._rgb_table: Optional[_RgbTable] = None
+        if layout.colour is not None and layout.rgb:
+            self._rgb_table = _RgbTable(lambda r, g, b: layout.rgb_colour(r, g, b).encode("ascii")[0])
+        elif layout.colour is not None:
+            self._colour_table = _table(
+                lambda value: ord(layout.colours.get(value & layout.colour_mask, layout.default_colour)))
+        self._reverse_table: Optional[_RgbTable] = None
+        if layout.background is not None:
+            self._reverse_table = _RgbTable(lambda r, g, b: 1 if layout.rgb_reverse(r, g, b) else 0)
+
+        # Flags: small / reverse / colour override bits per flag byte.
+        small = [mask for mask, role in layout.flag_roles.items() if role == SMALL]
+        large = [mask for mask, role in layout.flag_roles.items() if role == LARGE]
+        reverse = [mask for mask, role in layout.flag_roles.items() if role == REVERSE]
+        overrides = [(mask, role) for mask, role in layout.flag_roles.items() if role not in (SMALL, LARGE, REVERSE)]
+        self._small_table: Optional[bytes] = None
+        if small or large:
+            self._small_table = _table(
+                lambda value: int(any(value & mask for mask in small) or any(not value & mask for mask in large)))
+        self._flag_reverse_table: Optional[bytes] = None
+        if reverse:
+            self._flag_reverse_table = _table(lambda value: int(any(value & mask for mask in reverse)))
+        self._override_table: Optional[bytes] = None
+        self._override_mask_table: Optional[bytes] = None
+        if overrides or layout.flag_values:
+            def override(value: int) -> int:
+                if value in layout.flag_values:
+                    return ord(layout.flag_values[value])
+                for mask, colour in overrides:
+                    if value & mask:
+                        return ord(colour)
+                return 0
+            self._override_table = _table(override)
+            self._override_mask_table = _table(lambda value: 0xFF if value else 0)
+
+        self._row_sizes: Optional[bytes] = None
+        if layout.small_rows:
+            self._row_sizes = b"".join(
+                (b"\x01" if row in layout.small_rows else b"\x00") * layout.columns for row in range(layout.rows))
+        self._no_reverse: bytes = bytes(cells)
+        self._zero_sizes: bytes = bytes(cells)
+
+    def _field(self, data: memoryview, field: int) -> bytes:
+        """One byte per cell, in row-major display order."""
+        layout = self.layout
+        start = layout.offset + field
+        raw = data[start:start + layout.cells * layout.stride:layout.stride].tobytes()
+        if layout.column_major:
+            rows = layout.rows
+            raw = b"".join(raw[row::rows] for row in range(rows))
+        return raw
+
+    def _rgb_keys(self, data: memoryview, field: int) -> memoryview:
+        packed = bytearray(self.layout.cells * 4)
+        for channel in range(3):
+            packed[channel::4] = self._field(data, field + channel)
+        return memoryview(packed).cast("I")
+
+    def decode(self, data: Any) -> List[Cell]:
+        """Return the CDU_ROWS x CDU_COLUMNS display cells for one buffer."""
+        layout = self.layout
+        length = len(data)
+        if length < self.size:
+            # Decode a zero-padded copy, then blank the cells that did not fit
+            data = bytes(data) + bytes(self.size - length)
+        view = memoryview(data).cast("B")
+
+        glyph_bytes = self._field(view, layout.glyph)
+        if layout.glyph_width == 1:
+            source = glyph_bytes.decode("latin-1")
+        else:
+            # Widen each UTF-16 code unit to UTF-32 so that surrogates stay
+            # one character per cell instead of being paired up.
+            wide = bytearray(len(glyph_bytes) * 4)
+            wide[0::4] = glyph_bytes
+            wide[1::4] = self._field(view, layout.glyph + 1)
+            source = wide.decode("utf-32-le", "surrogatepass")
+        glyphs = source.translate(self._glyph_table)
+
+        sizes = self._zero_sizes
+        if self._glyph_bits is not None:
+            sizes = glyph_bytes.translate(self._glyph_bits)
+        elif self._wide_glyph_bits is not None:
+            sizes = source.translate(self._wide_glyph_bits).encode("latin-1")
+        if self._row_sizes is not None:
+            sizes = _or(sizes, self._row_sizes)
+
+        if self._colour_table is not None:
+            colours = self._field(view, layout.colour).translate(self._colour_table)
+        elif self._rgb_table is not None:
+            colours = bytes(map(self._rgb_table.__getitem__, self._rgb_keys(view, layout.colour)))
+        else:
+            colours = self._fixed_colours
+
+        reverse = self._no_reverse
+        if self._reverse_table is not None:
+            reverse = bytes(map(self._reverse_table.__getitem__, self._rgb_keys(view, layout.background)))
+
+        if layout.flags is not None:
+            flags = self._field(view, layout.flags)
+            if self._small_table is not None:
+                sizes = _or(sizes, flags.translate(self._small_table))
+            if self._flag_reverse_table is not None:
+                reverse = _or(reverse, flags.translate(self._flag_reverse_table))
+            if self._override_table is not None:
+                override = flags.translate(self._override_table)
+                colours = _select(colours, override, override.translate(self._override_mask_table))
+        colour_codes = colours.decode("ascii")
+
+        if layout.reverse_field:
+            cells = [[glyph, colour, size, rev] if glyph != " " else []
+                     for glyph, colour, size, rev in zip(glyphs, colour_codes, sizes, reverse)]
+        else:
+            cells = [[glyph, colour, size] if glyph != " " else []
+                     for glyph, colour, size in zip(glyphs, colour_codes, sizes)]
+        if length < self.size:
+            self._blank_incomplete(cells, length)
+
+        if layout.rows == CDU_ROWS and layout.columns == CDU_COLUMNS:
+            return cells
+        display: List[Cell] = [[] for _ in range(CDU_ROWS * CDU_COLUMNS)]
+        columns = min(layout.columns, CDU_COLUMNS - layout.dest_column)
+        for row in range(min(layout.rows, CDU_ROWS - layout.dest_row)):
+            start = (layout.dest_row + row) * CDU_COLUMNS + layout.dest_column
+            source_start = row * layout.columns
+            display[start:start + columns] = cells[source_start:source_start + columns]
+        return display
+
+    def _blank_incomplete(self, cells: List[Cell], length: int) -> None:
+        """Blank the cells of a short buffer that do not have all their fields in it."""
+        layout = self.layout
+        complete = max(0, (length - layout.offset - layout.cell_end) // layout.stride + 1)
+        for index in range(complete, layout.cells):
+            if layout.column_major:
+                cells[(index % layout.rows) * layout.columns + index // layout.rows] = []
+            else:
+                cells[index] = []
+
+    def to_json(self, data: Any) -> str:
+        """Decode data into a MobiFlight Display message."""
+        return json.dumps({"Target": DISPLAY_TARGET, "Data": self.decode(data)})
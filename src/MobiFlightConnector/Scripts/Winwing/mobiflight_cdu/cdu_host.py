@@ -0,0 +1,250 @@
+"""
+Resident CDU host: runs the aircraft scripts as plugins of one long-lived
+Python process, so an aircraft switch does not pay for interpreter startup,
+imports and reconnecting to MobiFlight and the simulator.
+
+MobiFlight starts it once from the Winwing directory
+
+    python -m mobiflight_cdu.cdu_host
+
+and writes one command per line to its stdin:
+
+    load <path to script.py>    start a script (several can run at once)
+    unload [<path>]             stop one script, or all of them
+    quit                        stop everything and exit (so does closing stdin)
+
+A script that defines a top-level `async def main()` is imported once (its
+`__main__` block does not run) and its `main()`
+runs as a task on the host's event loop; unloading cancels the task. The
+connections it opens through `transport.shared_client` and
+`resident.warm_resource` stay open, so loading the next aircraft finds them
+connected. Scripts without a `main()` coroutine are run as a child process
+like before. When a script stops on its own, the host prints
+`cdu_host:stopped:<script file name>` on stdout.
+
+With CDU_STARTUP_PROFILE=1 the host logs how long each in-process script took
+from its load command to its first display frame (see `startup_profile`).
+"""
+import ast
+import asyncio
+import importlib.util
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional, Union
+
+from mobiflight_cdu import resident, startup_profile
+
+# Seconds a script gets to run its cleanup after being cancelled
+UNLOAD_TIMEOUT = 2.0
+STOPPED_MARKER = "cdu_host:stopped:"
+
+
+def script_name(path: str) -> str:
+    return os.path.basename(path)
+
+
+def script_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def defines_main(path: str) -> bool:
+    """True if the script has a top-level `async def main()`, checked without running it."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    return any(isinstance(node, ast.AsyncFunctionDef) and node.name == "main" for node in tree.body)
+
+
+def import_script(path: str) -> ModuleType:
+    """Import an aircraft script by path without running its __main__ block."""
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        # Standalone scripts find their neighbours through sys.path[0]
+        sys.path.insert(0, directory)
+    name = os.path.splitext(script_name(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def report_stopped(path: str) -> None:
+    print(f"{STOPPED_MARKER}{script_name(path)}", flush=True)
+
+
+class ScriptTask:
+    """An aircraft script running in-process as a task on the host's loop."""
+
+    def __init__(self, path: str, module: ModuleType) -> None:
+        self.path: str = path
+        self.module: ModuleType = module
+        self.task: Optional[asyncio.Task] = None
+        self.stopping: bool = False
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run(), name=script_name(self.path))
+
+    async def _run(self) -> None:
+        try:
+            await self.module.main()
+        except Exception as e:
+            logging.error("%s failed: %s", script_name(self.path), e)
+            logging.debug("Traceback", exc_info=True)
+        if not self.stopping:
+            logging.info("%s stopped", script_name(self.path))
+            report_stopped(self.path)
+
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def stop(self) -> None:
+        self.stopping = True
+        if not self.running():
+            return
+        self.task.cancel()
+        done, _ = await asyncio.wait({self.task}, timeout=UNLOAD_TIMEOUT)
+        if not done:
+            logging.warning("%s did not stop within %.1f s", script_name(self.path), UNLOAD_TIMEOUT)
+
+
+class ScriptProcess:
+    """An aircraft script run as a child process, for scripts without main()."""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.stopping: bool = False
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        # stdout and stderr are shared with the host; stdin carries host commands
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, self.path, stdin=subprocess.DEVNULL
+        )
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        code = await self.process.wait()
+        if not self.stopping:
+            logging.info("%s exited with code %s", script_name(self.path), code)
+            report_stopped(self.path)
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def stop(self) -> None:
+        self.stopping = True
+        if not self.running():
+            return
+        self.process.kill()
+        try:
+            await asyncio.wait_for(self.process.wait(), UNLOAD_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning("%s did not exit within %.1f s", script_name(self.path), UNLOAD_TIMEOUT)
+
+
+Script = Union[ScriptTask, ScriptProcess]
+
+
+class CduHost:
+    """Loaded aircraft scripts, keyed by normalised path."""
+
+    def __init__(self, profile: Optional[startup_profile.StartupProfile] = None) -> None:
+        self.scripts: Dict[str, Script] = {}
+        self.modules: Dict[str, Optional[ModuleType]] = {}
+        self.profile: Optional[startup_profile.StartupProfile] = profile
+
+    def _module(self, key: str, path: str) -> Optional[ModuleType]:
+        """The imported script if it can run in-process, None if it needs its own process."""
+        if key not in self.modules:
+            self.modules[key] = import_script(path) if defines_main(path) else None
+        return self.modules[key]
+
+    async def load(self, path: str) -> None:
+        started = time.perf_counter()
+        key = script_key(path)
+        await self.unload(path)
+        if self.profile:
+            self.profile.begin(script_name(path), started, "load")
+        try:
+            module = self._module(key, path)
+            if self.profile and not module:
+                # A child process is not instrumented
+                self.profile.reported = True
+            script: Script = ScriptTask(path, module) if module else ScriptProcess(path)
+            await script.start()
+        except Exception as e:
+            logging.error("Cannot load %s: %s", script_name(path), e)
+            logging.debug("Traceback", exc_info=True)
+            report_stopped(path)
+            return
+        self.scripts[key] = script
+        logging.info("Loaded %s %s in %.0f ms", script_name(path),
+                     "in-process" if module else "as child process", (time.perf_counter() - started) * 1000)
+
+    async def unload(self, path: Optional[str] = None) -> None:
+        keys = list(self.scripts) if path is None else [script_key(path)]
+        for key in keys:
+            script = self.scripts.pop(key, None)
+            if script is not None:
+                await script.stop()
+                logging.info("Unloaded %s", script_name(script.path))
+
+
+def read_commands(loop: asyncio.AbstractEventLoop, commands: "asyncio.Queue[str]") -> None:
+    """Blocking stdin reader, run in a daemon thread."""
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(commands.put_nowait, line.strip())
+    loop.call_soon_threadsafe(commands.put_nowait, "quit")
+
+
+async def serve(profile: Optional[startup_profile.StartupProfile] = None) -> None:
+    resident.enable()
+    host = CduHost(profile)
+    commands: "asyncio.Queue[str]" = asyncio.Queue()
+    threading.Thread(target=read_commands, args=(asyncio.get_running_loop(), commands), daemon=True).start()
+    logging.info("CDU host ready")
+
+    while True:
+        line = await commands.get()
+        command, _, argument = line.partition(" ")
+        if command == "load" and argument:
+            await host.load(argument)
+        elif command == "unload":
+            await host.unload(argument or None)
+        elif command == "quit":
+            break
+        elif command:
+            logging.warning("Unknown CDU host command: %s", line)
+
+    await host.unload()
+    await resident.close_all()
+    logging.info("CDU host stopped")
+
+
+if __name__ == "__main__":
+    # MobiFlight writes the commands as UTF-8, independent of the console code page
+    sys.stdin.reconfigure(encoding="utf-8")
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+    profile = None
+    if startup_profile.enabled():
+        profile = startup_profile.StartupProfile()
+        profile.install()
+    try:
+        asyncio.run(serve(profile))
+    except KeyboardInterrupt:
+        pass
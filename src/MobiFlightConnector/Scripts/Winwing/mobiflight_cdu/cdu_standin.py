@@ -0,0 +1,105 @@
+"""
+Local stand-in for the MobiFlight CDU websocket server.
+
+Serves the same endpoints as MobiFlight (ws://localhost:8320/winwing/cdu-*),
+decodes Display and DisplayPatch messages with the reference decoder and
+prints the resulting screen, so the aircraft scripts can be exercised
+without MobiFlight or CDU hardware attached. Stop MobiFlight first, or pass
+a different --port and point the script at it.
+
+    python -m mobiflight_cdu.cdu_standin [--port 8320] [--quiet]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from websockets.asyncio.server import ServerConnection, serve
+
+from mobiflight_cdu.patch import Cell, apply_message
+
+CDU_COLUMNS: int = 24
+CDU_ROWS: int = 14
+ENDPOINTS = ("/winwing/cdu-captain", "/winwing/cdu-co-pilot", "/winwing/cdu-observer")
+
+
+class StandInCdu:
+    """Display state and traffic counters for one endpoint."""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.cells: Optional[List[Cell]] = None
+        self.font: Optional[str] = None
+        self.messages: Dict[str, int] = {}
+        self.bytes_received: int = 0
+
+    def receive(self, payload: str) -> None:
+        self.bytes_received += len(payload)
+        message = json.loads(payload)
+        target = message.get("Target", "")
+        self.messages[target] = self.messages.get(target, 0) + 1
+        if target == "Font":
+            self.font = message.get("Data")
+        else:
+            self.cells = apply_message(self.cells, payload)
+
+    def render(self) -> str:
+        """Return the screen as text, one line per CDU row."""
+        cells = self.cells or []
+        lines = []
+        for row in range(CDU_ROWS):
+            line = ""
+            for col in range(CDU_COLUMNS):
+                index = row * CDU_COLUMNS + col
+                cell = cells[index] if index < len(cells) else []
+                line += cell[0] if cell else " "
+            lines.append(f"|{line}|")
+        return "\n".join(lines)
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{target}={count}" for target, count in sorted(self.messages.items()))
+        return f"{self.path}: {counts} ({self.bytes_received} bytes, font {self.font})"
+
+
+async def run_server(port: int, quiet: bool) -> None:
+    cdus: Dict[str, StandInCdu] = {}
+
+    async def handler(websocket: ServerConnection) -> None:
+        path = websocket.request.path
+        if path not in ENDPOINTS:
+            await websocket.close(code=1008, reason="unknown endpoint")
+            return
+        cdu = cdus.setdefault(path, StandInCdu(path))
+        logging.info("Client connected to %s", path)
+        async for payload in websocket:
+            if not isinstance(payload, str):
+                continue
+            try:
+                cdu.receive(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning("Invalid message on %s: %s", path, e)
+                continue
+            if not quiet:
+                print(f"{cdu.summary()}\n{cdu.render()}", flush=True)
+        logging.info("Client disconnected from %s: %s", path, cdu.summary())
+
+    async with serve(handler, "localhost", port):
+        logging.info("Stand-in CDU server listening on ws://localhost:%s", port)
+        await asyncio.get_running_loop().create_future()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Stand-in MobiFlight CDU websocket server")
+    parser.add_argument("--port", type=int, default=8320)
+    parser.add_argument("--quiet", action="store_true", help="only log connection summaries")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_server(args.port, args.quiet))
+    except KeyboardInterrupt:
+        pass
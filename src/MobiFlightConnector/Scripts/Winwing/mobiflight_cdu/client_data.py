@@ -0,0 +1,156 @@
+"""
+Zero-copy access to SimConnect client data payloads.
+
+`SIMCONNECT_RECV_CLIENT_DATA.dwData` points straight into SimConnect's
+receive buffer. Instead of rebuilding the screen buffer one DWORD at a time
+with `struct.pack`, `payload_view` maps the payload bytes in place and
+`ClientDataBuffer` compares them with the previous payload (a memcmp) before
+copying them, once, into a buffer that is reused for every frame.
+
+`ClientDataRoutes` hands each client data message straight to the handler
+registered for its definition ID, instead of offering it to every handler.
+
+Inside the resident CDU host a script's connection outlives the script
+(`warm_simconnect`), so a script stops its client data requests when it
+ends (`cancel_client_data_request`) instead of only unregistering the
+handler, and at most its own idle connection is kept for the next load.
+"""
+import contextlib
+import ctypes
+import logging
+import weakref
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+from mobiflight_cdu.resident import warm_resource
+
+# Resident group of the SimConnect connections (see resident.warm_resource)
+SIMCONNECT_GROUP = "SimConnect"
+
+_ARRAY_TYPES: Dict[int, Any] = {}
+# Definitions already added per SimConnect connection
+_DEFINITIONS: "weakref.WeakKeyDictionary[Any, Set[int]]" = weakref.WeakKeyDictionary()
+
+
+def payload_view(client_data: Any, size: int) -> Optional[memoryview]:
+    """
+    Return the first `size` bytes of the client data payload as a memoryview
+    over SimConnect's receive buffer, or None if the payload is smaller.
+    The view is only valid inside the dispatch callback that received it.
+    """
+    data = client_data.dwData
+    if ctypes.sizeof(data) < size:
+        return None
+    array_type = _ARRAY_TYPES.get(size)
+    if array_type is None:
+        array_type = _ARRAY_TYPES[size] = ctypes.c_ubyte * size
+    return memoryview(array_type.from_address(ctypes.addressof(data))).cast("B")
+
+
+def simconnect_open(sc: Any) -> bool:
+    """
+    False once the SimConnect wrapper has seen the simulator quit (it sets
+    `quit` and its dispatch thread exits); pass as `valid` to warm_resource.
+    """
+    return getattr(sc, "quit", 0) == 0
+
+
+@contextlib.contextmanager
+def warm_simconnect(factory: Callable[[], Any], close: Callable[[Any], Any]) -> Iterator[Any]:
+    """
+    `warm_resource` for a SimConnect connection: replaced once the simulator
+    has quit, and closed when another script opens its own connection.
+    Connections are not shared between scripts, whose client data area and
+    definition IDs overlap.
+    """
+    with warm_resource(factory, close, valid=simconnect_open, group=SIMCONNECT_GROUP) as sc:
+        yield sc
+
+
+def cancel_client_data_request(sc: Any, area_id: int, request_id: int, definition_id: int) -> Optional[int]:
+    """
+    Stop a `RequestClientData` subscription (period NEVER). On a connection
+    kept open by the resident host the simulator otherwise goes on sending
+    the area after the handler is gone, every visual frame for some areas.
+    """
+    if not simconnect_open(sc):
+        return None
+    from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_PERIOD, SIMCONNECT_CLIENT_DATA_REQUEST_FLAG
+    return sc.dll.RequestClientData(
+        sc.hSimConnect, area_id, request_id, definition_id,
+        SIMCONNECT_CLIENT_DATA_PERIOD.SIMCONNECT_CLIENT_DATA_PERIOD_NEVER,
+        SIMCONNECT_CLIENT_DATA_REQUEST_FLAG.SIMCONNECT_CLIENT_DATA_REQUEST_FLAG_DEFAULT,
+        0, 0, 0,
+    )
+
+
+def add_client_data_definition(sc: Any, definition_id: int, offset: int, size: int) -> Optional[int]:
+    """
+    `AddToClientDataDefinition` for a definition made of one block of bytes.
+    A connection reused by the resident CDU host already holds the definition
+    and adding the block again would double the payload, so repeated calls
+    for the same connection and definition return None without a request.
+    """
+    defined = _DEFINITIONS.setdefault(sc, set())
+    if definition_id in defined:
+        return None
+    hr = sc.dll.AddToClientDataDefinition(sc.hSimConnect, definition_id, offset, size, 0, 0)
+    defined.add(definition_id)
+    return hr
+
+
+class ClientDataBuffer:
+    """
+    Last payload received for one client data definition. `update()` copies
+    a new payload into `data` and returns True only when it differs from the
+    previous one, so unchanged frames are dropped before decoding.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size: int = size
+        self.data: bytearray = bytearray(size)
+        self.updates: int = 0
+        self.unchanged: int = 0
+        self._received: bool = False
+
+    def update(self, client_data: Any) -> bool:
+        view = payload_view(client_data, self.size)
+        if view is None:
+            return False
+        if self._received and self.data == view:
+            self.unchanged += 1
+            return False
+        self.data[:] = view
+        self._received = True
+        self.updates += 1
+        return True
+
+    def reset(self) -> None:
+        """Make the next payload count as changed."""
+        self._received = False
+
+
+class ClientDataRoutes:
+    """Client data handlers of one SimConnect connection, by definition ID."""
+
+    def __init__(self) -> None:
+        self._handlers: Dict[int, Callable[[Any], None]] = {}
+        self.unrouted: int = 0
+
+    def register(self, define_id: int, handler: Callable[[Any], None]) -> None:
+        if self._handlers.get(define_id) != handler:
+            logging.info("Register new client data handler for definition %s", define_id)
+            self._handlers[define_id] = handler
+
+    def unregister(self, define_id: int, handler: Callable[[Any], None]) -> None:
+        if self._handlers.get(define_id) == handler:
+            logging.info("Unregister client data handler for definition %s", define_id)
+            del self._handlers[define_id]
+
+    def dispatch(self, client_data: Any) -> bool:
+        """Call the handler of the message's dwDefineID. Returns False if there is none."""
+        handler = self._handlers.get(client_data.dwDefineID)
+        if handler is None:
+            self.unrouted += 1
+            return False
+        handler(client_data)
+        return True
@@ -0,0 +1,106 @@
+"""
+Draining SimConnect dispatch pump with an adaptive wait.
+
+The SimConnect wrapper dispatches on a thread of its own: it calls
+`CallDispatch`, which hands over at most one message, then sleeps 2 ms, all
+the time. With several CDUs requesting client data at visual frame rate,
+messages wait behind each other for a sleep each, and an idle simulator is
+still polled 500 times a second.
+
+A `DispatchPump` replaces that loop. Override `_run` in the script's
+SimConnect subclass (the wrapper starts it on its thread when connecting):
+
+    class SimConnectMobiFlight(SimConnect):
+        def _run(self):
+            DispatchPump(self, "MD11 SimConnect").run()
+
+Each wake-up drains every pending message with `GetNextDispatch` into the
+connection's `my_dispatch_proc`. The wait before the next wake-up comes from
+a `PollSchedule`: 2 ms while messages keep arriving, backing off to 20 ms
+when the simulator is quiet. A handler that raises is logged and does not
+stop the pump. The pump keeps statistics on queue depth (messages drained
+per wake-up) and dispatch latency (how long the first of them could have
+been waiting), logged at debug level.
+"""
+import ctypes
+import logging
+import time
+from ctypes import POINTER, byref, wintypes
+from typing import Any
+
+from SimConnect.Enum import SIMCONNECT_RECV
+
+from mobiflight_cdu.poll_schedule import PollSchedule
+
+# Seconds between drains while messages arrive, and once the simulator is quiet
+DISPATCH_FAST = 0.002
+DISPATCH_IDLE = 0.02
+S_OK = 0
+# Log statistics every this many non-empty drains (at debug level)
+REPORT_INTERVAL = 5000
+
+
+class DispatchPump:
+    """Drains the messages of one SimConnect connection into its my_dispatch_proc."""
+
+    def __init__(self, sc: Any, name: str = "SimConnect", fast: float = DISPATCH_FAST, idle: float = DISPATCH_IDLE) -> None:
+        self.sc: Any = sc
+        self.name: str = name
+        self.schedule: PollSchedule = PollSchedule(name, fast=fast, idle=idle)
+        self.drains: int = 0
+        self.messages: int = 0
+        self.failures: int = 0
+        self.depth_max: int = 0
+        self.latency_total: float = 0.0
+        self.latency_max: float = 0.0
+
+    def run(self) -> None:
+        """Pump until the connection quits. Runs on the wrapper's dispatch thread."""
+        sc = self.sc
+        # The wrapper declares GetNextDispatch without arguments, and an
+        # HRESULT result would raise once the queue is empty
+        get_next_dispatch = sc.dll.GetNextDispatch
+        get_next_dispatch.argtypes = [wintypes.HANDLE, POINTER(POINTER(SIMCONNECT_RECV)), POINTER(wintypes.DWORD)]
+        get_next_dispatch.restype = ctypes.c_long
+        data = POINTER(SIMCONNECT_RECV)()
+        size = wintypes.DWORD()
+
+        slept_at = time.monotonic()
+        try:
+            while sc.quit == 0:
+                woke_at = time.monotonic()
+                depth = 0
+                while sc.quit == 0 and get_next_dispatch(sc.hSimConnect, byref(data), byref(size)) == S_OK:
+                    depth += 1
+                    try:
+                        sc.my_dispatch_proc(data, size.value, None)
+                    except Exception as e:
+                        self.failures += 1
+                        logging.exception("%s: handling a message failed: %s", self.name, e)
+                if depth:
+                    self._record(depth, woke_at - slept_at)
+                slept_at = time.monotonic()
+                time.sleep(self.schedule.next_interval(depth > 0))
+        except OSError as e:
+            logging.error("%s: dispatch failed: %s", self.name, e)
+            # Mark the connection closed, as the wrapper does when the simulator quits
+            sc.quit = 1
+        finally:
+            logging.debug(self.summary())
+
+    def _record(self, depth: int, latency: float) -> None:
+        self.drains += 1
+        self.messages += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if self.drains % REPORT_INTERVAL == 0:
+            logging.debug(self.summary())
+
+    def summary(self) -> str:
+        depth = self.messages / self.drains if self.drains else 0.0
+        latency = self.latency_total / self.drains if self.drains else 0.0
+        return (f"{self.name} dispatch: {self.messages} messages in {self.drains} drains, "
+                f"queue depth {depth:.1f} average, {self.depth_max} max, "
+                f"latency {latency * 1000:.1f} ms average, {self.latency_max * 1000:.1f} ms max, "
+                f"{self.failures} handler failures")
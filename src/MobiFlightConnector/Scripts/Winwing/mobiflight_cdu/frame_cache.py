@@ -0,0 +1,174 @@
+"""
+Content-addressed cache of encoded display frames.
+
+Pilots flip between the same handful of CDU pages, and every time a page
+comes back the scripts used to decode and serialize it from scratch. A
+`FrameCache` maps a hash of the raw source snapshot (a SimConnect buffer,
+X-Plane dataref values, an XML screen, ...) to the JSON payload that was
+produced for it, bounded by a byte budget and evicted least recently used
+first.
+
+Wrap a pure encoding function to use it:
+
+    @cached_frames()
+    def create_mobi_json(data: bytes) -> str:
+        ...
+
+The wrapper hashes the call arguments with `snapshot_key`, so the function
+must only depend on its arguments. The returned payload is identical to what
+the function would have returned.
+"""
+import functools
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# Roughly 150-250 full display frames
+DEFAULT_MAX_BYTES = 1024 * 1024
+# Log cache statistics every this many lookups (at debug level)
+REPORT_INTERVAL = 1000
+
+
+# Flat containers of these types are hashed through their repr(), which is
+# unambiguous for them and much faster than feeding every item separately.
+_PLAIN = frozenset((str, bytes, int, float, bool, type(None)))
+
+
+def _feed_repr(digest: Any, tag: bytes, value: Any) -> None:
+    data = repr(value).encode("utf-8", "surrogatepass")
+    digest.update(b"%s%d:" % (tag, len(data)))
+    digest.update(data)
+
+
+def _feed(digest: Any, value: Any) -> None:
+    # Every value is prefixed with its type and length so that different
+    # structures never feed the same byte sequence into the digest.
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(b"b%d:" % len(value))
+        digest.update(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        digest.update(b"s%d:" % len(data))
+        digest.update(data)
+    elif isinstance(value, dict):
+        if _PLAIN.issuperset(map(type, value)) and _PLAIN.issuperset(map(type, value.values())):
+            _feed_repr(digest, b"D", value)
+            return
+        digest.update(b"d%d:" % len(value))
+        for key, item in value.items():
+            _feed(digest, key)
+            _feed(digest, item)
+    elif isinstance(value, (list, tuple)):
+        if _PLAIN.issuperset(map(type, value)):
+            _feed_repr(digest, b"L", value)
+            return
+        digest.update(b"l%d:" % len(value))
+        for item in value:
+            _feed(digest, item)
+    elif value is None or isinstance(value, (bool, int, float)):
+        data = repr(value).encode()
+        digest.update(b"r%d:" % len(data))
+        digest.update(data)
+    else:
+        # Anything else (ctypes structures, file handles, ...) has no stable
+        # content representation and would produce stale cache hits.
+        raise TypeError(f"Cannot build a snapshot key from {type(value).__name__}")
+
+
+def snapshot_key(*parts: Any) -> bytes:
+    """128-bit BLAKE2b digest of bytes, strings, numbers and dicts/lists of them."""
+    digest = hashlib.blake2b(digest_size=16)
+    _feed(digest, parts)
+    return digest.digest()
+
+
+class FrameCache:
+    """
+    Bounded LRU map from snapshot key to encoded payload. The byte budget
+    counts the payload length plus the key; a payload larger than the whole
+    budget is not cached.
+    """
+
+    def __init__(self, name: str = "frames", max_bytes: int = DEFAULT_MAX_BYTES, report_interval: int = REPORT_INTERVAL) -> None:
+        self.name: str = name
+        self.max_bytes: int = max_bytes
+        self.report_interval: int = report_interval
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: "OrderedDict[bytes, str]" = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: bytes) -> Optional[str]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            lookups = self.hits + self.misses
+        if self.report_interval and lookups % self.report_interval == 0:
+            logging.debug(self.summary())
+        return payload
+
+    def put(self, key: bytes, payload: str) -> None:
+        size = len(key) + len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(key) + len(previous)
+            self._entries[key] = payload
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, old_payload = self._entries.popitem(last=False)
+                self.bytes -= len(old_key) + len(old_payload)
+                self.evictions += 1
+
+    def encode(self, key: bytes, encoder: Callable[[], str]) -> str:
+        """Return the cached payload for key, calling encoder on a miss."""
+        payload = self.get(key)
+        if payload is None:
+            payload = encoder()
+            self.put(key, payload)
+        return payload
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def summary(self) -> str:
+        return (f"Frame cache {self.name}: {self.hit_rate:.0%} hits ({self.hits}/{self.hits + self.misses}), "
+                f"{len(self._entries)} frames, {self.bytes}/{self.max_bytes} bytes, {self.evictions} evictions")
+
+
+def cached_frames(cache: Optional[FrameCache] = None) -> Callable[[Callable[..., str]], Callable[..., str]]:
+    """
+    Decorator caching a pure `(*snapshot) -> payload` encoding function in a
+    FrameCache (a new one per function unless one is given). The cache is
+    available as the `frame_cache` attribute of the wrapped function.
+    """
+    def decorate(encode: Callable[..., str]) -> Callable[..., str]:
+        frames = cache if cache is not None else FrameCache(encode.__qualname__)
+
+        @functools.wraps(encode)
+        def wrapper(*snapshot: Any) -> str:
+            return frames.encode(snapshot_key(*snapshot), lambda: encode(*snapshot))
+
+        wrapper.frame_cache = frames  # type: ignore[attr-defined]
+        return wrapper
+    return decorate
@@ -0,0 +1,158 @@
+"""
+Local stand-in for the FSLabs MCDU web API.
+
+Serves `GET /MCDU/Display/<id>` over keep-alive HTTP/1.1 like the aircraft
+does (http://localhost:8080), so fslabs_winwing_cdu.py can be exercised
+without the simulator. The screens come from a recording made with
+`--record`, played back in a loop, or, without one, from a generated test
+page with a running clock. `--delay` holds every response back to try out
+slow aircraft. Stop the simulator first, or pass a different --port.
+
+    python -m mobiflight_cdu.fslabs_standin --record fsl_mcdu.json    # with the aircraft running
+    python -m mobiflight_cdu.fslabs_standin [--port 8080] [fsl_mcdu.json] [--interval 2] [--delay 0]
+
+A recording is a JSON object of MCDU id to the list of distinct raw
+response bodies seen, in order.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from mobiflight_cdu.http_client import HttpError, KeepAliveClient
+
+MCDUS = ("3CA1", "3CA2")
+PATH_PREFIX = "/MCDU/Display/"
+CDU_COLUMNS = 24
+CDU_ROWS = 14
+# Seconds between polls while recording, as fslabs_winwing_cdu.py polls
+RECORD_INTERVAL = 0.3
+
+
+def test_page(mcdu: str) -> bytes:
+    """A generated screen for mcdu showing the current time."""
+    lines = [f"FSLABS STAND-IN {mcdu}", "", time.strftime("%H:%M:%S")]
+    cells: List[list] = []
+    for row in range(CDU_ROWS):
+        text = lines[row] if row < len(lines) else ""
+        for col in range(CDU_COLUMNS):
+            char = text[col] if col < len(text) else " "
+            cells.append([] if char == " " else [ord(char), 4 if row == 0 else 7, 1 if row % 2 else 0])
+    return json.dumps({"Value": cells}).encode()
+
+
+class StandInFslabs:
+    """Recorded (or generated) screens per MCDU, advanced every interval."""
+
+    def __init__(self, recording: Optional[Dict[str, List[str]]], interval: float, delay: float) -> None:
+        self.recording: Optional[Dict[str, List[bytes]]] = (
+            {mcdu: [body.encode() for body in bodies] for mcdu, bodies in recording.items()}
+            if recording is not None else None
+        )
+        self.interval: float = interval
+        self.delay: float = delay
+        self.started: float = time.monotonic()
+        self.requests: int = 0
+
+    def body(self, mcdu: str) -> Optional[bytes]:
+        if self.recording is None:
+            return test_page(mcdu) if mcdu in MCDUS else None
+        bodies = self.recording.get(mcdu)
+        if not bodies:
+            return None
+        frame = int((time.monotonic() - self.started) / self.interval) if self.interval > 0 else 0
+        return bodies[frame % len(bodies)]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        logging.info("Client connected from %s", peer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "connection" and value.strip().lower() == "close":
+                        keep_alive = False
+                self.requests += 1
+                parts = request_line.decode("latin-1").split()
+                path = parts[1] if len(parts) > 1 else ""
+                body = self.body(path[len(PATH_PREFIX):]) if path.startswith(PATH_PREFIX) else None
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                status = "200 OK" if body is not None else "404 Not Found"
+                body = body if body is not None else b"Not Found"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            logging.info("Client %s disconnected after %s requests in total", peer, self.requests)
+
+
+async def run_server(port: int, recording: Optional[Dict[str, List[str]]], interval: float, delay: float) -> None:
+    standin = StandInFslabs(recording, interval, delay)
+    server = await asyncio.start_server(standin.handle, "localhost", port)
+    async with server:
+        logging.info("Stand-in FSLabs MCDU server listening on http://localhost:%s%s<id>", port, PATH_PREFIX)
+        await server.serve_forever()
+
+
+async def record(path: str, port: int) -> None:
+    """Poll the aircraft and save every distinct screen to path until interrupted."""
+    client = KeepAliveClient("localhost", port)
+    recording: Dict[str, List[str]] = {mcdu: [] for mcdu in MCDUS}
+    try:
+        while True:
+            try:
+                responses = await client.get_many([PATH_PREFIX + mcdu for mcdu in MCDUS])
+            except (OSError, asyncio.TimeoutError, HttpError) as e:
+                logging.warning("Cannot reach FSLabs at port %s: %s", port, e)
+                await asyncio.sleep(2)
+                continue
+            for mcdu, response in zip(MCDUS, responses):
+                body = response.body.decode()
+                if response.status == 200 and (not recording[mcdu] or recording[mcdu][-1] != body):
+                    recording[mcdu].append(body)
+                    logging.info("Recorded screen %s of %s", len(recording[mcdu]), mcdu)
+            await asyncio.sleep(RECORD_INTERVAL)
+    finally:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(recording, f)
+        logging.info("Saved %s", path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Stand-in FSLabs MCDU web API")
+    parser.add_argument("recording", nargs="?", help="recording to play back instead of the test page")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds per recorded screen")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to hold back every response")
+    parser.add_argument("--record", metavar="PATH", help="record the screens of the running aircraft to PATH instead of serving")
+    args = parser.parse_args()
+    try:
+        if args.record:
+            asyncio.run(record(args.record, args.port))
+        else:
+            recording = None
+            if args.recording:
+                with open(args.recording, encoding="utf-8") as f:
+                    recording = json.load(f)
+            asyncio.run(run_server(args.port, recording, args.interval, args.delay))
+    except KeyboardInterrupt:
+        pass
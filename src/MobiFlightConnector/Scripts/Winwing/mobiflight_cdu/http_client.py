@@ -0,0 +1,190 @@
+"""
+Non-blocking keep-alive HTTP/1.1 client for polling simulator web APIs.
+
+The FSLabs script used to poll each MCDU with a blocking http.client
+connection on the event loop, so a slow answer from the aircraft froze both
+CDUs and their websocket keepalives until the 1 s timeout. A
+`KeepAliveClient` runs on asyncio streams instead, keeps one connection open
+and pipelines the requests of a poll on it:
+
+    client = KeepAliveClient("localhost", 8080, timeout=1.0)
+    captain, first_officer = await client.get_many(["/MCDU/Display/3CA1", "/MCDU/Display/3CA2"])
+
+Every response has to arrive within `timeout` of its request being sent.
+A late, malformed or cut-off response closes the connection (the stream
+cannot be resynchronised behind it) and raises; the next poll reconnects.
+The client keeps round-trip time statistics per poll (`summary()`).
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+# Log statistics every this many polls (at debug level)
+REPORT_INTERVAL = 1000
+
+
+class HttpError(Exception):
+    """The server sent something that is not a usable HTTP/1.1 response."""
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    body: bytes
+    # Header names in lower case
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class KeepAliveClient:
+    """Pipelined GET requests to one HTTP/1.1 server over a persistent connection."""
+
+    def __init__(self, host: str, port: int, timeout: float = 1.0) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.timeout: float = timeout
+        self.polls: int = 0
+        self.failures: int = 0
+        self.connects: int = 0
+        self.rtt_last: float = 0.0
+        self.rtt_total: float = 0.0
+        self.rtt_max: float = 0.0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    @property
+    def rtt_average(self) -> float:
+        return self.rtt_total / self.polls if self.polls else 0.0
+
+    async def get(self, path: str) -> HttpResponse:
+        return (await self.get_many([path]))[0]
+
+    async def get_many(self, paths: Sequence[str]) -> List[HttpResponse]:
+        """GET all paths, pipelined, and return the responses in the same order."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            responses: List[HttpResponse] = []
+            try:
+                # A server may close the connection after any response; the
+                # requests behind it are sent again on a new one.
+                while len(responses) < len(paths):
+                    pending = paths[len(responses):]
+                    deadline = loop.time() + self.timeout
+                    reused = self._writer is not None
+                    if not reused:
+                        await asyncio.wait_for(self._connect(), self.timeout)
+                    self._writer.write(b"".join(self._request(path) for path in pending))
+                    await asyncio.wait_for(self._writer.drain(), max(deadline - loop.time(), 0))
+                    for index in range(len(pending)):
+                        response = await asyncio.wait_for(self._read_response(), max(deadline - loop.time(), 0))
+                        if response is None:
+                            if reused and index == 0:
+                                # The server dropped the idle connection before our requests
+                                await self._disconnect()
+                                break
+                            raise HttpError(f"{self.host}:{self.port} closed the connection")
+                        responses.append(response)
+                        if not response.keep_alive:
+                            await self._disconnect()
+                            break
+            except (OSError, asyncio.TimeoutError, HttpError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                self.failures += 1
+                await self._disconnect()
+                if not isinstance(e, (OSError, asyncio.TimeoutError, HttpError)):
+                    raise HttpError(f"Invalid response from {self.host}:{self.port}: {e}") from e
+                raise
+            except BaseException:
+                # Cancelled mid-response: the stream position is unknown
+                self._drop()
+                raise
+
+            rtt = loop.time() - started
+            self.polls += 1
+            self.rtt_last = rtt
+            self.rtt_total += rtt
+            self.rtt_max = max(self.rtt_max, rtt)
+            if self.polls % REPORT_INTERVAL == 0:
+                logging.debug(self.summary())
+            return responses
+
+    def _request(self, path: str) -> bytes:
+        return f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: keep-alive\r\n\r\n".encode("ascii")
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+        logging.debug("HTTP connection %s to %s:%s", self.connects, self.host, self.port)
+
+    async def _read_response(self) -> Optional[HttpResponse]:
+        """The next response, None if the connection was closed before it started."""
+        reader = self._reader
+        status_line = await reader.readline()
+        if not status_line:
+            return None
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise HttpError(f"Invalid status line from {self.host}:{self.port}: {status_line!r}")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self._read_chunked()
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # Delimited by the end of the connection
+            body = await reader.read()
+            headers["connection"] = "close"
+        return HttpResponse(int(parts[1]), body, headers)
+
+    async def _read_chunked(self) -> bytes:
+        reader = self._reader
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b";", 1)[0], 16)
+            except ValueError:
+                raise HttpError(f"Invalid chunk size from {self.host}:{self.port}: {size_line!r}") from None
+            if size == 0:
+                # Skip trailers up to the final empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def _drop(self) -> Optional[asyncio.StreamWriter]:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+        return writer
+
+    async def _disconnect(self) -> None:
+        writer = self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._disconnect()
+
+    def summary(self) -> str:
+        return (f"HTTP {self.host}:{self.port}: {self.polls} polls, round trip {self.rtt_last * 1000:.0f} ms last, "
+                f"{self.rtt_average * 1000:.0f} ms average, {self.rtt_max * 1000:.0f} ms max, "
+                f"{self.failures} failures, {self.connects} connections")
@@ -0,0 +1,122 @@
+"""
+Benchmark of the iFly 737 CDU conversion on synthetic SDK memory maps.
+
+Fills an anonymous memory map with the NG and the MAX SDK layout, draws a
+random CDU page in it and times, per frame:
+
+- the original conversion: reading the whole structure with
+  `from_buffer_copy` and indexing LSKChar / LSK_SmallFont / LSK_Color cell
+  by cell (`reference_json` below),
+- the current one: `create_cdu_mobi_json` on a `CduScreenView`,
+- a poll of an unchanged screen, which only fingerprints it.
+
+Both conversions are checked to produce the same frame. Run it from the
+Winwing folder:
+
+    python -m mobiflight_cdu.ifly_benchmark [--frames 2000] [--seed 1]
+"""
+import argparse
+import ctypes
+import json
+import mmap
+import random
+import time
+from typing import Callable, Union
+
+from ifly_737_winwing_cdu import (
+    COLOR_MAP,
+    COLUMNS,
+    ROWS,
+    CduScreenView,
+    ShareMemory737MAXSDK,
+    ShareMemory737NGSDK2,
+    create_cdu_mobi_json,
+    iFlySDK_Identifier,
+)
+
+Screen = Union[ShareMemory737MAXSDK, ShareMemory737NGSDK2]
+
+
+def fill_page(screen: Screen, rng: random.Random) -> None:
+    """Draw a random page on both CDUs: mostly blank, some text, a few special glyphs."""
+    max_sdk = isinstance(screen, ShareMemory737MAXSDK)
+    text = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/.-<>"
+    for cdu_index in range(2):
+        for row in range(ROWS):
+            for col in range(COLUMNS):
+                blank = rng.random() < 0.55
+                char = " " if blank else rng.choice(text)
+                screen.LSKChar[cdu_index][row][col] = char.encode("ascii") if max_sdk else ord(char)
+                screen.LSK_SmallFont[cdu_index][row][col] = row % 2 == 1
+                screen.LSK_Color[cdu_index][row][col] = 0 if blank else rng.choice((0, 0, 1, 2, 3, 4, 5, 7, 9, 10))
+
+
+def reference_json(memory: mmap.mmap, structure: type, cdu_index: int) -> str:
+    """The conversion as it was before the memory map was viewed in place."""
+    memory.seek(0)
+    memory_map = structure.from_buffer_copy(memory.read(ctypes.sizeof(structure)))
+    data = []
+    for row in range(ROWS):
+        for col in range(COLUMNS):
+            char_raw = memory_map.LSKChar[cdu_index][row][col]
+            if isinstance(char_raw, bytes):
+                char = char_raw.decode("ascii", errors="replace")
+            else:
+                char = chr(char_raw)
+
+            small_font = memory_map.LSK_SmallFont[cdu_index][row][col]
+            color = memory_map.LSK_Color[cdu_index][row][col]
+
+            if color == 0 and char in [" ", "\0"]:
+                data.append([])
+            else:
+                if color == 5:
+                    char = "☐"
+                elif color == 9:
+                    char = "←"
+                elif color == 10:
+                    char = "→"
+                elif color in (6, 7, 8):
+                    char = "°"
+                data.append([char, COLOR_MAP.get(color, "w"), 1 if small_font else 0])
+    return json.dumps({"Target": "Display", "Data": data})
+
+
+def per_frame(function: Callable[[], object], frames: int) -> float:
+    """Microseconds per call of function."""
+    started = time.perf_counter()
+    for _ in range(frames):
+        function()
+    return (time.perf_counter() - started) / frames * 1e6
+
+
+def run(frames: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for name, sdk, structure in (
+        ("NG", iFlySDK_Identifier.SDK_NG, ShareMemory737NGSDK2),
+        ("MAX", iFlySDK_Identifier.SDK_MAX, ShareMemory737MAXSDK),
+    ):
+        screen = structure()
+        fill_page(screen, rng)
+        memory = mmap.mmap(-1, ctypes.sizeof(structure))
+        memory[:] = bytes(screen)
+        view = CduScreenView(memory, sdk, 0)
+        try:
+            if create_cdu_mobi_json(view) != reference_json(memory, structure, 0):
+                raise SystemExit(f"{name}: the conversions differ")
+            reference = per_frame(lambda: reference_json(memory, structure, 0), frames)
+            current = per_frame(lambda: create_cdu_mobi_json(view), frames)
+            unchanged = per_frame(view.fingerprint, frames)
+        finally:
+            view.release()
+            memory.close()
+        print(f"{name:>3}: original {reference:8.1f} us/frame, current {current:6.1f} us/frame "
+              f"({reference / current:.0f}x), unchanged poll {unchanged:.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the iFly 737 CDU conversion")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.frames, args.seed)
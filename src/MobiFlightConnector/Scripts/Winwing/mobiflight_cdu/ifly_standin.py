@@ -0,0 +1,108 @@
+"""
+Local stand-in for the iFly 737 SDK shared memory.
+
+Writes the NG or MAX SDK structure to a file named like the aircraft's
+memory map and keeps updating it, so ifly_737_winwing_cdu.py can be
+exercised without the simulator, on any OS. Point the script at the
+directory with the IFLY_SDK_DIR environment variable; it then maps the file
+instead of the named memory map. Both CDUs show a test page with a running
+clock. Run it from the Winwing folder:
+
+    python -m mobiflight_cdu.ifly_standin DIR [--variant max|ng] [--interval 1] [--power-cycle 0]
+
+`--power-cycle` switches the NG's CDUs off and on every that many seconds.
+The file is left behind with iFly's state set to 0 (not running).
+"""
+import argparse
+import ctypes
+import logging
+import mmap
+import os
+import time
+from typing import Union
+
+from ifly_737_winwing_cdu import (
+    COLUMNS,
+    MAX_SDK_MEMORY_MAP_NAME,
+    NG_SDK2_MEMORY_MAP_NAME,
+    ROWS,
+    ShareMemory737MAXSDK,
+    ShareMemory737NGSDK2,
+)
+
+Screen = Union[ShareMemory737MAXSDK, ShareMemory737NGSDK2]
+
+# iFly colour codes used on the test page
+GREEN = 1
+CYAN = 2
+MAGENTA = 3
+
+
+def draw(screen: Screen, cdu_index: int, powered: bool) -> None:
+    """Draw the test page of one CDU with the current time."""
+    lines = [
+        (f"IFLY STAND-IN CDU {cdu_index + 1}", CYAN, False),
+        ("", 0, False),
+        ("LOCAL TIME", 0, True),
+        (time.strftime("%H:%M:%S"), GREEN, False),
+        ("", 0, False),
+        ("POWER", 0, True),
+        ("ON" if powered else "OFF", MAGENTA, False),
+    ]
+    max_sdk = isinstance(screen, ShareMemory737MAXSDK)
+    for row in range(ROWS):
+        text, color, small = lines[row] if row < len(lines) else ("", 0, False)
+        for col in range(COLUMNS):
+            char = text[col] if col < len(text) else " "
+            screen.LSKChar[cdu_index][row][col] = char.encode("ascii") if max_sdk else ord(char)
+            screen.LSK_SmallFont[cdu_index][row][col] = small
+            screen.LSK_Color[cdu_index][row][col] = color if char != " " else 0
+
+
+def run(directory: str, variant: str, interval: float, power_cycle: float) -> None:
+    if variant == "max":
+        name, screen = MAX_SDK_MEMORY_MAP_NAME, ShareMemory737MAXSDK()
+    else:
+        name, screen = NG_SDK2_MEMORY_MAP_NAME, ShareMemory737NGSDK2()
+    size = ctypes.sizeof(screen)
+    path = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w+b") as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as memory:
+            logging.info("Writing the iFly 737 %s SDK memory map to %s (%s bytes)", variant.upper(), path, size)
+            started = time.monotonic()
+            try:
+                while True:
+                    powered = not power_cycle or int((time.monotonic() - started) / power_cycle) % 2 == 0
+                    for cdu_index in range(2):
+                        draw(screen, cdu_index, powered)
+                    if isinstance(screen, ShareMemory737MAXSDK):
+                        screen.iFly737MAX_State = 1
+                    else:
+                        screen.iFly737NG_State = 1
+                        screen.CDU_Can_Display[0] = screen.CDU_Can_Display[1] = powered
+                    memory[:] = bytes(screen)
+                    time.sleep(interval)
+            finally:
+                state = ShareMemory737MAXSDK.iFly737MAX_State if variant == "max" else ShareMemory737NGSDK2.iFly737NG_State
+                memory[state.offset:state.offset + state.size] = bytes(state.size)
+                logging.info("iFly state set to not running")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Stand-in iFly 737 SDK shared memory")
+    parser.add_argument("directory", help="directory to write the memory map file to (IFLY_SDK_DIR)")
+    parser.add_argument("--variant", choices=("max", "ng"), default="max")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between updates")
+    parser.add_argument("--power-cycle", type=float, default=0.0, help="NG only: seconds between switching the CDUs off and on")
+    args = parser.parse_args()
+    try:
+        run(args.directory, args.variant, args.interval, args.power_cycle)
+    except KeyboardInterrupt:
+        pass
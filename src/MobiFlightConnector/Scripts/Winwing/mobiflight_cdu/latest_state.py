@@ -0,0 +1,166 @@
+"""
+Conflating hand-off between a script's simulator side and its CDU sender.
+
+The X-Plane scripts used to push a copy of all the CDU's values into an
+unbounded asyncio.Queue on every change, and the sender rendered every
+queued copy in turn, sleeping between them. A burst of page changes was
+replayed page by page, further and further behind the simulator.
+
+A `LatestState` holds only the current state. The producer merges changes
+into it; the consumer wakes at most once per interval and takes whatever is
+current:
+
+    state = LatestState(0.1, "CDU fmc1")
+    state.update({"laminar/B738/fmc1/Line01_L": "..."})    # producer
+    values = await state.take()                             # consumer
+
+States that are superseded before the consumer gets to them are skipped
+(and counted). A change is taken at most one interval after it arrives, no
+matter how fast the simulator sends them.
+
+A `DatarefStore` does the same for raw X-Plane dataref values: it decodes a
+value only when its raw form changed, and `take()` returns the names that
+changed rather than a copy of every value.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Set
+
+# Log statistics every this many states taken (at debug level)
+REPORT_INTERVAL = 500
+
+
+class LatestState:
+    """
+    The current value of a state that is rendered at most once per interval.
+    Dicts are updated key by key (`update`), anything else is replaced
+    whole (`set`). `take` returns a copy the producer will not touch.
+    """
+
+    def __init__(self, interval: float, name: str = "state") -> None:
+        self.interval: float = interval
+        self.name: str = name
+        self.taken: int = 0
+        self.skipped: int = 0
+        self.latency_total: float = 0.0
+        self.latency_max: float = 0.0
+        self._state: Any = {}
+        # When the oldest change not yet taken arrived, None if there is none
+        self._pending_since: Optional[float] = None
+        self._last_take: float = float("-inf")
+        self._ready: asyncio.Event = asyncio.Event()
+
+    def update(self, changes: Mapping[Any, Any]) -> bool:
+        """Merge changes into a dict state. Returns True if anything changed."""
+        state = self._state
+        changed = False
+        for key, value in changes.items():
+            if key not in state or state[key] != value:
+                state[key] = value
+                changed = True
+        if changed:
+            self._changed()
+        return changed
+
+    def set(self, state: Any) -> bool:
+        """Replace the state. Returns True if it differs from the current one."""
+        if state == self._state:
+            return False
+        self._state = state
+        self._changed()
+        return True
+
+    def _changed(self) -> None:
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        else:
+            # The previous state was never taken
+            self.skipped += 1
+        self._ready.set()
+
+    def retry(self) -> None:
+        """Hand out the current state again, e.g. after sending it failed."""
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._ready.set()
+
+    async def take(self) -> Any:
+        """Wait for a change and the end of the interval, then return the current state."""
+        await self._wait()
+        state = self._state
+        if isinstance(state, dict):
+            return dict(state)
+        if isinstance(state, list):
+            return list(state)
+        return state
+
+    async def _wait(self) -> None:
+        while self._pending_since is None:
+            self._ready.clear()
+            await self._ready.wait()
+        delay = self._last_take + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        now = time.monotonic()
+        latency = now - self._pending_since
+        self._pending_since = None
+        self._ready.clear()
+        self._last_take = now
+        self.taken += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if self.taken % REPORT_INTERVAL == 0:
+            logging.debug(self.summary())
+
+    def summary(self) -> str:
+        average = self.latency_total / self.taken if self.taken else 0.0
+        return (f"{self.name}: {self.taken} states taken, {self.skipped} skipped, "
+                f"latency {average * 1000:.0f} ms average, {self.latency_max * 1000:.0f} ms max")
+
+
+class DatarefStore(LatestState):
+    """
+    Latest decoded values of a CDU's datarefs, by name, in `values`.
+
+    `update()` takes raw values as sent by X-Plane. A value whose raw form is
+    unchanged is skipped without decoding; a changed one is decoded with
+    `decode(name, raw)` (if given) and gets the next version number in
+    `versions`.
+    `take()` returns the names that changed since the previous take (empty
+    after a `retry()` without changes). `values` is updated in place, so read
+    it before the next await.
+    """
+
+    def __init__(self, interval: float, name: str = "datarefs", decode: Optional[Callable[[str, Any], Any]] = None) -> None:
+        super().__init__(interval, name)
+        self.decode: Optional[Callable[[str, Any], Any]] = decode
+        self.values: Dict[str, Any] = self._state
+        self.raw: Dict[str, Any] = {}
+        # Store-wide counter; versions[name] is its value when name last changed
+        self.version: int = 0
+        self.versions: Dict[str, int] = {}
+        self._changed_names: Set[str] = set()
+
+    def update(self, changes: Mapping[str, Any]) -> bool:
+        raw = self.raw
+        changed = False
+        for name, value in changes.items():
+            if name in raw and raw[name] == value:
+                continue
+            raw[name] = value
+            self.values[name] = value if self.decode is None else self.decode(name, value)
+            self.version += 1
+            self.versions[name] = self.version
+            self._changed_names.add(name)
+            changed = True
+        if changed:
+            self._changed()
+        return changed
+
+    async def take(self) -> Set[str]:
+        """Wait for a change and the end of the interval, then return the changed names."""
+        await self._wait()
+        changed, self._changed_names = self._changed_names, set()
+        return changed
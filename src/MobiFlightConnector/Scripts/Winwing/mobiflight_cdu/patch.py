@@ -0,0 +1,158 @@
+"""
+Cell-level delta frames ("DisplayPatch") for the MobiFlight CDU websocket.
+
+A full display message carries all 14 x 24 cells:
+
+    {"Target": "Display", "Data": [cell, cell, ...]}
+
+A patch message only carries the spans of cells that changed since the last
+frame sent on the same connection. Each span is the row-major index of its
+first cell followed by the new cells:
+
+    {"Target": "DisplayPatch", "Data": [[start, [cell, ...]], ...]}
+
+MobiFlight applies the spans on top of the last display it received. The
+sender falls back to a full frame after a (re)connect, when most cells
+changed, and every `resync_interval` patches so a receiver that lost its base
+frame recovers on its own.
+
+Producers that build the cell list themselves can pass the list instead of
+its JSON (and must not change it afterwards); it is then only serialised
+when it goes out as a full frame:
+
+    payload = patcher.encode(cells)
+"""
+import json
+from typing import Any, List, Optional, Tuple, Union
+
+DISPLAY_TARGET = "Display"
+PATCH_TARGET = "DisplayPatch"
+
+# Send a full frame once more than this share of the cells changed.
+FULL_FRAME_RATIO = 0.5
+# Unchanged cells between two changed spans are cheaper to resend than the
+# overhead of opening a new span (`],[123,[` is longer than a few `[]`).
+MERGE_GAP = 3
+# Send a full frame after this many consecutive patches.
+RESYNC_INTERVAL = 100
+
+Cell = List[Any]
+Span = Tuple[int, int]
+
+
+def changed_spans(old_cells: List[Cell], new_cells: List[Cell], merge_gap: int = MERGE_GAP) -> List[Span]:
+    """Return (start, end) index pairs (end exclusive) of cells that differ."""
+    spans: List[Span] = []
+    start = end = -1
+    for index, (old, new) in enumerate(zip(old_cells, new_cells)):
+        if old == new:
+            continue
+        if start >= 0 and index - end <= merge_gap:
+            end = index + 1
+            continue
+        if start >= 0:
+            spans.append((start, end))
+        start, end = index, index + 1
+    if start >= 0:
+        spans.append((start, end))
+    return spans
+
+
+def encode_display(cells: List[Cell]) -> str:
+    return json.dumps({"Target": DISPLAY_TARGET, "Data": cells})
+
+
+def encode_patch(cells: List[Cell], spans: List[Span]) -> str:
+    return json.dumps({"Target": PATCH_TARGET, "Data": [[start, cells[start:end]] for start, end in spans]})
+
+
+class DisplayPatcher:
+    """
+    Turns full display frames into patches against the last frame sent on
+    one endpoint. Call `reset()` whenever the connection is (re)established or
+    a send fails, so the next frame goes out in full.
+    """
+
+    def __init__(self, full_frame_ratio: float = FULL_FRAME_RATIO, resync_interval: int = RESYNC_INTERVAL) -> None:
+        self.full_frame_ratio: float = full_frame_ratio
+        self.resync_interval: int = resync_interval
+        self.full_frames: int = 0
+        self.patches: int = 0
+        self.unchanged: int = 0
+        self._cells: Optional[List[Cell]] = None
+        self._frame: Optional[str] = None
+        self._patches_since_full: int = 0
+
+    def reset(self) -> None:
+        self._cells = None
+        self._frame = None
+
+    def encode(self, frame: Union[str, List[Cell]]) -> Optional[str]:
+        """
+        Return the message to send for frame: the full frame, a patch, or
+        None when the display did not change. frame is a message string or
+        the cell list of a display frame. Non-display messages are passed
+        through unchanged.
+        """
+        if not isinstance(frame, str):
+            return self._encode_cells(frame, None)
+        if frame == self._frame and self._cells is not None:
+            # Byte-identical to the last frame: nothing to parse or compare
+            self.unchanged += 1
+            return None
+        try:
+            message = json.loads(frame)
+        except ValueError:
+            self.reset()
+            return frame
+        if not isinstance(message, dict) or message.get("Target") != DISPLAY_TARGET:
+            return frame
+        payload = self._encode_cells(message["Data"], frame)
+        self._frame = frame
+        return payload
+
+    def _encode_cells(self, cells: List[Cell], frame: Optional[str]) -> Optional[str]:
+        previous, self._cells = self._cells, cells
+        self._frame = None
+
+        if (previous is None
+                or len(previous) != len(cells)
+                or self._patches_since_full >= self.resync_interval):
+            return self._full(cells, frame)
+
+        spans = changed_spans(previous, cells)
+        if not spans:
+            self.unchanged += 1
+            return None
+        if sum(end - start for start, end in spans) > len(cells) * self.full_frame_ratio:
+            return self._full(cells, frame)
+
+        self.patches += 1
+        self._patches_since_full += 1
+        return encode_patch(cells, spans)
+
+    def _full(self, cells: List[Cell], frame: Optional[str]) -> str:
+        self.full_frames += 1
+        self._patches_since_full = 0
+        return frame if frame is not None else encode_display(cells)
+
+
+def apply_message(cells: Optional[List[Cell]], payload: str) -> Optional[List[Cell]]:
+    """
+    Reference decoder: return the display after applying a Display or
+    DisplayPatch message to cells (the previous display, or None).
+    A patch without a base display is ignored, like MobiFlight does.
+    """
+    message = json.loads(payload)
+    target = message.get("Target")
+    if target == DISPLAY_TARGET:
+        return list(message["Data"])
+    if target != PATCH_TARGET or cells is None:
+        return cells
+    cells = list(cells)
+    for start, span in message["Data"]:
+        for offset, cell in enumerate(span):
+            index = start + offset
+            if 0 <= index < len(cells):
+                cells[index] = cell
+    return cells
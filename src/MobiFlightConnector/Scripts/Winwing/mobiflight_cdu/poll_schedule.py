@@ -0,0 +1,85 @@
+"""
+Adaptive poll intervals for CDU sources that have to be polled.
+
+The iFly, FSLabs, TFDI and EC135 scripts used to poll on fixed timers
+(every 0.1-0.3 s) whether or not anything happened. Typing on the CDU
+waited up to a whole interval for each keystroke to show up, and a static
+or switched-off screen was read just as often as a busy one.
+
+A `PollSchedule` picks the delay before the next poll from what the last
+one saw. It polls every `fast` seconds for `hold` seconds after a change,
+then backs off step by step to `idle`. While the source reports that it is
+not active (no power, simulator not running), it only polls every `off`
+seconds:
+
+    schedule = PollSchedule("iFly CDU 0", fast=0.025, idle=0.2)
+    while True:
+        changed, powered = read_screen()
+        await schedule.sleep(changed, powered)                  # asyncio
+        # stop.wait(schedule.next_interval(changed, powered))   # threads
+
+A source that powers up or comes back shows a new screen, which counts as
+a change and switches straight back to fast polling.
+"""
+import asyncio
+import logging
+import time
+
+# Defaults, in seconds
+FAST_INTERVAL = 0.025
+IDLE_INTERVAL = 0.25
+OFF_INTERVAL = 1.0
+HOLD_TIME = 1.0
+# Factor the interval grows by per quiet poll once the hold time is over
+BACKOFF = 1.5
+# Log statistics every this many polls (at debug level)
+REPORT_INTERVAL = 2000
+
+
+class PollSchedule:
+    """Delay before the next poll of one source, fast after a change and slow when idle."""
+
+    def __init__(
+        self,
+        name: str = "source",
+        fast: float = FAST_INTERVAL,
+        idle: float = IDLE_INTERVAL,
+        off: float = OFF_INTERVAL,
+        hold: float = HOLD_TIME,
+    ) -> None:
+        self.name: str = name
+        self.fast: float = fast
+        self.idle: float = idle
+        self.off: float = off
+        self.hold: float = hold
+        self.polls: int = 0
+        self.changes: int = 0
+        self.inactive: int = 0
+        self.interval: float = fast
+        self._last_change: float = float("-inf")
+
+    def next_interval(self, changed: bool, active: bool = True) -> float:
+        """Record the outcome of a poll and return the seconds to wait before the next one."""
+        now = time.monotonic()
+        self.polls += 1
+        if changed:
+            self.changes += 1
+            self._last_change = now
+            self.interval = self.fast
+        if not active:
+            self.inactive += 1
+            interval = self.interval = self.off
+        elif now - self._last_change < self.hold:
+            interval = self.interval = self.fast
+        else:
+            interval = self.interval = min(self.interval * BACKOFF, self.idle)
+        if self.polls % REPORT_INTERVAL == 0:
+            logging.debug(self.summary())
+        return interval
+
+    async def sleep(self, changed: bool, active: bool = True) -> None:
+        await asyncio.sleep(self.next_interval(changed, active))
+
+    def summary(self) -> str:
+        return (f"Polling {self.name}: {self.polls} polls, {self.changes} with changes, "
+                f"{self.inactive} while inactive, interval now {self.interval * 1000:.0f} ms")
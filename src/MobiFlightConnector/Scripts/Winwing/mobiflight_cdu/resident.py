@@ -0,0 +1,213 @@
+"""
+Connections that outlive an aircraft script inside the resident CDU host.
+
+Run standalone, a script opens its simulator connection at startup and closes
+it on exit. Loaded as a plugin by `cdu_host`, the same script is stopped and
+started again on every aircraft switch, and reopening SimConnect or the
+MobiFlight websockets each time is what kept the CDUs blank for seconds.
+
+`warm_resource` gives both behaviours from the same code:
+
+    with warm_resource(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc:
+        ...
+
+Standalone, the resource is created on entry and closed on exit. In the host,
+it is kept after the block ends and handed to the next block asking for the
+same key; the host closes everything when it shuts down. `warm_async_resource`
+is the same for resources closed by a coroutine.
+
+A warm resource can go stale while it waits, e.g. a SimConnect connection
+when the simulator quits. Pass `valid` to have a stale resource closed and
+replaced instead of handed out:
+
+    with warm_resource(SimConnectMobiFlight, SimConnectMobiFlight.exit, valid=simconnect_open) as sc:
+        ...
+
+A resource whose block raises OSError (SimConnect and socket failures) is
+closed and dropped as well, so the next block gets a new one.
+
+Resources that are costly to keep idle, like one SimConnect connection and
+dispatch thread per aircraft script, can share a `group`. Acquiring one
+closes the idle resources of the group stored under other keys, so an
+aircraft switch does not leave the previous aircraft's connection open
+while reloading the same script still finds its own.
+"""
+import asyncio
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+# key -> (resource, close); None when not running inside the resident host
+_resources: Optional[Dict[Hashable, Tuple[Any, Callable[[Any], Any]]]] = None
+# key -> group, for resources acquired with one
+_groups: Dict[Hashable, Hashable] = {}
+# key -> number of blocks using the resource
+_in_use: Dict[Hashable, int] = {}
+
+
+def is_resident() -> bool:
+    """True when running as a plugin inside the resident CDU host."""
+    return _resources is not None
+
+
+def enable() -> None:
+    """Keep resources warm from now on. Called once by the host at startup."""
+    global _resources
+    if _resources is None:
+        _resources = {}
+
+
+def acquire(
+    key: Hashable,
+    factory: Callable[[], Any],
+    close: Callable[[Any], Any],
+    valid: Optional[Callable[[Any], bool]] = None,
+    group: Optional[Hashable] = None,
+) -> Tuple[Any, bool]:
+    """
+    Return (resource, reused): the warm resource stored under key, or a new
+    one from factory (stored for later if running in the host). A warm
+    resource for which valid() is false is closed and replaced. With group,
+    idle resources of the same group under other keys are closed first.
+    """
+    if _resources is not None:
+        if group is not None:
+            _close_idle(group, key)
+        entry = _resources.get(key)
+        if entry is not None:
+            if valid is None or valid(entry[0]):
+                return entry[0], True
+            logging.info("Warm %s is no longer valid, replacing it", type(entry[0]).__name__)
+            del _resources[key]
+            _close_quietly(entry[0], entry[1])
+    resource = factory()
+    if _resources is not None:
+        _resources[key] = (resource, close)
+        if group is not None:
+            _groups[key] = group
+    return resource, False
+
+
+def _close_idle(group: Hashable, keep: Hashable) -> None:
+    """Close the resources of group that no block is using, except keep's."""
+    assert _resources is not None
+    for key in [key for key, other in _groups.items() if other == group and key != keep and not _in_use.get(key)]:
+        del _groups[key]
+        entry = _resources.pop(key, None)
+        if entry is not None:
+            logging.info("Closing idle warm %s", type(entry[0]).__name__)
+            _close_quietly(entry[0], entry[1])
+
+
+def _enter(key: Hashable) -> None:
+    _in_use[key] = _in_use.get(key, 0) + 1
+
+
+def _leave(key: Hashable) -> None:
+    count = _in_use.pop(key, 0) - 1
+    if count > 0:
+        _in_use[key] = count
+
+
+@contextlib.contextmanager
+def warm_resource(
+    factory: Callable[[], Any],
+    close: Callable[[Any], Any],
+    key: Optional[Hashable] = None,
+    valid: Optional[Callable[[Any], bool]] = None,
+    group: Optional[Hashable] = None,
+) -> Iterator[Any]:
+    """
+    Context manager yielding factory() (kept warm under key, which defaults
+    to factory itself, when running in the host).
+    """
+    key = factory if key is None else key
+    resource, reused = acquire(key, factory, close, valid, group)
+    if reused:
+        logging.info("Reusing warm %s", type(resource).__name__)
+    _enter(key)
+    try:
+        yield resource
+    except OSError:
+        if _resources is not None and _discard(key, resource):
+            _close_quietly(resource, close)
+        raise
+    finally:
+        _leave(key)
+        if _resources is None:
+            close(resource)
+
+
+@contextlib.asynccontextmanager
+async def warm_async_resource(
+    factory: Callable[[], Any],
+    close: Callable[[Any], Awaitable[Any]],
+    key: Optional[Hashable] = None,
+    valid: Optional[Callable[[Any], bool]] = None,
+    group: Optional[Hashable] = None,
+) -> AsyncIterator[Any]:
+    """`warm_resource` for resources closed by a coroutine."""
+    key = factory if key is None else key
+    resource, reused = acquire(key, factory, close, valid, group)
+    if reused:
+        logging.info("Reusing warm %s", type(resource).__name__)
+    _enter(key)
+    try:
+        yield resource
+    except OSError:
+        if _resources is not None and _discard(key, resource):
+            await _close_quietly_async(resource, close)
+        raise
+    finally:
+        _leave(key)
+        if _resources is None:
+            await close(resource)
+
+
+def discard(key: Hashable) -> None:
+    """Forget a warm resource without closing it (e.g. after it failed)."""
+    if _resources is not None:
+        _resources.pop(key, None)
+        _groups.pop(key, None)
+
+
+def _discard(key: Hashable, resource: Any) -> bool:
+    """Forget the resource stored under key if it is still resource."""
+    if _resources is not None:
+        entry = _resources.get(key)
+        if entry is not None and entry[0] is resource:
+            del _resources[key]
+            _groups.pop(key, None)
+            logging.info("Dropping warm %s after a failure", type(resource).__name__)
+            return True
+    return False
+
+
+def _close_quietly(resource: Any, close: Callable[[Any], Any]) -> None:
+    try:
+        result = close(resource)
+        if asyncio.iscoroutine(result):
+            # A coroutine close outside the loop's reach; let the loop run it
+            asyncio.ensure_future(result)
+    except Exception as e:
+        logging.warning("Error closing %s: %s", type(resource).__name__, e)
+
+
+async def _close_quietly_async(resource: Any, close: Callable[[Any], Any]) -> None:
+    try:
+        result = close(resource)
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        logging.warning("Error closing %s: %s", type(resource).__name__, e)
+
+
+async def close_all() -> None:
+    """Close every warm resource. Called by the host on shutdown."""
+    if not _resources:
+        return
+    entries = list(_resources.values())
+    _resources.clear()
+    _groups.clear()
+    for resource, close in entries:
+        await _close_quietly_async(resource, close)
@@ -0,0 +1,116 @@
+"""
+Row-incremental rendering of dataref-driven CDU displays.
+
+The X-Plane scripts used to rebuild the whole display from all of a CDU's
+datarefs on every update: working out each dataref's line from its name,
+checking its suffix for every character and looking up colour, size and
+glyph per character. Only a row or two changes in a typical update.
+
+A `RowRenderer` compiles every dataref name once into a plan (a
+`DatarefPlan` subclass) holding the display row it is drawn on and whatever
+the script needs to draw it: colour, size, a `str.translate` table for the
+glyphs, ... On each update it re-renders only the rows whose dataref values
+changed and reuses the JSON of the other rows:
+
+    display = RowRenderer(compile_dataref, render_row, CDU_ROWS)
+    ...
+    payload = display.render(values)  # {dataref name: value}
+
+`compile_dataref(name)` returns the plan, or None for datarefs that are not
+shown. `render_row(datarefs)` gets the `(plan, value)` pairs of one row, in
+the order their names first appeared in `values`, and returns the row's
+cells. The frame is identical to `json.dumps` of all rows.
+
+Given the names that changed since the previous frame, as a `DatarefStore`
+hands them out, `render(store.values, changed)` only looks at their rows.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import AbstractSet, Any, Callable, Dict, Generic, Iterable, List, Mapping, Optional, Tuple, TypeVar
+
+# Log statistics every this many frames (at debug level)
+REPORT_INTERVAL = 1000
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class DatarefPlan:
+    """What a dataref contributes to the display, worked out once from its name."""
+    row: int
+
+
+PlanT = TypeVar("PlanT", bound=DatarefPlan)
+
+
+class RowRenderer(Generic[PlanT]):
+    """Display JSON of one CDU, re-rendering only the rows whose datarefs changed."""
+
+    def __init__(
+        self,
+        compile_dataref: Callable[[str], Optional[PlanT]],
+        render_row: Callable[[List[Tuple[PlanT, Any]]], List[Any]],
+        rows: int,
+    ) -> None:
+        self.compile_dataref: Callable[[str], Optional[PlanT]] = compile_dataref
+        self.render_row: Callable[[List[Tuple[PlanT, Any]]], List[Any]] = render_row
+        self.frames: int = 0
+        self.rows_rendered: int = 0
+        self._plans: Dict[str, Optional[PlanT]] = {}
+        self._row_datarefs: List[List[Tuple[str, PlanT]]] = [[] for _ in range(rows)]
+        # Values each cached row was rendered from, None if it never was
+        self._row_values: List[Optional[Tuple[Any, ...]]] = [None] * rows
+        # JSON of each row's cells without the enclosing brackets
+        self._row_json: List[str] = [""] * rows
+        self._frame: str = ""
+
+    def _compile(self, names: Iterable[str]) -> None:
+        plans = self._plans
+        for name in names:
+            if name not in plans:
+                plan = plans[name] = self.compile_dataref(name)
+                if plan is not None:
+                    self._row_datarefs[plan.row].append((name, plan))
+
+    def render(self, values: Mapping[str, Any], changed: Optional[AbstractSet[str]] = None) -> str:
+        """
+        Display JSON for values. With the names that changed since the last
+        call (see `DatarefStore`), only their rows are looked at.
+        """
+        if changed is None or not self._frame:
+            if not self._plans.keys() >= values.keys():
+                self._compile(values)
+            rows: Iterable[int] = range(len(self._row_datarefs))
+        else:
+            if not self._plans.keys() >= changed:
+                # In the order of values, which decides what is drawn on top
+                self._compile(values)
+            rows = {plan.row for plan in map(self._plans.get, changed) if plan is not None}
+
+        rendered = False
+        for row in rows:
+            datarefs = self._row_datarefs[row]
+            row_values = tuple(values.get(name, _MISSING) for name, _ in datarefs)
+            if row_values == self._row_values[row]:
+                continue
+            cells = self.render_row([
+                (plan, value) for (_, plan), value in zip(datarefs, row_values) if value is not _MISSING
+            ])
+            self._row_values[row] = row_values
+            self._row_json[row] = json.dumps(cells)[1:-1]
+            self.rows_rendered += 1
+            rendered = True
+
+        if rendered or not self._frame:
+            data = ", ".join(row_json for row_json in self._row_json if row_json)
+            self._frame = f'{{"Target": "Display", "Data": [{data}]}}'
+        self.frames += 1
+        if self.frames % REPORT_INTERVAL == 0:
+            logging.debug(self.summary())
+        return self._frame
+
+    def summary(self) -> str:
+        rows = len(self._row_datarefs)
+        return (f"Row renderer: {self.rows_rendered} of {self.frames * rows} rows rendered "
+                f"over {self.frames} frames, {len(self._plans)} datarefs compiled")
@@ -0,0 +1,199 @@
+"""
+Startup profiler: how long a script leaves the CDU blank, and where it goes.
+
+    python -m mobiflight_cdu.startup_profile pmdg_737_winwing_cdu.py
+
+runs the script as usual and, when the first display frame has been sent to
+a CDU socket (`transport.on_next_frame`), logs (at INFO) the time since the process started and the
+imports that time was spent on, outermost first:
+
+    INFO:Startup pmdg_737_winwing_cdu.py: first frame 1840 ms after process start, 412 ms importing
+    INFO:Startup pmdg_737_winwing_cdu.py:   186 ms  SimConnect (self 41 ms)
+    ...
+
+With CDU_STARTUP_PROFILE=1 in its environment the resident host (`cdu_host`)
+reports the same for every script it loads, measured from the load command.
+MobiFlight sets it when its log level is Debug.
+"""
+import argparse
+import builtins
+import logging
+import os
+import runpy
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+from mobiflight_cdu import transport
+
+ENV_VAR = "CDU_STARTUP_PROFILE"
+# Outermost imports listed in a report
+TOP_IMPORTS = 10
+
+
+def enabled() -> bool:
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was created, None if the OS does not say."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        creation, exited, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+        if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation),
+                                        ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+        ticks = lambda filetime: (filetime.dwHighDateTime << 32) | filetime.dwLowDateTime
+        return (ticks(now) - ticks(creation)) / 1e7  # 100 ns units
+    try:
+        with open("/proc/self/stat") as stat:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime:
+            return float(uptime.read().split()[0]) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    started: float
+    seconds: float = 0.0
+    # Time spent in imports started from this one
+    nested: float = 0.0
+    depth: int = 0
+
+    @property
+    def self_seconds(self) -> float:
+        return self.seconds - self.nested
+
+
+class ImportTimer:
+    """
+    Times every absolute import of a module that is not loaded yet, by
+    wrapping builtins.__import__ (like `python -X importtime`, but usable
+    from inside a running host and without parsing stderr).
+    """
+
+    def __init__(self) -> None:
+        self.records: List[ImportRecord] = []
+        self._original: Optional[Callable[..., Any]] = None
+        self._local: threading.local = threading.local()
+
+    def install(self) -> None:
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self) -> None:
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name: str, globals: Any = None, locals: Any = None, fromlist: Any = (), level: int = 0) -> Any:
+        original = self._original or builtins.__import__
+        if level or name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        # Imports run in worker threads too (asyncio.to_thread), so each thread nests on its own
+        stack = self._local.__dict__.setdefault("stack", [])
+        record = ImportRecord(name, time.perf_counter(), depth=len(stack))
+        stack.append(record)
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            stack.pop()
+            record.seconds = time.perf_counter() - record.started
+            if stack:
+                stack[-1].nested += record.seconds
+            self.records.append(record)
+
+    def since(self, started: float) -> List[ImportRecord]:
+        """Outermost imports started at or after perf_counter() value started."""
+        return [record for record in self.records if record.depth == 0 and record.started >= started]
+
+
+@dataclass
+class StartupProfile:
+    """
+    Reports one script's startup when its first display frame is sent.
+    `begin()` starts a new measurement (the host calls it on every load).
+    """
+    imports: ImportTimer = field(default_factory=ImportTimer)
+    label: str = ""
+    started: float = field(default_factory=time.perf_counter)
+    since: str = "start"
+    reported: bool = True
+    _subscribed: bool = False
+
+    def install(self) -> None:
+        self.imports.install()
+
+    def uninstall(self) -> None:
+        self.imports.uninstall()
+        self.reported = True
+
+    def begin(self, label: str, started: Optional[float] = None, since: str = "start") -> None:
+        self.label = label
+        self.started = time.perf_counter() if started is None else started
+        self.since = since
+        self.reported = False
+        if not self._subscribed:
+            self._subscribed = True
+            transport.on_next_frame(self._frame_sent)
+
+    def _frame_sent(self) -> None:
+        self._subscribed = False
+        if not self.reported:
+            self.first_frame()
+
+    def first_frame(self) -> None:
+        self.reported = True
+        elapsed = time.perf_counter() - self.started
+        imports = sorted(self.imports.since(self.started), key=lambda record: record.seconds, reverse=True)
+        logging.info("Startup %s: first frame %.0f ms after %s, %.0f ms importing", self.label,
+                     elapsed * 1000, self.since, sum(record.seconds for record in imports) * 1000)
+        for record in imports[:TOP_IMPORTS]:
+            logging.info("Startup %s: %6.0f ms  %s (self %.0f ms)", self.label,
+                         record.seconds * 1000, record.name, record.self_seconds * 1000)
+
+
+def run_script(path: str, args: List[str]) -> None:
+    """Run an aircraft script as __main__ under the profiler."""
+    profile = StartupProfile()
+    age = process_age()
+    if age is None:
+        profile.begin(os.path.basename(path), since="profiler start")
+    else:
+        profile.begin(os.path.basename(path), time.perf_counter() - age, "process start")
+    profile.install()
+    sys.argv = [path, *args]
+    # Standalone scripts find their neighbours through sys.path[0]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    try:
+        runpy.run_path(path, run_name="__main__")
+    finally:
+        if not profile.reported:
+            logging.info("Startup %s: no display frame was sent", profile.label)
+        profile.uninstall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report where a CDU script spends its time until the first frame.")
+    parser.add_argument("script", help="aircraft script to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the script")
+    options = parser.parse_args()
+    # The report is logged at INFO; the script's own basicConfig is then a no-op
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+    try:
+        run_script(options.script, options.args)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,329 @@
+"""
+Regression tests: GridDecoder layouts against the hand-written decoders they replaced.
+
+Each reference below is the per-cell decoder a script used before it moved
+to `bytegrid`, reading its constants from the script module. Both decode
+the same random buffers, full-size and cut short, and must agree. Run from
+the Winwing folder (the scripts need the SimConnect package):
+
+    python -m pytest mobiflight_cdu
+"""
+import ctypes
+import importlib
+import json
+import random
+from types import ModuleType
+from typing import Any, Callable, List
+
+import pytest
+
+pytest.importorskip("SimConnect")
+
+SEED = 7
+FRAMES = 50
+
+
+def script(name: str) -> ModuleType:
+    return importlib.import_module(name)
+
+
+def outcome(decode: Callable[[bytes], str], data: bytes) -> Any:
+    """The decoded cells, or the exception type for buffers a decoder cannot read."""
+    try:
+        return json.loads(decode(data))["Data"]
+    except (IndexError, ValueError) as e:
+        return type(e)
+
+
+def buffers(size: int, rng: random.Random, fixup: Callable[[bytearray], None] = lambda data: None) -> List[bytes]:
+    """Random full-size buffers, with blanks mixed in, then the same cut short."""
+    frames = []
+    for _ in range(FRAMES):
+        data = bytearray(rng.getrandbits(8) for _ in range(size))
+        for index in rng.sample(range(size), size // 3):
+            data[index] = rng.choice((0, 0x20))
+        fixup(data)
+        frames.append(bytes(data))
+    short = [frame[:rng.randrange(1, size)] for frame in frames[:FRAMES // 2]]
+    return frames + short + [frames[0][:size - 1], b""]
+
+
+def assert_same(decode: Callable[[bytes], str], reference: Callable[[bytes], str], frames: List[bytes]) -> None:
+    for data in frames:
+        assert outcome(decode, data) == outcome(reference, data), f"buffer of {len(data)} bytes"
+
+
+# ---- References: the decoders as they were before bytegrid ----
+
+def pmdg_reference(m: ModuleType, data: bytes) -> str:
+    message = {"Target": "Display", "Data": [[] for _ in range(m.CDU_CELLS)]}
+    for x in range(m.CDU_COLUMNS):
+        for y in range(m.CDU_ROWS):
+            src_idx = (x * m.CDU_ROWS + y) * m.CDU_CELL_BYTE_COUNT
+            dst_idx = y * m.CDU_COLUMNS + x
+            if src_idx + 2 >= len(data):
+                message["Data"][dst_idx] = []
+                continue
+            symbol = chr(data[src_idx])
+            is_lowercase = symbol.islower()
+            symbol = symbol.upper()
+            color = data[src_idx + 1]
+            flags = data[src_idx + 2]
+            if symbol == ' ' or symbol == '\0':
+                message["Data"][dst_idx] = []
+            else:
+                if symbol == '\xA1': symbol = "←"
+                elif symbol == '\xA2': symbol = "→"
+                elif symbol == '\xA3': symbol = "↑"
+                elif symbol == '\xA4': symbol = "↓"
+                elif symbol == 'Ê': symbol = "☐"
+                if flags & m.CDU_FLAG_UNUSED:
+                    color_str = "e"
+                else:
+                    color_str = {
+                        m.CDU_COLOR_WHITE: "w",
+                        m.CDU_COLOR_CYAN: "c",
+                        m.CDU_COLOR_GREEN: "g",
+                        m.CDU_COLOR_MAGENTA: "m",
+                        m.CDU_COLOR_AMBER: "a",
+                        m.CDU_COLOR_RED: "r"
+                    }.get(color, "w")
+                message["Data"][dst_idx] = [
+                    symbol,
+                    color_str,
+                    1 if is_lowercase or (flags & m.CDU_FLAG_SMALL_FONT) else 0,
+                    1 if flags & m.CDU_FLAG_REVERSE else 0
+                ]
+    return json.dumps(message)
+
+
+def tfdi_reference(m: ModuleType, data: bytes) -> str:
+    message = {"Target": "Display", "Data": [[] for _ in range(m.MCDU_CHARS)]}
+    if len(data) < m.MCDU_DATA_SIZE:
+        return json.dumps(message)
+    char_data_start = ctypes.sizeof(m.MCDUStatus)
+    mcdu_chars = (m.MCDUChar * m.MCDU_CHARS).from_buffer_copy(
+        data[char_data_start:char_data_start + (m.MCDU_CHARS * m.MCDU_CHAR_SIZE)])
+    for index in range(m.MCDU_ROWS * m.MCDU_COLUMNS):
+        char = mcdu_chars[index]
+        symbol = chr(char.value)
+        if symbol == ' ' or symbol == '\0':
+            message["Data"][index] = []
+        elif symbol == '△':
+            message["Data"][index] = ['Δ', "g", 1]
+        else:
+            message["Data"][index] = [symbol, "g", 0 if char.large else 1]
+    return json.dumps(message)
+
+
+def maddogx_reference(m: ModuleType, data: bytes) -> str:
+    message = {"Target": "Display", "Data": [[] for _ in range(m.CDU_CELLS)]}
+    cdutype = data[m.CDU_TYPE_OFFSET]
+    for y in range(m.CDU_ROWS):
+        for x in range(m.CDU_COLUMNS):
+            src_idx = y * m.CDU_COLUMNS + x + m.CDU_DATA_OFFSET
+            src_iax = y * m.CDU_COLUMNS + x + m.CDU_ATRB_OFFSET
+            dst_idx = y * m.CDU_COLUMNS + x
+            if src_idx >= m.CDU_ATRB_OFFSET or src_iax >= len(data):
+                message["Data"][dst_idx] = []
+                continue
+            symbol = chr(data[src_idx])
+            color = data[src_iax] & m.CDU_COLOR_MASK
+            flags = data[src_iax] & m.CDU_FLAG_MASK
+            if symbol == ' ' or symbol == '\0':
+                message["Data"][dst_idx] = []
+            else:
+                if symbol == '{': symbol = "["
+                elif symbol == '}': symbol = "]"
+                elif symbol == '[': symbol = "☐"
+                elif cdutype == m.CDU_TYPE_HW and symbol == '$': symbol = "°"
+                elif cdutype == m.CDU_TYPE_HW and symbol == '!': symbol = "↓"
+                if cdutype == m.CDU_TYPE_HW:
+                    color_str = "g"
+                else:
+                    color_str = {
+                        m.CDU_COLOR_WHITE: "w",
+                        m.CDU_COLOR_AMBER: "a",
+                        m.CDU_COLOR_CYAN: "c",
+                        m.CDU_COLOR_GREEN: "g",
+                        m.CDU_COLOR_MAGENTA: "m",
+                        m.CDU_COLOR_RED: "r",
+                    }.get(color, "w")
+                message["Data"][dst_idx] = [symbol, color_str, 1 if (flags & m.CDU_FLAG_SMALL_FONT) else 0]
+    return json.dumps(message)
+
+
+def crj_reference(m: ModuleType, data: bytes) -> str:
+    message = {"Target": "Display", "Data": [[] for _ in range(m.CDU_CELLS)]}
+    for y in range(m.CDU_ROWS):
+        for x in range(m.CDU_COLUMNS):
+            src_idx = (y * m.CDU_COLUMNS + x) * m.CDU_CELL_BYTE_COUNT
+            dst_idx = y * m.CDU_COLUMNS + x
+            try:
+                symbol = chr(data[src_idx])
+                symbol = m.subs.get(symbol, symbol)
+                format = data[src_idx + 1]
+                color = format & 0b01111111
+                is_small = (format & 0b10000000) == 128
+                is_small = is_small or ((y % 2 == 1) and not (y == 13))
+                color_str = {
+                    m.CDU_COLOR_BLACK: "e",
+                    m.CDU_COLOR_WHITE: "w",
+                    m.CDU_COLOR_RED: "r",
+                    m.CDU_COLOR_GREEN: "g",
+                    m.CDU_COLOR_BLUE: "o",
+                    m.CDU_COLOR_CYAN: "o",
+                    m.CDU_COLOR_MAGENTA: "m",
+                    m.CDU_COLOR_YELLOW: "y"
+                }.get(color, "w")
+                if symbol == ' ' or symbol == '\0':
+                    message["Data"][dst_idx] = []
+                else:
+                    message["Data"][dst_idx] = [symbol, color_str, 1 if is_small else 0]
+            except IndexError:
+                message["Data"][dst_idx] = []
+    return json.dumps(message)
+
+
+def aerosoft_a340_reference(m: ModuleType, data: bytes) -> str:
+    message = {"Target": "Display", "Data": [[] for _ in range(m.CDU_CELLS)]}
+    for row in range(m.CDU_ROWS):
+        for col in range(m.CDU_COLUMNS):
+            cell_idx = row * m.CDU_COLUMNS + col
+            src = cell_idx * m.CELL_BYTE_COUNT
+            if src + m.CELL_BYTE_COUNT > len(data):
+                continue
+            char = chr(data[src])
+            if char in (" ", "\0"):
+                continue
+            font_size = 1 if data[src + 1] else 0
+            fg_r, fg_g, fg_b = data[src + 2], data[src + 3], data[src + 4]
+            bg_r, bg_g, bg_b = data[src + 6], data[src + 7], data[src + 8]
+            char = m.SPECIAL_CHARS.get(char, char)
+            colour = m.rgb_to_mobi_colour(fg_r, fg_g, fg_b)
+            reverse = 1 if (bg_r + bg_g + bg_b) > m.BG_BLACK_THRESHOLD else 0
+            message["Data"][cell_idx] = [char, colour, font_size, reverse]
+    return json.dumps(message)
+
+
+def fa50_reference(m: ModuleType, data: bytes) -> str:
+    out = {"Target": "Display", "Data": [[] for _ in range(m.MCDU_CHARS)]}
+    for r in range(m.FA50_CDU_ROWS):
+        if r > 0 and r < 6:
+            lsk = (m.FA50_CDU_COLUMNS * m.FA50_CDU_ROWS * 3) + ((r-1) * 2)
+            left, right = data[lsk], data[lsk + 1]
+            row_offset = ((r-1) * 2) + 1
+            if left == 1:
+                out["Data"][m.MCDU_COLUMNS * row_offset] = ['<', 'w', 1]
+            if right == 1:
+                out["Data"][(m.MCDU_COLUMNS * (1+row_offset)) - 1] = ['>', 'w', 1]
+        for c in range(m.FA50_CDU_COLUMNS):
+            idx = (r * (m.FA50_CDU_COLUMNS * 3)) + (c * 3)
+            try:
+                sym, color, s = chr(data[idx]), data[idx+1], data[idx+2]
+                if sym in (" ", "\0", "\n"):
+                    continue
+                out["Data"][(m.MCDU_COLUMNS * r) + (c + 1)] = [sym, "a" if s == 1 else m.MCDU_COLOR_MAP.get(color, "w"), 0]
+            except IndexError:
+                pass
+    return json.dumps(out)
+
+
+def ini_reference(m: ModuleType, special_chars: dict, data: bytes) -> str:
+    out = {"Target": "Display", "Data": [[] for _ in range(m.MCDU_CHARS)]}
+    for i in range(m.MCDU_ROWS * m.MCDU_COLUMNS):
+        idx = i * m.MCDU_CHAR_SIZE
+        if idx + 2 >= len(data):
+            continue
+        sym, col, flg = chr(data[idx]), data[idx+1], data[idx+2]
+        if sym in (" ", "\0"):
+            continue
+        sym = special_chars.get(sym, sym)
+        out["Data"][i] = [sym, m.MCDU_COLOR_MAP.get(col, "w"), int(bool(flg & m.MCDU_FLAG_SMALL_FONT))]
+    return json.dumps(out)
+
+
+# ---- Tests ----
+
+def no_sharp_s(data: bytearray) -> None:
+    """PMDG: 'ß' used to expand to "SS"; bytegrid keeps one glyph per cell on purpose."""
+    data[:] = data.replace(b"\xdf", b"S")
+
+
+@pytest.mark.parametrize("name", ["pmdg_737_winwing_cdu", "pmdg_777_winwing_cdu"])
+def test_pmdg(name: str) -> None:
+    m = script(name)
+    frames = buffers(m.CDU_LAYOUT.size, random.Random(SEED), no_sharp_s)
+    assert_same(m.create_mobi_json, lambda data: pmdg_reference(m, data), frames)
+
+
+def test_tfdi_md11() -> None:
+    m = script("tfdi_md11_winwing_cdu")
+    frames = buffers(m.MCDU_DATA_SIZE, random.Random(SEED))
+    assert_same(m.create_mobi_json, lambda data: tfdi_reference(m, data), frames)
+
+
+@pytest.mark.parametrize("cdu_type", ["CDU_TYPE_HW", "CDU_TYPE_CM"])
+def test_maddogx(cdu_type: str) -> None:
+    m = script("maddogx_winwing_cdu")
+    size = max(m.CDU_TYPE_OFFSET + 1, m.CDU_ATRB_OFFSET + m.CDU_CELLS)
+
+    def set_type(data: bytearray) -> None:
+        data[m.CDU_TYPE_OFFSET] = getattr(m, cdu_type)
+
+    frames = buffers(size, random.Random(SEED), set_type)
+    assert_same(m.create_mobi_json, lambda data: maddogx_reference(m, data), frames)
+
+
+def test_aerosoft_crj() -> None:
+    m = script("aerosoft_crj_winwing_cdu")
+    frames = buffers(m.CDU_LAYOUT.size, random.Random(SEED))
+    assert_same(m.create_mobi_json, lambda data: crj_reference(m, data), frames)
+
+
+def test_aerosoft_a340() -> None:
+    m = script("aerosoft_a340_winwing_cdu")
+    frames = buffers(m.CDU_CELLS * m.CELL_BYTE_COUNT, random.Random(SEED))
+    assert_same(m.create_mobi_json, lambda data: aerosoft_a340_reference(m, data), frames)
+
+
+def test_contrail_fa50() -> None:
+    m = script("contrail_fa50_winwing_cdu")
+    size = m.FA50_LSK_OFFSET + 10
+
+    def states(data: bytearray) -> None:
+        # Selected and line select key bytes are small states, not random bytes
+        for index in range(2, m.FA50_LSK_OFFSET, 3):
+            data[index] = random.Random(index + data[0]).choice((0, 1, 2, 3, 5, 7))
+        for index in range(m.FA50_LSK_OFFSET, size):
+            data[index] %= 3
+
+    frames = buffers(size, random.Random(SEED), states)
+    assert_same(m.create_mobi_json, lambda data: fa50_reference(m, data), frames)
+
+
+def test_ini_a300() -> None:
+    m = script("ini_a300_winwing_cdu")
+    frames = buffers(m.MCDU_LAYOUT.size, random.Random(SEED))
+    assert_same(m.create_mobi_json, lambda data: ini_reference(m, m.SPECIAL_CHARS, data), frames)
+
+
+def test_ini_a340() -> None:
+    m = script("ini_a340_winwing_cdu")
+    frames = buffers(m.MCDU_DATA_SIZE, random.Random(SEED))
+    assert_same(m.create_mobi_json, lambda data: ini_reference(m, m.special_chars, data), frames)
+
+
+def test_short_buffers_blank_incomplete_cells() -> None:
+    """Cells without all their fields in a short buffer stay blank, as before bytegrid."""
+    from mobiflight_cdu.bytegrid import GridDecoder, GridLayout
+
+    row_major = GridDecoder(GridLayout(stride=3, glyph=0, colour=1, flags=2, colours={1: "g"}))
+    data = b"A\x01\x00" * 10 + b"B\x01"  # the eleventh cell has no flags byte
+    cells = row_major.decode(data)
+    assert cells[:10] == [["A", "g", 0]] * 10
+    assert cells[10:] == [[]] * (len(cells) - 10)
+
+    column_major = GridDecoder(GridLayout(stride=3, glyph=0, colour=1, flags=2, column_major=True))
+    cells = column_major.decode(b"A\x00\x00" * 15)  # the first column and one cell of the second
+    assert [index for index, cell in enumerate(cells) if cell] == sorted(list(range(0, 14 * 24, 24)) + [1])
@@ -0,0 +1,414 @@
+"""
+Latest-frame-wins MobiFlight websocket transport for the WinWing CDU scripts.
+
+Producers hand display frames to a MobiFlightClient without waiting for the
+socket. Each client owns a one-slot mailbox that only ever holds the newest
+pending frame and a single sender task that drains it while the socket is
+connected. When a CDU stalls, older pending frames are overwritten (and
+counted) instead of piling up behind the slow socket, so the display always
+catches up to the latest sim state. Display frames are sent as cell-level
+patches against the previous frame on the same socket (see `patch`).
+
+Frames produced on another thread (SimConnect's dispatch thread) are handed
+over with `post_threadsafe()`. The thread overwrites a single hand-off
+slot and only wakes the event loop when the slot was empty, so a burst of
+frames costs one `call_soon_threadsafe` and no coroutines or futures.
+
+Sources that deliver raw snapshots at simulator frame rate can post the
+snapshot together with its encoder instead of a finished frame:
+
+    self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
+
+The snapshot is only encoded by the sender task, once the socket is
+connected, the font is set and `frame_interval` has passed since the last
+frame sent. Snapshots posted in between replace each other, so a burst
+costs one encode, and nothing is encoded while MobiFlight is unreachable.
+`summary()` compares frames encoded with frames sent per second. Frames and
+encoders may also give the cell list of a display frame instead of its
+JSON, which the patcher then compares without parsing it back.
+
+Every display frame sent on a CDU socket is reported with `frame_sent()`,
+which runs the callbacks registered with `on_next_frame()` once (the startup
+profiler waits for the first frame this way). Scripts that drive their own
+websocket call `frame_sent()` after each display frame they send.
+
+Scripts get their clients from `shared_client()`. Inside the resident CDU
+host this returns one client per endpoint that stays connected across
+aircraft switches (see `resident`); standalone it is a plain new client.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional, Union
+
+import websockets.asyncio.client as ws_client
+
+from mobiflight_cdu import resident
+from mobiflight_cdu.patch import Cell, DisplayPatcher, encode_display
+
+# Seconds between frames for sources that deliver raw snapshots at simulator
+# frame rate (pass as frame_interval)
+FRAME_INTERVAL = 0.02
+# Log statistics every this many frames sent (at debug level)
+REPORT_INTERVAL = 2000
+
+# Callbacks waiting for the next display frame sent on any CDU socket
+_next_frame: List[Callable[[], None]] = []
+
+
+def on_next_frame(callback: Callable[[], None]) -> None:
+    """Call callback once, after the next display frame is sent by any CDU socket."""
+    _next_frame.append(callback)
+
+
+def frame_sent() -> None:
+    """Report a display frame sent; runs the callbacks waiting for it."""
+    global _next_frame
+    if _next_frame:
+        callbacks, _next_frame = _next_frame, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error("Frame sent callback failed: %s", e)
+
+
+# A finished frame: a message string or the cell list of a display frame
+Encoded = Union[str, List[Cell]]
+
+
+class DeferredFrame:
+    """Raw snapshot of a display and the function that encodes it into a frame."""
+
+    __slots__ = ("raw", "encode")
+
+    def __init__(self, raw: Any, encode: Callable[[Any], Encoded]) -> None:
+        self.raw: Any = raw
+        self.encode: Callable[[Any], Encoded] = encode
+
+
+Frame = Union[Encoded, DeferredFrame]
+
+
+class FrameSlot:
+    """One-slot mailbox holding only the newest pending frame."""
+
+    def __init__(self) -> None:
+        self._frame: Optional[Frame] = None
+        self._ready: asyncio.Event = asyncio.Event()
+        self.dropped: int = 0
+
+    def put(self, frame: Frame) -> None:
+        """Store frame, replacing (and counting) any frame not yet taken."""
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._ready.set()
+
+    def pending(self) -> bool:
+        return self._frame is not None
+
+    async def take(self) -> Frame:
+        """Wait for a frame and remove it from the slot."""
+        while self._frame is None:
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self._frame = self._frame, None
+        self._ready.clear()
+        return frame
+
+
+class MobiFlightClient:
+    """
+    Websocket client for one MobiFlight CDU endpoint.
+
+    `send()` never blocks on the network: it places the frame in the mailbox
+    and returns. `run()` keeps the connection up, sets the font (if any) after
+    each connect and replays the newest frame so a reconnected CDU is not left
+    blank. `connected` is set as soon as the font has been sent, so callers
+    can start their simulator connection while the CDU loads it; the sender
+    holds the first frame until `font_delay` has passed, and later frames
+    until `frame_interval` has passed since the last one. Once `max_retries`
+    consecutive failures are reached, `run()` gives up and sets `connected`
+    so callers waiting on it can check the retry count.
+
+    A shared client (see `shared_client`) keeps its connection loop in a task
+    of its own: `run()` only waits on it and `close()` leaves it connected.
+    """
+
+    def __init__(
+        self,
+        websocket_uri: str,
+        font: Optional[str] = None,
+        max_retries: int = 3,
+        retry_delay: float = 5.0,
+        font_delay: float = 1.0,
+        reset_retries_on_connect: bool = False,
+        patches: bool = True,
+        frame_interval: float = 0.0,
+    ) -> None:
+        self.websocket: Optional[ws_client.ClientConnection] = None
+        self.connected: asyncio.Event = asyncio.Event()
+        self.websocket_uri: str = websocket_uri
+        self.font: Optional[str] = font
+        self.retries: int = 0
+        self.max_retries: int = max_retries
+        self.retry_delay: float = retry_delay
+        self.font_delay: float = font_delay
+        self.reset_retries_on_connect: bool = reset_retries_on_connect
+        self.frame_interval: float = frame_interval
+        self.last_frame: Optional[Encoded] = None
+        self.frames_encoded: int = 0
+        self.frames_sent: int = 0
+        self.bytes_sent: int = 0
+        self.encode_failures: int = 0
+        self._started: float = time.monotonic()
+        self.patcher: Optional[DisplayPatcher] = DisplayPatcher() if patches else None
+        self.shared: bool = False
+        self._slot: FrameSlot = FrameSlot()
+        self._sender: Optional[asyncio.Task] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._font_sent: Optional[str] = None
+        # Loop time at which the last font sent has been set on the CDU
+        self._font_ready: float = 0.0
+        # Loop time at which the last frame was sent
+        self._frame_sent_at: float = float("-inf")
+        # Frame posted from another thread that the event loop has not taken yet
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handoff_lock: threading.Lock = threading.Lock()
+        self._handoff: Optional[Frame] = None
+        self._handoff_scheduled: bool = False
+        self._handoff_dropped: int = 0
+        self.handoffs: int = 0
+
+    @property
+    def frames_dropped(self) -> int:
+        """Frames overwritten in the mailbox (or the hand-off slot) before the socket could take them."""
+        return self._slot.dropped + self._handoff_dropped
+
+    def configure(self, font: Optional[str] = None, **options: Any) -> None:
+        """Apply a new user's settings to a shared client."""
+        if font:
+            self.font = font
+        for name in ("max_retries", "retry_delay", "font_delay", "reset_retries_on_connect", "frame_interval"):
+            if name in options:
+                setattr(self, name, options[name])
+        patches = options.get("patches", True)
+        if patches and self.patcher is None:
+            self.patcher = DisplayPatcher()
+        elif not patches:
+            self.patcher = None
+
+    async def run(self) -> None:
+        with self._handoff_lock:
+            self._loop = asyncio.get_running_loop()
+        # A frame posted from another thread before the loop was known
+        self._take_handoff()
+        if not self.shared:
+            await self._run()
+            return
+        if self._runner is None or self._runner.done():
+            # Not connected yet, or gave up while no script was using it
+            self.retries = 0
+            self.connected.clear()
+            self._runner = asyncio.create_task(self._run())
+        await asyncio.shield(self._runner)
+
+    async def _run(self) -> None:
+        while self.retries < self.max_retries:
+            try:
+                if self.websocket is None:
+                    await self._connect()
+                await self.websocket.recv()
+            except Exception as e:
+                self.retries += 1
+                logging.info(f"WebSocket error on {self.websocket_uri}: {e} with retries {self.retries}")
+                self._drop_connection()
+                await asyncio.sleep(self.retry_delay)
+        logging.info("Max retries reached. Giving up connecting to MobiFlight at %s. If you only have one CDU attached, you can ignore this message.", self.websocket_uri)
+        self.connected.set()
+
+    async def _connect(self) -> None:
+        logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
+        self.websocket = await ws_client.connect(self.websocket_uri, ping_interval=None)
+        logging.info("MobiFlight connected at %s", self.websocket_uri)
+        self._font_sent = None
+        await self._send_font(self.websocket, wait=False)
+        if self.reset_retries_on_connect:
+            self.retries = 0
+        if self.patcher:
+            self.patcher.reset()
+        if self.last_frame is not None and not self._slot.pending():
+            logging.info("Resending last display data to %s", self.websocket_uri)
+            self._slot.put(self.last_frame)
+        self._sender = asyncio.create_task(self._send_frames(self.websocket))
+        self.connected.set()
+
+    async def _send_font(self, websocket: ws_client.ClientConnection, wait: bool = True) -> None:
+        if self.font and self.font != self._font_sent:
+            await websocket.send(f'{{ "Target": "Font", "Data": "{self.font}" }}')
+            logging.info(f"Setting font: {self.font}")
+            self._font_sent = self.font
+            self._font_ready = asyncio.get_running_loop().time() + self.font_delay
+        if wait:
+            await self._font_set()
+
+    async def _font_set(self) -> None:
+        """Wait until the CDU has had font_delay to set the last font sent."""
+        delay = self._font_ready - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _drop_connection(self) -> None:
+        if self._sender is not None:
+            self._sender.cancel()
+            self._sender = None
+        self.websocket = None
+        self.connected.clear()
+
+    async def _paced(self) -> None:
+        """Wait until frame_interval has passed since the last frame sent."""
+        delay = self._frame_sent_at + self.frame_interval - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _encode(self, frame: Frame) -> Optional[Encoded]:
+        if not isinstance(frame, DeferredFrame):
+            return frame
+        try:
+            encoded = frame.encode(frame.raw)
+        except Exception as e:
+            self.encode_failures += 1
+            logging.error("Encoding a frame for %s failed: %s", self.websocket_uri, e)
+            return None
+        self.frames_encoded += 1
+        return encoded
+
+    async def _send_frames(self, websocket: ws_client.ClientConnection) -> None:
+        """Single sender task per socket: always sends the newest frame."""
+        while True:
+            # Frames posted while the font is being set or the last frame is
+            # being paced replace each other
+            await self._font_set()
+            await self._paced()
+            frame = self._encode(await self._slot.take())
+            if frame is None:
+                continue
+            patcher = self.patcher
+            if patcher:
+                payload = patcher.encode(frame)
+            else:
+                payload = frame if isinstance(frame, str) else encode_display(frame)
+            if payload is None:
+                # Display unchanged since the last frame sent
+                self.last_frame = frame
+                continue
+            try:
+                # A shared client may have been handed to a script using another font
+                await self._send_font(websocket)
+                await websocket.send(payload)
+            except Exception as e:
+                logging.debug(f"Send to {self.websocket_uri} failed: {e}")
+                if self.patcher:
+                    self.patcher.reset()
+                # Keep the frame for the next connection unless a newer one arrived
+                if not self._slot.pending():
+                    self._slot.put(frame)
+                return
+            frame_sent()
+            self.last_frame = frame
+            self.frames_sent += 1
+            self.bytes_sent += len(payload)
+            self._frame_sent_at = asyncio.get_running_loop().time()
+            if self.frames_sent % REPORT_INTERVAL == 0:
+                logging.debug(self.summary())
+
+    @staticmethod
+    def _frame(data: Any, encode: Optional[Callable[[Any], Encoded]]) -> Frame:
+        return DeferredFrame(data, encode) if encode is not None else data
+
+    def post(self, data: Any, encode: Optional[Callable[[Any], Encoded]] = None) -> None:
+        """
+        Queue a frame from the event loop thread without awaiting. With
+        encode, data is a raw snapshot that is encoded only when it is sent.
+        """
+        self._slot.put(self._frame(data, encode))
+
+    async def send(self, data: str) -> None:
+        self.post(data)
+
+    def post_threadsafe(self, data: Any, encode: Optional[Callable[[Any], Encoded]] = None) -> None:
+        """
+        Queue a frame (or a raw snapshot and its encoder, like `post`) from
+        any thread. Frames posted before the event loop gets to them replace
+        each other; the loop is woken once for them. A frame posted before
+        `run()` has started waits for it.
+        """
+        data = self._frame(data, encode)
+        with self._handoff_lock:
+            if self._handoff is not None:
+                self._handoff_dropped += 1
+            self._handoff = data
+            loop = self._loop
+            if loop is None or self._handoff_scheduled:
+                return
+            self._handoff_scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._take_handoff)
+        except RuntimeError:
+            # The loop has been closed
+            with self._handoff_lock:
+                self._handoff = None
+                self._handoff_scheduled = False
+
+    def _take_handoff(self) -> None:
+        with self._handoff_lock:
+            data, self._handoff = self._handoff, None
+            self._handoff_scheduled = False
+        if data is not None:
+            self.handoffs += 1
+            self._slot.put(data)
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return (f"MobiFlight {self.websocket_uri}: {self.frames_encoded} frames encoded on send "
+                f"({self.frames_encoded / elapsed:.1f}/s), {self.frames_sent} sent ({self.frames_sent / elapsed:.1f}/s, "
+                f"{self.bytes_sent} bytes), {self.frames_dropped} dropped, {self.encode_failures} encode failures")
+
+    def is_connected(self) -> bool:
+        return self.websocket is not None and self.connected.is_set()
+
+    async def close(self) -> None:
+        """Close the connection, or only detach from it if the client is shared."""
+        logging.debug(self.summary())
+        if not self.shared:
+            await self.disconnect()
+
+    async def disconnect(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        websocket = self.websocket
+        self._drop_connection()
+        if websocket:
+            await websocket.close()
+
+
+def shared_client(websocket_uri: str, font: Optional[str] = None, **options: Any) -> MobiFlightClient:
+    """
+    MobiFlightClient for websocket_uri, taking the same arguments. Inside the
+    resident CDU host all scripts get the same client for an endpoint, already
+    connected if an earlier aircraft used it; otherwise this is a new client.
+    """
+    if not resident.is_resident():
+        return MobiFlightClient(websocket_uri, font=font, **options)
+    client, reused = resident.acquire(
+        ("mobiflight", websocket_uri),
+        lambda: MobiFlightClient(websocket_uri, font=font, **options),
+        MobiFlightClient.disconnect,
+    )
+    client.shared = True
+    if reused:
+        client.configure(font, **options)
+    return client
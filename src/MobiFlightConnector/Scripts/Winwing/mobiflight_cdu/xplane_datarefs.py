@@ -0,0 +1,169 @@
+"""
+X-Plane dataref name -> ID resolution for the X-Plane CDU scripts.
+
+The X-Plane web API addresses datarefs by numeric IDs that are only valid in
+the running X-Plane session. The scripts used to find theirs by downloading
+the whole `/api/v2/datarefs` catalogue (tens of thousands of entries on a
+modded install) with blocking requests on the event loop, once per CDU.
+
+A script creates one `DatarefIds` for the aircraft, and its CDUs pick their
+datarefs from it:
+
+    DATAREFS = DatarefIds("zibo_737_800x", lambda name: name.startswith("laminar/B738/fmc"))
+    ...
+    dataref_map = await DATAREFS.select(lambda name: name.startswith(f"laminar/B738/{device}"))
+
+Requests run in a worker thread and CDUs asking at the same time share one
+resolution. The matching names are cached on disk per aircraft, so later
+runs ask X-Plane for just those names (`filter[name]`), which returns their
+IDs in the current session. The full catalogue is only downloaded again when
+there is no cache, a cached name is missing, or X-Plane reports a different
+number of datarefs than when the cache was written (plugins added or
+removed some). Call `invalidate()` when the X-Plane connection drops, as a
+restarted X-Plane assigns new IDs.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+REST_URL = "http://localhost:8086/api/v2/datarefs"
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "mobiflight_cdu")
+CACHE_VERSION = 1
+REQUEST_TIMEOUT = 5
+# Names per filtered request, keeps the URL well below common length limits
+NAMES_PER_REQUEST = 40
+# Resolved IDs are handed out again without asking X-Plane for this long
+FRESH_SECONDS = 10.0
+
+
+def _get_json(url: str) -> Any:
+    with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+        return json.load(response)
+
+
+def _id_map(entries: Iterable[Dict[str, Any]]) -> Dict[int, str]:
+    return {int(entry["id"]): str(entry["name"]) for entry in entries}
+
+
+class DatarefIds:
+    """
+    IDs of the datarefs an aircraft script uses, either all datarefs whose
+    name satisfies `match` or a fixed list of `names`.
+    """
+
+    def __init__(
+        self,
+        aircraft: str,
+        match: Optional[Callable[[str], bool]] = None,
+        names: Optional[Iterable[str]] = None,
+        url: str = REST_URL,
+    ) -> None:
+        if match is None and names is None:
+            raise ValueError("DatarefIds needs match or names")
+        self.aircraft: str = aircraft
+        self.match: Optional[Callable[[str], bool]] = match
+        self.names: Optional[List[str]] = list(names) if names is not None else None
+        self.url: str = url
+        self.ids: Dict[int, str] = {}
+        self._resolved_at: Optional[float] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    @property
+    def cache_path(self) -> str:
+        return os.path.join(CACHE_DIR, f"xplane_datarefs_{self.aircraft}.json")
+
+    async def resolve(self) -> Dict[int, str]:
+        """ID -> name of all the aircraft's datarefs in the current X-Plane session."""
+        async with self._lock:
+            if self._resolved_at is None or time.monotonic() - self._resolved_at > FRESH_SECONDS:
+                self.ids = await asyncio.to_thread(self._resolve)
+                self._resolved_at = time.monotonic()
+            return self.ids
+
+    async def select(self, match: Callable[[str], bool]) -> Dict[int, str]:
+        """The resolved datarefs whose name satisfies match (e.g. one CDU's)."""
+        return {dataref_id: name for dataref_id, name in (await self.resolve()).items() if match(name)}
+
+    def invalidate(self) -> None:
+        """Ask X-Plane again on the next resolve."""
+        self._resolved_at = None
+
+    def _resolve(self) -> Dict[int, str]:
+        started = time.perf_counter()
+        count = self._count()
+        names = self.names
+        if names is None:
+            cache = self._read_cache()
+            if cache is not None and cache.get("count") == count:
+                names = cache["names"]
+        if names:
+            ids = self._lookup(names)
+            if len(ids) == len(names) or self.match is None:
+                self._log(ids, "by name", started)
+                return ids
+            logging.info("X-Plane dataref cache for %s is out of date", self.aircraft)
+        ids = self._scan()
+        self._write_cache(count, ids)
+        self._log(ids, "from the full catalogue", started)
+        return ids
+
+    def _log(self, ids: Dict[int, str], how: str, started: float) -> None:
+        logging.info("Resolved %s X-Plane datarefs for %s %s in %.0f ms",
+                     len(ids), self.aircraft, how, (time.perf_counter() - started) * 1000)
+
+    def _count(self) -> Optional[int]:
+        """Number of datarefs X-Plane knows, None if it does not say."""
+        try:
+            return int(_get_json(f"{self.url}/count")["data"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _lookup(self, names: List[str]) -> Dict[int, str]:
+        """Current IDs of the given names, asked of X-Plane by name."""
+        ids: Dict[int, str] = {}
+        for start in range(0, len(names), NAMES_PER_REQUEST):
+            query = [("filter[name]", name) for name in names[start:start + NAMES_PER_REQUEST]]
+            query.append(("fields", "id,name"))
+            try:
+                ids.update(_id_map(_get_json(f"{self.url}?{urllib.parse.urlencode(query)}")["data"]))
+            except urllib.error.HTTPError as e:
+                # X-Plane rejects the whole request if one of the names is unknown
+                logging.debug("Dataref lookup for %s failed: %s", self.aircraft, e)
+        return ids
+
+    def _scan(self) -> Dict[int, str]:
+        """Matching datarefs from the full catalogue."""
+        try:
+            entries = _get_json(f"{self.url}?fields=id,name")["data"]
+        except urllib.error.HTTPError:
+            # Servers without field selection send every field
+            entries = _get_json(self.url)["data"]
+        return {dataref_id: name for dataref_id, name in _id_map(entries).items() if self.match(name)}
+
+    def _read_cache(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION or cache.get("url") != self.url:
+            return None
+        return cache
+
+    def _write_cache(self, count: Optional[int], ids: Dict[int, str]) -> None:
+        cache = {"version": CACHE_VERSION, "url": self.url, "count": count, "names": sorted(ids.values())}
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temporary = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(temporary, self.cache_path)
+        except OSError as e:
+            logging.debug("Cannot write %s: %s", self.cache_path, e)
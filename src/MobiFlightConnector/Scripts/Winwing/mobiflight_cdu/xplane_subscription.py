@@ -0,0 +1,162 @@
+"""
+One X-Plane websocket subscription shared by all CDUs of a script.
+
+Every X-Plane script used to open a `ws://localhost:8086/api/v2` connection
+per CDU, so X-Plane sent (and the script parsed) the same updates two or
+three times. A `DatarefSubscription` keeps one connection, subscribes the
+union of the datarefs its consumers want, parses each message once and
+routes the values through a precomputed ID -> consumer table:
+
+    XPLANE = DatarefSubscription(BASE_WEBSOCKET_URI, DATAREFS)
+    ...
+    async for changes in XPLANE.updates(lambda name: name.startswith(f"laminar/B738/{device}")):
+        ...  # {dataref name: raw value} of this CDU's datarefs that changed
+
+The connection is opened by the first consumer and closed when the last one
+leaves. Consumers joining or leaving on a live connection only subscribe or
+unsubscribe their own IDs. After a reconnect the IDs are resolved again
+(see `xplane_datarefs`), and the table is only rebuilt if they changed.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import websockets
+
+from mobiflight_cdu.xplane_datarefs import DatarefIds
+
+# Seconds before reconnecting after an error that is not a closed connection
+RETRY_DELAY = 5.0
+
+
+class _Consumer:
+    """Changes for one consumer, merged until it takes them."""
+
+    def __init__(self, match: Callable[[str], bool]) -> None:
+        self.match: Callable[[str], bool] = match
+        self._changes: Dict[str, Any] = {}
+        self._ready: asyncio.Event = asyncio.Event()
+
+    def put(self, changes: Dict[str, Any]) -> None:
+        self._changes.update(changes)
+        self._ready.set()
+
+    async def take(self) -> Dict[str, Any]:
+        await self._ready.wait()
+        self._ready.clear()
+        changes, self._changes = self._changes, {}
+        return changes
+
+
+class DatarefSubscription:
+    """Dataref value updates from one X-Plane websocket, routed to consumers."""
+
+    def __init__(self, uri: str, datarefs: DatarefIds) -> None:
+        self.uri: str = uri
+        self.datarefs: DatarefIds = datarefs
+        self.messages: int = 0
+        self._consumers: List[_Consumer] = []
+        self._ids: Dict[int, str] = {}
+        # str(id) as sent by X-Plane -> (consumer, dataref name)
+        self._routes: Dict[str, List[Tuple[_Consumer, str]]] = {}
+        self._subscribed: Set[int] = set()
+        self._websocket: Optional[Any] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._req_id: int = 0
+        self._send_lock: asyncio.Lock = asyncio.Lock()
+
+    async def updates(self, match: Callable[[str], bool]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {name: raw value} of the changed datarefs whose name satisfies match."""
+        consumer = _Consumer(match)
+        self._consumers.append(consumer)
+        self._rebuild_routes()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        else:
+            await self._sync()
+        try:
+            while True:
+                yield await consumer.take()
+        finally:
+            self._consumers.remove(consumer)
+            self._rebuild_routes()
+            if not self._consumers:
+                self._runner.cancel()
+            else:
+                await self._sync()
+
+    def _rebuild_routes(self) -> None:
+        routes: Dict[str, List[Tuple[_Consumer, str]]] = {}
+        for dataref_id, name in self._ids.items():
+            for consumer in self._consumers:
+                if consumer.match(name):
+                    routes.setdefault(str(dataref_id), []).append((consumer, name))
+        self._routes = routes
+
+    async def _sync(self) -> None:
+        """Bring the live subscription in line with the routing table."""
+        async with self._send_lock:
+            websocket = self._websocket
+            if websocket is None:
+                return
+            wanted = {int(dataref_id) for dataref_id in self._routes}
+            added, removed = wanted - self._subscribed, self._subscribed - wanted
+            if removed:
+                await self._request(websocket, "dataref_unsubscribe_values", removed)
+            if added:
+                await self._request(websocket, "dataref_subscribe_values", added)
+            self._subscribed = wanted
+            if added or removed:
+                logging.info("X-Plane subscription: %s datarefs (+%s, -%s)", len(wanted), len(added), len(removed))
+
+    async def _request(self, websocket: Any, request_type: str, ids: Set[int]) -> None:
+        self._req_id += 1
+        await websocket.send(json.dumps({
+            "type": request_type,
+            "req_id": self._req_id,
+            "params": {"datarefs": [{"id": dataref_id} for dataref_id in sorted(ids)]},
+        }))
+
+    async def _run(self) -> None:
+        logging.info("Connecting to X-Plane websocket server")
+        try:
+            async for websocket in websockets.connect(self.uri):
+                logging.info("Connected successfully to X-Plane websocket server")
+                try:
+                    ids = await self.datarefs.resolve()
+                    if ids != self._ids:
+                        self._ids = dict(ids)
+                        self._rebuild_routes()
+                    self._subscribed = set()
+                    self._websocket = websocket
+                    await self._sync()
+                    while True:
+                        self._route(await websocket.recv())
+                except websockets.exceptions.ConnectionClosed:
+                    logging.error("X-Plane websocket connection was closed... Attempting to reconnect")
+                except Exception as e:
+                    logging.error(f"X-Plane subscription failed: {e}. Retrying in {RETRY_DELAY:.0f} s")
+                    await asyncio.sleep(RETRY_DELAY)
+                finally:
+                    self._websocket = None
+                    # A restarted X-Plane assigns new IDs
+                    self.datarefs.invalidate()
+        finally:
+            logging.debug("X-Plane subscription closed after %s messages", self.messages)
+
+    def _route(self, message: str) -> None:
+        decoded = json.loads(message)
+        data = decoded.get("data")
+        if not data:
+            if decoded.get("type") == "result" and not decoded.get("success", True):
+                logging.warning("X-Plane rejected request %s: %s", decoded.get("req_id"), decoded.get("error_message"))
+            return
+        self.messages += 1
+        changes: Dict[_Consumer, Dict[str, Any]] = {}
+        routes = self._routes
+        for dataref_id, value in data.items():
+            for consumer, name in routes.get(dataref_id, ()):
+                changes.setdefault(consumer, {})[name] = value
+        for consumer, consumer_changes in changes.items():
+            consumer.put(consumer_changes)
@@ -1,21 +1,22 @@
 import copy
 from ctypes import wintypes
 import ctypes
-import json
 import logging
 import asyncio
 import os
-import struct
-import websockets.asyncio.client as ws_client
-from typing import Optional, List, Dict, Union, Any
+from typing import Any
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, REVERSE, SMALL
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, MobiFlightClient, shared_client
 
 
 class SimConnectMobiFlight(SimConnect):
 
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -24,24 +25,19 @@ class SimConnectMobiFlight(SimConnect):
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
 
-    def register_client_data_handler(self, handler):
-        if not handler in self.client_data_handlers:
-            logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         dwID = pData.contents.dwID
         if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 # URLs
@@ -77,113 +73,51 @@ PMDG_CDU_1_ID: int = 0x4E473336
 PMDG_CDU_1_DEFINITION: int = 0x4E473339
 
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(self.websocket_uri, ping_interval=None)
-                    logging.info("MobiFlight connected at %s", self.websocket_uri)
-                    # Load font           
-                    fontName: str = "Boeing"
-                    await self.websocket.send(f'{{ "Target": "Font", "Data": "{fontName}" }}')
-                    logging.info(f"Setting font: {fontName}")
-                    await asyncio.sleep(1) # wait a second for font to be set
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e: 
-                self.retries += 1
-                logging.info(f"WebSocket error: {e} with retries {self.retries}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.info("Max retries reached. Giving up connecting to MobiFlight at %s. If you only have one CDU attached, you can ignore this message.", self.websocket_uri)
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
+# Cells are stored column-major as (symbol, color, flags)
+CDU_LAYOUT: GridLayout = GridLayout(
+    stride=CDU_CELL_BYTE_COUNT,
+    glyph=0,
+    colour=1,
+    flags=2,
+    column_major=True,
+    colours={
+        CDU_COLOR_WHITE: "w",
+        CDU_COLOR_CYAN: "c",
+        CDU_COLOR_GREEN: "g",
+        CDU_COLOR_MAGENTA: "m",
+        CDU_COLOR_AMBER: "a",
+        CDU_COLOR_RED: "r"
+    },
+    flag_roles={
+        CDU_FLAG_SMALL_FONT: SMALL,
+        CDU_FLAG_REVERSE: REVERSE,
+        CDU_FLAG_UNUSED: "e"  # Gray for unused
+    },
+    glyphs={
+        '\xA1': "\u2190",  # left arrow
+        '\xA2': "\u2192",  # right arrow
+        '\xA3': "\u2191",  # up arrow
+        '\xA4': "\u2193",  # down arrow
+        '\u00CA': "\u2610"  # box
+    },
+    uppercase=True,  # lowercase letters are shown as small capitals
+    reverse_field=True
+)
+CDU_DECODER: GridDecoder = GridDecoder(CDU_LAYOUT)
+
+
+@cached_frames()
 def create_mobi_json(data: bytes) -> str:
-    message: Dict[str, Union[str, List[List[Union[str, int]]]]] = {
-        "Target": "Display",
-        "Data": [[] for _ in range(CDU_CELLS)]
-    }
-    
-    # Process data in column-major order as received from PMDG
-    for x in range(CDU_COLUMNS):
-        for y in range(CDU_ROWS):
-            src_idx: int = (x * CDU_ROWS + y) * CDU_CELL_BYTE_COUNT
-            dst_idx: int = y * CDU_COLUMNS + x
-            
-            if src_idx + 2 >= len(data):
-                message["Data"][dst_idx] = []
-                continue
-                
-            try:
-                symbol: str = chr(data[src_idx])
-                is_lowercase: bool = symbol.islower()
-                symbol = symbol.upper()
-                color: int = data[src_idx + 1]
-                flags: int = data[src_idx + 2]
-
-                if symbol == ' ' or symbol == '\0':
-                    message["Data"][dst_idx] = []
-                else:
-                    # Handle special characters
-                    if symbol == '\xA1': symbol = "\u2190"  # left arrow
-                    elif symbol == '\xA2': symbol = "\u2192"  # right arrow
-                    elif symbol == '\xA3': symbol = "\u2191"  # up arrow
-                    elif symbol == '\xA4': symbol = "\u2193"  # down arrow
-                    elif symbol == '\u00CA': symbol = "\u2610" # box
-                    
-                    # Handle color based on flags
-                    if flags & CDU_FLAG_UNUSED:
-                        color_str: str = "e"  # Gray for unused
-                    else:
-                        color_str = {
-                            CDU_COLOR_WHITE: "w",
-                            CDU_COLOR_CYAN: "c",
-                            CDU_COLOR_GREEN: "g",
-                            CDU_COLOR_MAGENTA: "m",
-                            CDU_COLOR_AMBER: "a",
-                            CDU_COLOR_RED: "r"
-                        }.get(color, "w")
-
-                    message["Data"][dst_idx] = [
-                        symbol,
-                        color_str,
-                        1 if (is_lowercase) or (flags & CDU_FLAG_SMALL_FONT) else 0,
-                        1 if flags & CDU_FLAG_REVERSE else 0
-                    ]
-            except (ValueError, TypeError, IndexError) as e:
-                message["Data"][dst_idx] = []
-                logging.debug(f"Error processing cell: {e}")
-    
-    return json.dumps(message)
+    return CDU_DECODER.to_json(data)
 
 class PMDGCDUClient:
     def __init__(self, sc_mobiflight: SimConnectMobiFlight, websocket_uri: str, cdu_name: str, cdu_id: int, cdu_definition: int) -> None:
         self.sc_mobiflight: SimConnectMobiFlight = sc_mobiflight
-        self.mobiflight: MobiFlightClient = MobiFlightClient(websocket_uri)
-        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mobiflight: MobiFlightClient = shared_client(websocket_uri, font="Boeing", frame_interval=FRAME_INTERVAL)
         self.cdu_definition: int = cdu_definition
         self.cdu_name: str = cdu_name
         self.cdu_id: int = cdu_id
+        self.screen: ClientDataBuffer = ClientDataBuffer(CDU_CELLS * CDU_CELL_BYTE_COUNT)
 
     def failed_to_connect(self) -> bool:
         return self.mobiflight.retries >= self.mobiflight.max_retries
@@ -197,14 +131,7 @@ class PMDGCDUClient:
                 self.cdu_id
             )
 
-            self.sc_mobiflight.dll.AddToClientDataDefinition(
-                self.sc_mobiflight.hSimConnect,
-                self.cdu_definition,
-                0,
-                CDU_COLUMNS * CDU_ROWS * 3,
-                0,
-                0
-            )
+            add_client_data_definition(self.sc_mobiflight, self.cdu_definition, 0, CDU_COLUMNS * CDU_ROWS * 3)
 
             # Request data updates
             self.sc_mobiflight.dll.RequestClientData(
@@ -218,7 +145,7 @@ class PMDGCDUClient:
             )
 
             # Set up the handler
-            self.sc_mobiflight.register_client_data_handler(self.handle_cdu_data)
+            self.sc_mobiflight.register_client_data_handler(self.cdu_definition, self.handle_cdu_data)
             logging.info("SimConnect initialized for %s", self.cdu_name)
             return True
         except Exception as e:
@@ -228,21 +155,14 @@ class PMDGCDUClient:
 
     def handle_cdu_data(self, client_data: Any) -> None:
         try:
-            if client_data.dwDefineID == self.cdu_definition and hasattr(client_data, 'dwData'):                
-                int_count : int = int(CDU_COLUMNS * CDU_ROWS * CDU_CELL_BYTE_COUNT / 4)              
-                if len(client_data.dwData) >= int_count:
-                    data_list : bytearray = bytearray()                  
-                    for i in range(int_count): 
-                        my_bytes : bytes = struct.pack("I", client_data.dwData[i])
-                        data_list.extend(my_bytes)                
-                    data: bytes = bytes(data_list)                                       
-                    asyncio.run_coroutine_threadsafe(self.mobiflight.send(create_mobi_json(data)), self.event_loop)
+            # Skip frames that did not change the screen
+            if self.screen.update(client_data):
+                self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
         except Exception as e:
             logging.error(f"Error handling CDU data: {e}")
         
 
     async def run(self) -> None:
-        self.event_loop = asyncio.get_running_loop()
         logging.info("Starting CDU client")
         
         try:
@@ -264,6 +184,8 @@ class PMDGCDUClient:
         except Exception as e:
             logging.error(f"Error: {e}")
         finally:
+            self.sc_mobiflight.unregister_client_data_handler(self.cdu_definition, self.handle_cdu_data)
+            cancel_client_data_request(self.sc_mobiflight, self.cdu_id, self.cdu_id, self.cdu_definition)
             await self.mobiflight.close()
 
 class PMDGConfiguration:
@@ -274,8 +196,15 @@ class PMDGConfiguration:
         "pmdg-aircraft-738"
     ]
 
+    # The options files only need checking once per process
+    verified = False
+
     def verify_sdk_config(self):
         """Verify and potentially update the SDK configuration in the options file."""
+        if PMDGConfiguration.verified:
+            return
+        PMDGConfiguration.verified = True
+
         # Determine the correct path based on MS Store or Steam installation
         base_path = None
         ms_store_path = os.path.join(
@@ -379,31 +308,34 @@ class PMDGConfiguration:
                     file.write(f"{key}={value}\n")
                 file.write("\n")  # Add blank line between sections
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
-        format='%(levelname)s:%(message)s'
-    )
 
+async def main() -> None:
+    # The aircraft only reads the options file when it loads, so walking the
+    # package folders for it runs next to the CDU startup instead of before it
     ini_configurator = PMDGConfiguration()
-    ini_configurator.verify_sdk_config()
-    
-    sc_mobiflight: SimConnectMobiFlight = SimConnectMobiFlight()
-    captain_client: PMDGCDUClient = PMDGCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, PMDG_CDU_0_NAME, PMDG_CDU_0_ID, PMDG_CDU_0_DEFINITION)
-    co_pilot_client: PMDGCDUClient = PMDGCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, PMDG_CDU_1_NAME, PMDG_CDU_1_ID, PMDG_CDU_1_DEFINITION)
-    
-    async def run_clients():
+    config_check = asyncio.get_running_loop().run_in_executor(None, ini_configurator.verify_sdk_config)
+
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc_mobiflight:
+        captain_client: PMDGCDUClient = PMDGCDUClient(sc_mobiflight, CAPTAIN_CDU_URL, PMDG_CDU_0_NAME, PMDG_CDU_0_ID, PMDG_CDU_0_DEFINITION)
+        co_pilot_client: PMDGCDUClient = PMDGCDUClient(sc_mobiflight, CO_PILOT_CDU_URL, PMDG_CDU_1_NAME, PMDG_CDU_1_ID, PMDG_CDU_1_DEFINITION)
+
         await asyncio.gather(
+            config_check,
             captain_client.run(), 
             co_pilot_client.run(),
             return_exceptions=True
         )
-    # this will not work
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+
     try:
-        asyncio.run(run_clients())
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down")
     except Exception as e:
         logging.error(f"Error: {e}")
-    finally:
-        sc_mobiflight.exit()
@@ -3,11 +3,12 @@ from typing import Callable, Optional
 import json
 import logging
 import asyncio
+import importlib
 import os
-import websockets
 import xml.etree.ElementTree as ET
-from gql import Client, gql
-from gql.transport.websockets import WebsocketsTransport
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.resident import warm_async_resource
+from mobiflight_cdu.transport import MobiFlightClient, shared_client
 
 # Connection settings for ProSim GraphQL
 GRAPHQL_URL = "ws://localhost:5000/graphql"
@@ -30,47 +31,7 @@ CO_PILOT_CDU_URL: str = "ws://localhost:8320/winwing/cdu-co-pilot"
 CDU_COLUMNS: int = 24
 CDU_ROWS: int = 14
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[websockets.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await websockets.connect(self.websocket_uri, ping_interval=None)
-                    logging.info("MobiFlight connected")
-                    # Load font           
-                    fontName: str = "AirbusThales"
-                    await self.websocket.send(f'{{ "Target": "Font", "Data": "{fontName}" }}')
-                    logging.info(f"Setting font: {fontName}")
-                    await asyncio.sleep(1) # wait a second for font to be set
-                    self.connected.set()
-                await self.websocket.recv()
-            except Exception as e: 
-                self.retries += 1
-                logging.error(f"WebSocket error: {e} with retries {self.retries}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.error("Max retries reached. Giving up connecting to MobiFlight at %s", self.websocket_uri)
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-
+@cached_frames()
 def create_mobi_json(xml_string):
     message =  {}
     message["Target"] = "Display"
@@ -110,20 +71,35 @@ class ProSimGraphQLClient:
     Client for handling GraphQL communication with ProSim
     """
     def __init__(self) -> None:
-        self.transport = WebsocketsTransport(url=GRAPHQL_URL)
-        self.client = Client(transport=self.transport)
+        self.transport = None
+        self.client = None
         self.session = None
         self.connected = False
+        self._connect_lock = asyncio.Lock()
         self._callback_tasks = set()  # Keep track of callback tasks
 
     async def connect(self) -> bool:
         """
-        Connect to ProSim GraphQL server
+        Connect to ProSim GraphQL server, or wait for a connect already in progress
         
         Returns:
             bool: True if connection was successful, False otherwise
         """
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            return await self._connect()
+
+    async def _connect(self) -> bool:
         try:
+            if self.client is None:
+                # gql and its dependencies take a noticeable part of startup to
+                # import; do it off the event loop while MobiFlight connects
+                await asyncio.to_thread(importlib.import_module, "gql.transport.websockets")
+                from gql import Client
+                from gql.transport.websockets import WebsocketsTransport
+                self.transport = WebsocketsTransport(url=GRAPHQL_URL)
+                self.client = Client(transport=self.transport)
             logging.info(f"Connecting to ProSim GraphQL at {GRAPHQL_URL}")
             self.session = await self.client.connect_async(reconnecting=True)
             self.connected = True
@@ -162,6 +138,7 @@ class ProSimGraphQLClient:
             logging.error("Not connected to ProSim GraphQL")
             return
 
+        from gql import gql
         subscription = gql(
             """
             subscription OnDataRefChanged($names: [String!]!) {
@@ -190,7 +167,7 @@ class ProSimGraphQLClient:
 class ProSimCDUClient:
     def __init__(self, prosim_client: ProSimGraphQLClient, websocket_uri: str, cdu_name: str, cdu_dataref_name: str) -> None:
         self.prosim_client: ProSimGraphQLClient = prosim_client
-        self.mobiflight: MobiFlightClient = MobiFlightClient(websocket_uri)
+        self.mobiflight: MobiFlightClient = shared_client(websocket_uri, font="AirbusThales")
         self.event_loop: Optional[asyncio.AbstractEventLoop] = None
         self.cdu_name: str = cdu_name
         self.cdu_dataref_name: str = cdu_dataref_name
@@ -202,7 +179,7 @@ class ProSimCDUClient:
 
     async def setup_prosim(self) -> bool:
         try:
-            if not self.prosim_client.connected and not await self.prosim_client.connect():
+            if not await self.prosim_client.connect():
                 logging.error(f"Failed to connect to ProSim GraphQL for {self.cdu_name}")
                 return False
 
@@ -262,48 +239,40 @@ class ProSimCDUClient:
             self._callback_tasks.clear()
             await self.mobiflight.close()
 
+async def main() -> None:
+    # Initialize the ProSim GraphQL client
+    logging.info("Initializing ProSim GraphQL client")
+    async with warm_async_resource(ProSimGraphQLClient, ProSimGraphQLClient.disconnect) as prosim_client:
+        # Create the CDU clients
+        logging.info("Creating CDU clients")
+        captain_client = ProSimCDUClient(prosim_client, CAPTAIN_CDU_URL, "PILOT", "aircraft.mcdu1.display")
+        co_pilot_client = ProSimCDUClient(prosim_client, CO_PILOT_CDU_URL, "COPILOT", "aircraft.mcdu2.display")
+
+        # Connect to ProSim while the CDU clients connect to MobiFlight; they
+        # wait for this connection before subscribing
+        logging.info("Starting CDU clients")
+        clients = asyncio.gather(
+            captain_client.run(), 
+            co_pilot_client.run(),
+            return_exceptions=True
+        )
+        if not await prosim_client.connect():
+            logging.error("Failed to connect to ProSim GraphQL. Please check if ProSim is running.")
+            clients.cancel()
+            await asyncio.wait({clients})
+            return
+
+        await clients
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=os.environ.get("LOGLEVEL", "WARNING").upper(),
         format='%(levelname)s:%(message)s'
     )
     
-    async def cleanup(prosim_client):
-        """Clean up resources"""
-        logging.info("Cleaning up resources")
-        try:
-            if prosim_client:
-                await prosim_client.disconnect()
-        except Exception as e:
-            logging.error(f"Error during cleanup: {e}")
-    
     try:
-        # Initialize the ProSim GraphQL client
-        logging.info("Initializing ProSim GraphQL client")
-        prosim_client = ProSimGraphQLClient()
-        
-        # Create the CDU clients
-        logging.info("Creating CDU clients")
-        captain_client = ProSimCDUClient(prosim_client, CAPTAIN_CDU_URL, "PILOT", "aircraft.mcdu1.display")
-        co_pilot_client = ProSimCDUClient(prosim_client, CO_PILOT_CDU_URL, "COPILOT", "aircraft.mcdu2.display")
-        
-        # Run the clients
-        async def run_clients():
-            # Connect to ProSim first
-            if not await prosim_client.connect():
-                logging.error("Failed to connect to ProSim GraphQL. Please check if ProSim is running.")
-                return
-                
-            logging.info("Starting CDU clients")
-            await asyncio.gather(
-                captain_client.run(), 
-                co_pilot_client.run(),
-                return_exceptions=True
-            )
-            
-        # Run the async loop
-        asyncio.run(run_clients())
-        
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down due to keyboard interrupt")
     except Exception as e:
@@ -311,7 +280,4 @@ if __name__ == "__main__":
         import traceback
         logging.error(traceback.format_exc())
     finally:
-        # Clean up resources
-        asyncio.run(cleanup(prosim_client if 'prosim_client' in locals() else None))
-        
         logging.info("Application terminated")
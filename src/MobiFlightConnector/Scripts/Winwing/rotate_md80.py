@@ -20,12 +20,18 @@ import asyncio
 import json
 import logging
 import os
-import urllib.request
 import websockets
 from enum import StrEnum
 from typing import List, Dict
 import base64
 
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.latest_state import LatestState
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.transport import frame_sent
+from mobiflight_cdu.xplane_datarefs import DatarefIds
+from mobiflight_cdu.xplane_subscription import DatarefSubscription
+
 # Configure logging
 logging.basicConfig(
     level=os.environ.get("LOGLEVEL", "WARNING").upper(),
@@ -41,7 +47,6 @@ VIRTUAL_CDU_WIDTH = 30  # MD80 virtual CDU width in X-Plane
 # WebSocket Configuration
 WEBSOCKET_HOST = "localhost"
 WEBSOCKET_PORT = 8320
-BASE_REST_URL = "http://localhost:8086/api/v2/datarefs"
 BASE_WEBSOCKET_URI = f"ws://{WEBSOCKET_HOST}:8086/api/v2"
 
 # MobiFlight WebSocket endpoint for the single MD80 MCDU
@@ -80,31 +85,26 @@ def get_char(char: str) -> str:
     return CHAR_MAP.get(char, char)
 
 
-def fetch_dataref_ids(device: CduDevice) -> Dict[int, str]:
+# The line datarefs are known by name, so X-Plane is only asked for those
+DATAREFS = DatarefIds("rotate_md80", names=[name for device in CduDevice for name in device.get_line_datarefs()])
+XPLANE = DatarefSubscription(BASE_WEBSOCKET_URI, DATAREFS)
+
+
+async def fetch_dataref_ids(device: CduDevice) -> Dict[int, str]:
     """
     Fetch dataref IDs from X-Plane for the CDU lines
     Returns a mapping of dataref ID to dataref name
     """
     try:
-        with urllib.request.urlopen(BASE_REST_URL, timeout=5) as response:
-            response_json = json.load(response)
-            
-            dataref_map = {}
-            line_datarefs = device.get_line_datarefs()
-            
-            for dataref_entry in response_json.get("data", []):
-                dataref_name = str(dataref_entry.get("name", ""))
-                dataref_id = int(dataref_entry.get("id", 0))
-                
-                # Check if this dataref is one of our CDU lines
-                if dataref_name in line_datarefs:
-                    dataref_map[dataref_id] = dataref_name
-                    logging.info(f"Found dataref: {dataref_name} with ID {dataref_id}")
-            
-            if not dataref_map:
-                logging.warning("No CDU datarefs found! Check the dataref paths.")
-            
-            return dataref_map
+        line_datarefs = device.get_line_datarefs()
+        dataref_map = await DATAREFS.select(lambda name: name in line_datarefs)
+        for dataref_id, dataref_name in dataref_map.items():
+            logging.info(f"Found dataref: {dataref_name} with ID {dataref_id}")
+
+        if not dataref_map:
+            logging.warning("No CDU datarefs found! Check the dataref paths.")
+
+        return dataref_map
     except Exception as e:
         logging.error(f"Error fetching dataref mapping: {e}")
         return {}
@@ -137,6 +137,7 @@ def trim_line_intelligently(line_text: str, target_width: int = CDU_COLUMNS) ->
     return line_text[:target_width]
 
 
+@cached_frames()
 def generate_display_json(cdu_lines: List[str]) -> str:
     """
     Generate the display JSON for MobiFlight from CDU line data
@@ -174,121 +175,82 @@ def generate_display_json(cdu_lines: List[str]) -> str:
     return json.dumps({"Target": "Display", "Data": display_data})
 
 
-async def handle_device_update(queue: asyncio.Queue, device: CduDevice):
+async def handle_device_update(state: LatestState, device: CduDevice):
     """
     Handles sending display updates to MobiFlight
-    Reads from the queue and sends formatted data to the CDU hardware
+    Takes the latest CDU lines and sends formatted data to the CDU hardware
     """
-    last_run_time = 0
-    rate_limit_time = 0.1  # Rate limiting to prevent overwhelming the connection
-    
     endpoint = device.get_endpoint()
     logging.info(f"Connecting to MobiFlight CDU at {endpoint}")
     
+    patcher = DisplayPatcher()
     async for websocket in websockets.connect(endpoint):
+        patcher.reset()
         logging.info("Successfully connected to MobiFlight CDU")
         while True:
             try:
-                cdu_lines = await queue.get()
-                
-                # Rate limiting
-                elapsed = asyncio.get_event_loop().time() - last_run_time
-                if elapsed < rate_limit_time:
-                    await asyncio.sleep(rate_limit_time - elapsed)
+                # At most once per interval, skipping lines superseded in between
+                cdu_lines = await state.take()
                 
                 # Generate and send display data
                 display_json = generate_display_json(cdu_lines)
-                await websocket.send(display_json)
-                last_run_time = asyncio.get_event_loop().time()
+                payload = patcher.encode(display_json)
+                if payload is not None:
+                    await websocket.send(payload)
+                    frame_sent()
                 
             except websockets.exceptions.ConnectionClosed:
                 logging.error("MobiFlight connection lost. Attempting to reconnect...")
-                await queue.put(cdu_lines)  # Put data back in queue
+                state.retry()  # Send the lines again after reconnecting
                 break
             except Exception as e:
                 logging.error(f"Error sending to MobiFlight: {e}")
 
 
-async def handle_dataref_updates(queue: asyncio.Queue, device: CduDevice):
+async def handle_dataref_updates(state: LatestState, device: CduDevice):
     """
     Handles receiving dataref updates from X-Plane
-    Subscribes to CDU line datarefs and pushes updates to the queue
+    Subscribes to CDU line datarefs and stores the current lines in the state
     """
     # Initialize lines with empty strings
     current_cdu_lines = [''] * CDU_ROWS
-    last_sent_lines = None
     
     # Get dataref mapping
-    dataref_map = fetch_dataref_ids(device)
+    dataref_map = await fetch_dataref_ids(device)
     if not dataref_map:
         logging.error("No datarefs found. Exiting dataref handler.")
         return
     
     logging.info(f"Monitoring {len(dataref_map)} CDU line datarefs")
-    logging.info("Connecting to X-Plane WebSocket server")
-    
-    async for websocket in websockets.connect(BASE_WEBSOCKET_URI):
-        logging.info("Successfully connected to X-Plane WebSocket server")
-        try:
-            # Subscribe to all CDU line datarefs
-            subscribe_msg = json.dumps({
-                "type": "dataref_subscribe_values",
-                "req_id": 1,
-                "params": {
-                    "datarefs": [{"id": id_value} for id_value in dataref_map.keys()]
-                }
-            })
-            await websocket.send(subscribe_msg)
-            logging.info(f"Subscribed to {len(dataref_map)} datarefs")
-            
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
-                
-                if "data" not in data:
-                    continue
-                
-                # Update only the lines that have changed
-                for dataref_id, value in data["data"].items():
-                    dataref_id = int(dataref_id)
-                    if dataref_id not in dataref_map:
-                        continue
-                    
-                    dataref_name = dataref_map[dataref_id]
-                    
-                    # Extract line number from dataref name
-                    # Expected format: Rotate/md80/instruments/cdu_line_XX
-                    try:
-                        line_num = int(dataref_name.split('_')[-1]) - 1
-                        if 0 <= line_num < CDU_ROWS:
-                            # Decode the line text
-                            if isinstance(value, str):
-                                # Handle base64 encoded strings if necessary
-                                try:
-                                    line_text = base64.b64decode(value).decode('utf-8', errors='ignore')
-                                except Exception as e:
-                                    logging.warning(f"Base64 decode failed for line {line_num + 1}: {e}")
-                                    line_text = value
-                            else:
-                                line_text = str(value)
-                            
-                            # Replace null characters with spaces
-                            line_text = line_text.replace('\x00', ' ')
-                            current_cdu_lines[line_num] = line_text
-                    except (ValueError, IndexError) as e:
-                        logging.warning(f"Could not parse line number from {dataref_name}: {e}")
-                
-                # Only send update if display has changed
-                if current_cdu_lines != last_sent_lines:
-                    last_sent_lines = current_cdu_lines.copy()
-                    await queue.put(current_cdu_lines.copy())
+    line_datarefs = device.get_line_datarefs()
+
+    async for changes in XPLANE.updates(lambda name: name in line_datarefs):
+        # Update only the lines that have changed
+        for dataref_name, value in changes.items():
+            # Extract line number from dataref name
+            # Expected format: Rotate/md80/instruments/cdu_line_XX
+            try:
+                line_num = int(dataref_name.split('_')[-1]) - 1
+                if 0 <= line_num < CDU_ROWS:
+                    # Decode the line text
+                    if isinstance(value, str):
+                        # Handle base64 encoded strings if necessary
+                        try:
+                            line_text = base64.b64decode(value).decode('utf-8', errors='ignore')
+                        except Exception as e:
+                            logging.warning(f"Base64 decode failed for line {line_num + 1}: {e}")
+                            line_text = value
+                    else:
+                        line_text = str(value)
                     
-        except websockets.exceptions.ConnectionClosed:
-            logging.error("X-Plane WebSocket connection lost. Attempting to reconnect...")
-            continue
-        except Exception as e:
-            logging.error(f"Error in dataref handler: {e}")
-            await asyncio.sleep(5)  # Wait before retry
+                    # Replace null characters with spaces
+                    line_text = line_text.replace('\x00', ' ')
+                    current_cdu_lines[line_num] = line_text
+            except (ValueError, IndexError) as e:
+                logging.warning(f"Could not parse line number from {dataref_name}: {e}")
+        
+        # Only send update if display has changed
+        state.set(current_cdu_lines.copy())
 
 
 async def check_device_availability(device: CduDevice) -> bool:
@@ -314,13 +276,13 @@ async def main():
         logging.error("MobiFlight CDU device not available. Please check MobiFlight is running.")
         return
     
-    # Create communication queue
-    queue = asyncio.Queue()
+    # Latest CDU lines, sent at most every 0.1 s to prevent overwhelming the connection
+    state = LatestState(0.1, "MD80 MCDU")
     
     # Start handler tasks
     tasks = [
-        asyncio.create_task(handle_dataref_updates(queue, device)),
-        asyncio.create_task(handle_device_update(queue, device))
+        asyncio.create_task(handle_dataref_updates(state, device)),
+        asyncio.create_task(handle_device_update(state, device))
     ]
     
     logging.info("MD80 MCDU integration started successfully")
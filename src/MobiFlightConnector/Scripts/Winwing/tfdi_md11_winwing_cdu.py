@@ -4,11 +4,14 @@ import json
 import logging
 import asyncio
 import os
-import struct
-import websockets.asyncio.client as ws_client
-from typing import Optional, List, Dict, Union, Any
+from typing import Any
 from SimConnect import SimConnect, Enum
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from mobiflight_cdu.bytegrid import GridDecoder, GridLayout, LARGE
+from mobiflight_cdu.client_data import ClientDataBuffer, ClientDataRoutes, add_client_data_definition, cancel_client_data_request, warm_simconnect
+from mobiflight_cdu.dispatch_pump import DispatchPump
+from mobiflight_cdu.frame_cache import cached_frames
+from mobiflight_cdu.transport import FRAME_INTERVAL, MobiFlightClient, shared_client
 
 # URLs
 CAPTAIN_CDU_URL: str = "ws://localhost:8320/winwing/cdu-captain"
@@ -52,7 +55,7 @@ MD11_MCDU_RIGHT_DEFINITION: int = 2   # CLIENT_DATA_DEFINE_ID_RMCDU
 
 class SimConnectMobiFlight(SimConnect):
     def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+        self.client_data_handlers = ClientDataRoutes()
         if library_path:
             super().__init__(auto_connect, library_path)
         else:
@@ -60,129 +63,53 @@ class SimConnectMobiFlight(SimConnect):
         # Fix missing types
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
 
-    def register_client_data_handler(self, handler):
-        if not handler in self.client_data_handlers:
-            logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+    def register_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.register(define_id, handler)
 
-    def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
-            logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+    def unregister_client_data_handler(self, define_id, handler):
+        self.client_data_handlers.unregister(define_id, handler)
 
     def my_dispatch_proc(self, pData, cbData, pContext):
         dwID = pData.contents.dwID
         if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
             client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
+            self.client_data_handlers.dispatch(client_data)
         else:
             super().my_dispatch_proc(pData, cbData, pContext)
 
-class MobiFlightClient:
-    def __init__(self, websocket_uri: str, max_retries: int = 3) -> None:
-        self.websocket: Optional[ws_client.ClientConnection] = None
-        self.connected: asyncio.Event = asyncio.Event()
-        self.websocket_uri: str = websocket_uri
-        self.retries: int = 0
-        self.max_retries: int = max_retries
-        self.last_display_data: Optional[str] = None
-        self._was_connected: bool = False
-
-    async def run(self) -> None:
-        while self.retries < self.max_retries:
-            try:
-                if self.websocket is None:
-                    logging.info("Connecting to MobiFlight at %s", self.websocket_uri)
-                    self.websocket = await ws_client.connect(self.websocket_uri, ping_interval=None)
-                    logging.info("MobiFlight connected")
-                    self.connected.set()
-                    
-                    # If we were previously connected and have last display data, resend it
-                    if self._was_connected and self.last_display_data:
-                        logging.info("Resending last display data after reconnection")
-                        await self.send(self.last_display_data)
-                    
-                    self._was_connected = True
-                    self.retries = 0  # Reset retries on successful connection
-                
-                await self.websocket.recv()
-            except Exception as e: 
-                self.retries += 1
-                logging.error(f"WebSocket error: {e} with retries {self.retries}")
-                self.websocket = None
-                self.connected.clear()
-            await asyncio.sleep(5)
-        logging.error("Max retries reached. Giving up connecting to MobiFlight at %s", self.websocket_uri)
-        self.connected.set()
-
-    async def send(self, data: str) -> None:
-        if self.websocket and self.connected.is_set():
-            await self.websocket.send(data)
-            self.last_display_data = data
-
-    async def close(self) -> None:
-        if self.websocket:
-            await self.websocket.close()
-            self.websocket = None
-            self.connected.clear()
-            self._was_connected = False
-
+    def _run(self):
+        # Replaces the wrapper's dispatch loop (one message every 2 ms) for all three MCDUs
+        DispatchPump(self, "MD11 SimConnect").run()
+
+# The status lights are followed by a row-major MCDUChar array; the MCDU is monochrome green
+MCDU_LAYOUT: GridLayout = GridLayout(
+    stride=MCDU_CHAR_SIZE,
+    offset=ctypes.sizeof(MCDUStatus),
+    glyph=MCDUChar.value.offset,
+    glyph_width=ctypes.sizeof(c_uint16),  # char16_t
+    flags=MCDUChar.large.offset,
+    default_colour="g",
+    flag_roles={0xFF: LARGE},  # small font if not large
+    glyphs={'\u25B3': '\u0394'},  # replace WHITE UP-POINTING TRIANGLE with GREEK CAPITAL LETTER DELTA
+    small_glyphs='\u25B3'
+)
+MCDU_DECODER: GridDecoder = GridDecoder(MCDU_LAYOUT)
+
+
+@cached_frames()
 def create_mobi_json(data: bytes) -> str:
-    message: Dict[str, Union[str, List[List[Union[str, int]]], Dict[str, bool]]] = {
-        "Target": "Display",
-        "Data": [[] for _ in range(MCDU_CHARS)]
-    }
-    
-    # We know exactly how many characters we should have - it's MCDU_CHARS
-    # The data includes MCDU_CHARS number of MCDUChar structures plus 4 bools at the end    
+    # The data includes MCDU_CHARS number of MCDUChar structures plus 4 bools at the end
     if len(data) < MCDU_DATA_SIZE:
         logging.error(f"Received data size {len(data)} is smaller than expected {MCDU_DATA_SIZE}")
-        return json.dumps(message)
-    
-    # Now get the character array that follows the status lights
-    char_data_start = ctypes.sizeof(MCDUStatus) 
-    mcdu_chars = (MCDUChar * MCDU_CHARS).from_buffer_copy(data[char_data_start:char_data_start + (MCDU_CHARS * MCDU_CHAR_SIZE)])
-    
-    # Process each character - note we're using row-major order here since that's how the display expects it
-    for y in range(MCDU_ROWS):
-        for x in range(MCDU_COLUMNS):
-            # Convert from row-major to array index
-            src_idx = y * MCDU_COLUMNS + x
-            dst_idx = src_idx  # In this case, they're the same since we want row-major output
-            
-            try:
-                char = mcdu_chars[src_idx]
-                # Convert char16_t to Python string
-                symbol = chr(char.value)
-                
-                if symbol == ' ' or symbol == '\0':
-                    message["Data"][dst_idx] = []
-                elif symbol == '\u25B3': 
-                    message["Data"][dst_idx] = [
-                        '\u0394', #replace WHITE UP-POINTING TRIANGLE with GREEK CAPITAL LETTER DELTA
-                        "g",  # green color
-                        1 
-                    ]   
-                else:
-                    message["Data"][dst_idx] = [
-                        symbol,
-                        "g",  # green color
-                        0 if char.large else 1  # small font if not large
-                    ]
-            except (ValueError, TypeError, IndexError) as e:
-                message["Data"][dst_idx] = []
-                logging.debug(f"Error processing cell at ({x}, {y}): {e}")
-    
-    return json.dumps(message)
+        return json.dumps({"Target": "Display", "Data": [[] for _ in range(MCDU_CHARS)]})
+    return MCDU_DECODER.to_json(data)
 
 class MD11CDUClient:
     def __init__(self, sc_mobiflight: SimConnectMobiFlight, websocket_uri: str, cdu_definition: int) -> None:
         self.sc_mobiflight: SimConnectMobiFlight = sc_mobiflight
-        self.mobiflight: MobiFlightClient = MobiFlightClient(websocket_uri)
-        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mobiflight: MobiFlightClient = shared_client(websocket_uri, reset_retries_on_connect=True, frame_interval=FRAME_INTERVAL)
         self.cdu_definition: int = cdu_definition
-        self.last_data: Optional[bytes] = None
+        self.screen: ClientDataBuffer = ClientDataBuffer(MCDU_DATA_SIZE)
 
     def failed_to_connect(self) -> bool:
         return self.mobiflight.retries >= self.mobiflight.max_retries
@@ -199,14 +126,7 @@ class MD11CDUClient:
             # Use MCDU_DATA_SIZE for data definition and offset calculation
             offset = MCDU_DATA_SIZE * self.cdu_definition
             
-            self.sc_mobiflight.dll.AddToClientDataDefinition(
-                self.sc_mobiflight.hSimConnect,
-                self.cdu_definition,
-                offset,
-                MCDU_DATA_SIZE,
-                0,
-                0
-            )
+            add_client_data_definition(self.sc_mobiflight, self.cdu_definition, offset, MCDU_DATA_SIZE)
 
             # Request data updates
             self.sc_mobiflight.dll.RequestClientData(
@@ -220,7 +140,7 @@ class MD11CDUClient:
             )
 
             # Set up the handler
-            self.sc_mobiflight.register_client_data_handler(self.handle_cdu_data)
+            self.sc_mobiflight.register_client_data_handler(self.cdu_definition, self.handle_cdu_data)
             logging.info("SimConnect initialized for MD11 MCDU")
             return True
         except Exception as e:
@@ -229,32 +149,14 @@ class MD11CDUClient:
                 
     def handle_cdu_data(self, client_data: Any) -> None:
         try:
-            if client_data.dwDefineID == self.cdu_definition and hasattr(client_data, 'dwData'):                
-                int_count : int = int(MCDU_DATA_SIZE / 4)              
-                if len(client_data.dwData) >= int_count:
-                    data_list : bytearray = bytearray()                  
-                    for i in range(int_count): 
-                        my_bytes : bytes = struct.pack("I", client_data.dwData[i])
-                        data_list.extend(my_bytes)                
-                    data: bytes = bytes(data_list) 
-                    # Only send if data has changed
-                    if data != self.last_data:
-                        self.last_data = data
-                        json_data = create_mobi_json(data)
-                        asyncio.run_coroutine_threadsafe(self.mobiflight.send(json_data), self.event_loop)                                              
+            if hasattr(client_data, 'dwData'):
+                # Only send if data has changed
+                if self.screen.update(client_data):
+                    self.mobiflight.post_threadsafe(bytes(self.screen.data), create_mobi_json)
         except Exception as e:
             logging.error(f"Error handling MCDU data: {e}")
 
-    async def process_simconnect(self) -> None:
-        while True:
-            try:
-                self.sc_mobiflight.my_dispatch_proc()
-            except:
-                pass
-            await asyncio.sleep(0.1)
-
     async def run(self) -> None:
-        self.event_loop = asyncio.get_running_loop()
         logging.info("Starting MCDU client")
         
         try:
@@ -265,10 +167,9 @@ class MD11CDUClient:
                 logging.error("Failed to connect to MobiFlight")
                 return
             
-            # Initialize SimConnect
+            # Initialize SimConnect; its messages arrive on the connection's dispatch pump
             if self.setup_simconnect():
-                simconnect_task: asyncio.Task = asyncio.create_task(self.process_simconnect())
-                await asyncio.gather(mobiflight_task, simconnect_task)
+                await mobiflight_task
             else:
                 logging.error("Failed to start - SimConnect initialization failed")
         except KeyboardInterrupt:
@@ -276,22 +177,18 @@ class MD11CDUClient:
         except Exception as e:
             logging.error(f"Error: {e}")
         finally:
+            self.sc_mobiflight.unregister_client_data_handler(self.cdu_definition, self.handle_cdu_data)
+            cancel_client_data_request(self.sc_mobiflight, MD11_MCDU_CLIENT_DATA_ID, self.cdu_definition, self.cdu_definition)
             await self.mobiflight.close()
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
-        format='%(levelname)s:%(message)s'
-    )
-    
-    sc_mobiflight: SimConnectMobiFlight = SimConnectMobiFlight()
-    
-    # Create clients for all three MCDUs
-    left_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CAPTAIN_CDU_URL, MD11_MCDU_LEFT_DEFINITION)
-    center_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CENTER_CDU_URL, MD11_MCDU_CENTER_DEFINITION)
-    right_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CO_PILOT_CDU_URL, MD11_MCDU_RIGHT_DEFINITION)
-    
-    async def run_clients():
+
+async def main() -> None:
+    with warm_simconnect(SimConnectMobiFlight, SimConnectMobiFlight.exit) as sc_mobiflight:
+        # Create clients for all three MCDUs
+        left_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CAPTAIN_CDU_URL, MD11_MCDU_LEFT_DEFINITION)
+        center_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CENTER_CDU_URL, MD11_MCDU_CENTER_DEFINITION)
+        right_mcdu: MD11CDUClient = MD11CDUClient(sc_mobiflight, CO_PILOT_CDU_URL, MD11_MCDU_RIGHT_DEFINITION)
+
         await asyncio.gather(
             left_mcdu.run(),
             center_mcdu.run(),
@@ -299,11 +196,16 @@ if __name__ == "__main__":
             return_exceptions=True
         )
 
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "WARNING").upper(),
+        format='%(levelname)s:%(message)s'
+    )
+
     try:
-        asyncio.run(run_clients())
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Shutting down")
     except Exception as e:
         logging.error(f"Error: {e}")
-    finally:
-        sc_mobiflight.exit() 
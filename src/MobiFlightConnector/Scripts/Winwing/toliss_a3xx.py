@@ -10,31 +10,36 @@ Each enum member is assigned a value that represents the X-Plane dataref identif
 Upon script start, MobiFlight is probed (get_available_devices()) to detect the devices connected to the PC. Any device that returns a successful response is then tracked.
 
 Two tasks are started independently for each avialable CDU device.
-1. handle_dataref_updates -> Listens to X-Plane's WebSocket server for dataref updates for that specific CDU and pushes an event to a queue
-2. handle_device_update   -> Listens to the queue and dispatches updates to MobiFlight to update that CDU
+1. handle_dataref_updates -> Receives that CDU's dataref updates from the script's single X-Plane WebSocket subscription (XPLANE) and stores them in that CDU's DatarefStore, which only decodes values that changed
+2. handle_device_update   -> Takes the latest values at most once per interval and dispatches them to MobiFlight to update that CDU
 
 Tasks are started independently for each CDU device to ensure each device can update quickly, particularly when players might be performing shared cockpit flights.
 
-Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function use `async for` with the websockets client. The failed message is put back in the queue, the loop continues to the next iteration which then reconnects again.
-The failed message is picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
+Upon a failed connection while dispatching updates to MobiFlight, the handle_device_update function use `async for` with the websockets client. The values are marked for sending again (store.retry()), the loop continues to the next iteration which then reconnects again.
+The latest values are picked back up and dispatched to MobiFlight. This ensures a user's device eventually receives the updated display contents and doesn't hang which would require the user to cycle the page again.
 """
 
 import asyncio
 import base64
-import json
 import logging
 import os
-import urllib.request
 import websockets
+from dataclasses import dataclass
 from enum import StrEnum
 
+from mobiflight_cdu.latest_state import DatarefStore
+from mobiflight_cdu.patch import DisplayPatcher
+from mobiflight_cdu.row_render import DatarefPlan, RowRenderer
+from mobiflight_cdu.transport import frame_sent
+from mobiflight_cdu.xplane_datarefs import DatarefIds
+from mobiflight_cdu.xplane_subscription import DatarefSubscription
+
 CDU_COLUMNS = 24
 CDU_ROWS = 14
 
 WEBSOCKET_HOST = "localhost"
 WEBSOCKET_PORT = 8320
 
-BASE_REST_URL = "http://localhost:8086/api/v2/datarefs"
 BASE_WEBSOCKET_URI = f"ws://{WEBSOCKET_HOST}:8086/api/v2"
 
 WS_CAPTAIN = f"ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}/winwing/cdu-captain"
@@ -68,6 +73,9 @@ COLOR_MAP = {"b": "c"}
 
 SYMBOL_COLOR_MAP = {"E": "a", "4": "a", "5": "a"}
 
+CONTENT_GLYPHS = str.maketrans(CONTENT_MAP)
+SYMBOL_GLYPHS = str.maketrans(SYMBOL_MAP)
+
 
 class CduDevice(StrEnum):
     Captain = "MCDU1"
@@ -83,26 +91,39 @@ class CduDevice(StrEnum):
                 raise KeyError(f"Invalid device specified {self}")
 
 
-def get_color(dataref_name: str, char: str):
+def get_line(dataref_name: str) -> int | None:
+    if "title" in dataref_name:
+        return 0
+    if (
+        dataref_name.endswith("spa")
+        or dataref_name.endswith("spw")
+        or dataref_name.endswith("VertSlewKeys")
+    ):
+        return 7
+    return next((int(i) for i in reversed(dataref_name) if i.isdigit()), None)
+
+
+def get_colors(dataref_name: str) -> tuple[str, dict[str, str]]:
+    """Colour of the dataref's characters, and the characters that have a colour of their own."""
     suffix = dataref_name[-1]
 
     if (
         ("label" in dataref_name or "title" in dataref_name) and suffix == "s"
     ) or dataref_name.endswith("VertSlewKeys"):
-        return "w"
+        return "w", {}
     elif suffix == "s":
-        return SYMBOL_COLOR_MAP.get(char, "c")
+        return "c", SYMBOL_COLOR_MAP
 
-    return COLOR_MAP.get(suffix, suffix)
+    return COLOR_MAP.get(suffix, suffix), {}
 
 
-def get_char(dataref_name: str, char: str) -> str:
+def get_glyphs(dataref_name: str) -> dict[int, str]:
     suffix = dataref_name[-1]
 
     if suffix == "s":
-        return SYMBOL_MAP.get(char, char)
+        return SYMBOL_GLYPHS
 
-    return CONTENT_MAP.get(char, char)
+    return CONTENT_GLYPHS
 
 
 def get_size(dataref_name):
@@ -114,204 +135,114 @@ def get_size(dataref_name):
     )
 
 
-def fetch_dataref_mapping(device: CduDevice):
-    with urllib.request.urlopen(BASE_REST_URL, timeout=5) as response:
-        response_json = json.load(response)
-
-        data = list(response_json["data"])
-        mcdu_datarefs = filter(
-            lambda x: str(x["name"]).startswith(f"AirbusFBW/{device}"), data
-        )
-
-        return dict(
-            map(
-                lambda dataref: (int(dataref["id"]), str(dataref["name"])),
-                mcdu_datarefs,
-            )
-        )
-
-
-def process_cdu_line(line_datarefs: dict[str, str], row: int) -> list[list]:
-    line_chars = [[] for _ in range(CDU_COLUMNS)]
-
-    target_suffix = "label" if row % 2 == 0 else "cont"
-
-    for dataref, text in line_datarefs.items():
-        if not text or text.isspace():
-            continue
-
-        # The first and last rows only cover a single row. All other rows cover 2 rows between the label and the main content (scont, cont)
-        if (row != 0 and row != 14) and not target_suffix in dataref:
-            continue
-
-        for i, char in enumerate(text[:CDU_COLUMNS]):
-            if char == " ":
-                continue
-
-            line_chars[i] = (
-                get_char(dataref, char),
-                get_color(dataref, char),
-                get_size(dataref),
-            )
-
-    return line_chars
+def is_device_dataref(device: CduDevice, name: str) -> bool:
+    return name.startswith(f"AirbusFBW/{device}")
 
 
-def group_datarefs_by_line(values: dict[str, str]) -> dict[int, dict[str, str]]:
-    grouped_datarefs = {}
+DATAREFS = DatarefIds("toliss_a3xx", lambda name: any(is_device_dataref(device, name) for device in CduDevice))
+XPLANE = DatarefSubscription(BASE_WEBSOCKET_URI, DATAREFS)
 
-    for dataref, value in values.items():
-        try:
-            line_num = (
-                0
-                if "title" in dataref
-                else (
-                    7
-                    if dataref.endswith("spa")
-                    or dataref.endswith("spw")
-                    or dataref.endswith("VertSlewKeys")
-                    else int(next(i for i in list(dataref[::-1]) if i.isdigit()))
-                )
-            )
-            if line_num not in grouped_datarefs:
-                grouped_datarefs[line_num] = {}
 
-            grouped_datarefs[line_num][dataref] = value
-        except Exception as e:
-            pass
+@dataclass(frozen=True)
+class TolissDataref(DatarefPlan):
+    glyphs: dict[int, str]
+    color: str
+    colors: dict[str, str]
+    size: int
 
-    return grouped_datarefs
 
+def compile_dataref(dataref_name: str) -> TolissDataref | None:
+    line = get_line(dataref_name)
 
-def generate_display_json(values: dict[str, str]):
-    display_data = [[] for _ in range(CDU_ROWS * CDU_COLUMNS)]
+    # Line 0 (title) and line 7 (scratchpad) only cover a single row. All other lines cover 2 rows between the label and the main content (scont, cont)
+    if line == 0:
+        row = 0
+    elif line == 7:
+        row = CDU_ROWS - 1
+    elif line is None or not 1 <= line <= 6:
+        return None
+    elif "label" in dataref_name:
+        row = line * 2 - 1
+    elif "cont" in dataref_name:
+        row = line * 2
+    else:
+        return None
 
-    grouped_datarefs = group_datarefs_by_line(values)
+    color, colors = get_colors(dataref_name)
+    return TolissDataref(row, get_glyphs(dataref_name), color, colors, get_size(dataref_name))
 
-    for row in range(CDU_ROWS + 1):
-        if (
-            row == 1
-        ):  # Line 0 covers a single row. Skip row 1 as this will be populated by Line01
-            continue
 
-        dataref_line = row // 2 if row > 0 else 0
+def render_row(datarefs: list[tuple[TolissDataref, str]]) -> list[list]:
+    line_chars = [[] for _ in range(CDU_COLUMNS)]
 
-        line_datarefs = grouped_datarefs.get(dataref_line, {})
-        if not line_datarefs:
+    for dataref, text in datarefs:
+        if not text or text.isspace():
             continue
 
-        line_chars = process_cdu_line(line_datarefs, row)
+        text = text[:CDU_COLUMNS]
+        glyphs = text.translate(dataref.glyphs)
+        for i, char in enumerate(text):
+            if char == " ":
+                continue
 
-        start_index = (row - 1 if row > 0 else row) * CDU_COLUMNS
-        display_data[start_index : start_index + CDU_COLUMNS] = (
-            line_chars  # Bulk assign the entire row
-        )
+            line_chars[i] = (glyphs[i], dataref.colors.get(char, dataref.color), dataref.size)
 
-    return json.dumps({"Target": "Display", "Data": display_data})
+    return line_chars
 
 
-async def handle_device_update(queue: asyncio.Queue, device: CduDevice):
+async def handle_device_update(store: DatarefStore, device: CduDevice):
     """
     Translates and sends dataref updates to MobiFlight.
     """
-    last_run_time = 0
-    rate_limit_time = 0.1
-
     endpoint = device.get_endpoint()
     logging.info("Connecting to CDU device %s", device)
+    patcher = DisplayPatcher()
+    display = RowRenderer(compile_dataref, render_row, CDU_ROWS)
     async for websocket in websockets.connect(endpoint):
+        patcher.reset()
         logging.info("Connected successfully to CDU device %s", device)
         while True:
-            values = await queue.get()
+            changed = await store.take()
 
             try:
-                elapsed = asyncio.get_event_loop().time() - last_run_time
-
-                # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
-                # This rate limits the number of active websocket requests to MobiFlight.
-                # The delay should not be noticeable unless a user heavily spams page changes, but it should be enough that too many messages won't be pushed at once.
-                if elapsed < rate_limit_time:
-                    await asyncio.sleep(rate_limit_time - elapsed)
-
-                display_json = generate_display_json(values)
-                await websocket.send(display_json)
-                last_run_time = asyncio.get_event_loop().time()
+                display_json = display.render(store.values, changed)
+                payload = patcher.encode(display_json)
+                if payload is not None:
+                    await websocket.send(payload)
+                    frame_sent()
 
             except websockets.exceptions.ConnectionClosed:
                 logging.error(
                     "MobiFlight websocket connection was closed... Attempting to reconnect"
                 )
-                await queue.put(values)
+                store.retry()
                 break
 
 
-async def handle_dataref_updates(queue: asyncio.Queue, device: CduDevice):
-    def process_slew_keys(value: int) -> str:
-        match value:
-            case 1:
-                result = f"{UP_ARROW}{DOWN_ARROW}"
-            case 2:
-                result = f"{UP_ARROW} "
-            case 3:
-                result = f"{DOWN_ARROW}"
-            case _:
-                result = ""
-
-        return result.rjust(24)
+def process_slew_keys(value: int) -> str:
+    match value:
+        case 1:
+            result = f"{UP_ARROW}{DOWN_ARROW}"
+        case 2:
+            result = f"{UP_ARROW} "
+        case 3:
+            result = f"{DOWN_ARROW}"
+        case _:
+            result = ""
 
-    last_known_values = {}
+    return result.rjust(24)
 
-    dataref_map = fetch_dataref_mapping(device)
-    logging.info("Connecting to X-Plane websocket server")
-    async for websocket in websockets.connect(BASE_WEBSOCKET_URI):
-        logging.info("Connected successfully to X-Plane websocket server")
-        try:
-            await websocket.send(
-                json.dumps(
-                    {
-                        "type": "dataref_subscribe_values",
-                        "req_id": 1,
-                        "params": {
-                            "datarefs": [
-                                {"id": id_value} for id_value in dataref_map.keys()
-                            ]
-                        },
-                    }
-                )
-            )
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
 
-                if "data" not in data:
-                    continue
+def decode_dataref(dataref_name: str, value) -> str:
+    if dataref_name.endswith("VertSlewKeys"):
+        return process_slew_keys(value)
 
-                new_values = dict(last_known_values)
+    return base64.b64decode(value).decode().replace("\x00", " ")
 
-                for dataref_id, value in data["data"].items():
-                    dataref_id = int(dataref_id)
-                    if dataref_id not in dataref_map:
-                        continue
 
-                    dataref_name = dataref_map[dataref_id]
-
-                    if dataref_name.endswith("VertSlewKeys"):
-                        new_values[dataref_name] = process_slew_keys(value)
-                    else:
-                        new_values[dataref_name] = (
-                            base64.b64decode(value).decode().replace("\x00", " ")
-                        )
-
-                if new_values == last_known_values:
-                    continue
-
-                last_known_values = new_values
-                await queue.put(new_values)
-        except websockets.exceptions.ConnectionClosed:
-            logging.error(
-                "X-Plane websocket connection was closed... Attempting to reconnect"
-            )
-            continue
+async def handle_dataref_updates(store: DatarefStore, device: CduDevice):
+    async for changes in XPLANE.updates(lambda name: is_device_dataref(device, name)):
+        store.update(changes)
 
 
 async def get_available_devices() -> list[CduDevice]:
@@ -349,10 +280,12 @@ async def main():
 
     tasks = []
     for device in available_devices:
-        queue = asyncio.Queue()
+        # Weaker CPUs may experience performance issues when a websocket connection is saturated with requests, such as when pages are frequently changed.
+        # The values are therefore rendered at most once per interval; changes arriving in between replace each other instead of queueing up.
+        store = DatarefStore(0.1, f"CDU {device}", decode_dataref)
 
-        tasks.append(asyncio.create_task(handle_dataref_updates(queue, device)))
-        tasks.append(asyncio.create_task(handle_device_update(queue, device)))
+        tasks.append(asyncio.create_task(handle_dataref_updates(store, device)))
+        tasks.append(asyncio.create_task(handle_device_update(store, device)))
 
     logging.info("Started background tasks for %s", available_devices)
 
@@ -172,6 +172,10 @@ namespace MobiFlightWwFcu
         private Dictionary<string, string> LcdCurrentValuesCache = new Dictionary<string, string>();
         private Dictionary<string, byte> LedCurrentValuesCache = new Dictionary<string, byte>();
 
+        // Last full display, needed to apply DisplayPatch messages that only carry the changed cells.
+        private JArray CurrentCduData = null;
+        private readonly object CduDataLock = new object();
+
         public WinCtrlCduController(IWinCtrlMessageSender sender, WinCtrlCduType cduType)
         {
             MessageSender = sender;
@@ -369,6 +373,10 @@ namespace MobiFlightWwFcu
                 {
                     ConvertAndSendCduData(value);
                 }
+                else if (name == WinCtrlConstants.CDU_PATCH_DATA)
+                {
+                    ApplyAndSendCduPatch(value);
+                }
                 else if (name == WinCtrlConstants.FONT_DATA)
                 {
                     SetFontAndInitDisplay(value);
@@ -403,10 +411,47 @@ namespace MobiFlightWwFcu
 
         private void ConvertAndSendCduData(string json)
         {
-            List<byte> byteList = new List<byte>();
             JObject jsonObject = JsonConvert.DeserializeObject<JObject>(json);
             JArray data = (JArray)jsonObject["Data"];
 
+            lock (CduDataLock)
+            {
+                CurrentCduData = data;
+                SendCduData(data);
+            }
+        }
+
+        private void ApplyAndSendCduPatch(string json)
+        {
+            JObject jsonObject = JsonConvert.DeserializeObject<JObject>(json);
+            JArray spans = (JArray)jsonObject["Data"];
+
+            lock (CduDataLock)
+            {
+                // Without a full display to patch there is nothing sensible to show.
+                // The script sends a full display on (re)connect and periodically.
+                if (CurrentCduData == null) return;
+
+                foreach (JToken span in spans)
+                {
+                    int start = span[0].Value<int>();
+                    JArray cells = (JArray)span[1];
+                    for (int i = 0; i < cells.Count; i++)
+                    {
+                        int index = start + i;
+                        if (index >= 0 && index < CurrentCduData.Count)
+                            CurrentCduData[index] = cells[i];
+                    }
+                }
+
+                SendCduData(CurrentCduData);
+            }
+        }
+
+        private void SendCduData(JArray data)
+        {
+            List<byte> byteList = new List<byte>();
+
             for (int i = 0; i < data.Count; i++)
             {
                 var item = data[i];
@@ -13,6 +13,10 @@ namespace MobiFlightWwFcu
         //{ "Target": "Display",
         //  "Data": [ [], [], [], [] ] }
 
+        // Only the changed cells, as [start index, [cells]] spans on top of the last display:
+        //{ "Target": "DisplayPatch",
+        //  "Data": [ [312, [ ["A", "w", 0] ] ] ] }
+
         // { "Target": "Font",
         //   "Data": "Airbus" }
 
@@ -23,8 +27,13 @@ namespace MobiFlightWwFcu
                 string displayName = string.Empty;
                 try
                 {
-                    // Check for Data or for Font                    
-                    if (e.Data.Contains("Display"))
+                    // Check for Patch, Data or for Font
+                    if (e.Data.Contains("DisplayPatch"))
+                    {
+                        displayName = WinCtrlConstants.CDU_PATCH_DATA;
+                        Controller.SetDisplay(displayName, e.Data);
+                    }
+                    else if (e.Data.Contains("Display"))
                     {
                         displayName = WinCtrlConstants.CDU_DATA;
                         Controller.SetDisplay(displayName, e.Data);
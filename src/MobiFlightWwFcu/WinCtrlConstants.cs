@@ -99,6 +99,7 @@ namespace MobiFlightWwFcu
         public static readonly int[] NWS_PRODUCTIDS = { PRODUCT_ID_NWS_L, PRODUCT_ID_NWS_R };
 
         public const string CDU_DATA = "Cdu Data";
+        public const string CDU_PATCH_DATA = "Cdu Patch Data";
         public const string FONT_DATA = "Font Data";
 
 
@@ -503,6 +503,86 @@ namespace MobiFlightWwFcuUnitTests
 
         #endregion
 
+        #region SetDisplay — Cdu Patch Data
+
+        [TestMethod]
+        public void SetDisplay_CduPatchData_ReplacesOnlyPatchedCells()
+        {
+            var device = CreateMcdu();
+
+            device.SetDisplay("Cdu Data",
+                "{\"Target\":\"Display\",\"Data\":[[\"A\",\"w\",0],[\"B\",\"w\",0],[\"C\",\"w\",0]]}");
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[1,[[\"X\",\"r\",0]]]]}");
+
+            Assert.HasCount(2, mockMessageSender.CduDisplayBytes);
+            CollectionAssert.AreEqual(
+                new byte[] { 0x43, 0x00, (byte)'A', 0xC6, 0x00, (byte)'X', 0x44, 0x00, (byte)'C' },
+                mockMessageSender.CduDisplayBytes[1]);
+        }
+
+        [TestMethod]
+        public void SetDisplay_CduPatchData_MultipleSpansAndEmptyCell()
+        {
+            var device = CreateMcdu();
+
+            device.SetDisplay("Cdu Data",
+                "{\"Target\":\"Display\",\"Data\":[[\"A\",\"w\",0],[\"B\",\"w\",0],[\"C\",\"w\",0]]}");
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[0,[[]]],[2,[[\"Z\",\"w\",0]]]]}");
+
+            // Empty cell → space in white (0x42) + first marker.
+            CollectionAssert.AreEqual(
+                new byte[] { 0x43, 0x00, (byte)' ', 0x42, 0x00, (byte)'B', 0x44, 0x00, (byte)'Z' },
+                mockMessageSender.CduDisplayBytes[1]);
+        }
+
+        [TestMethod]
+        public void SetDisplay_CduPatchData_IsAppliedOnTopOfPreviousPatch()
+        {
+            var device = CreateMcdu();
+
+            device.SetDisplay("Cdu Data",
+                "{\"Target\":\"Display\",\"Data\":[[\"A\",\"w\",0],[\"B\",\"w\",0]]}");
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[0,[[\"X\",\"w\",0]]]]}");
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[1,[[\"Y\",\"w\",0]]]]}");
+
+            Assert.HasCount(3, mockMessageSender.CduDisplayBytes);
+            CollectionAssert.AreEqual(
+                new byte[] { 0x43, 0x00, (byte)'X', 0x44, 0x00, (byte)'Y' },
+                mockMessageSender.CduDisplayBytes[2]);
+        }
+
+        [TestMethod]
+        public void SetDisplay_CduPatchData_OutOfRangeIndexIsIgnored()
+        {
+            var device = CreateMcdu();
+
+            device.SetDisplay("Cdu Data",
+                "{\"Target\":\"Display\",\"Data\":[[\"A\",\"w\",0],[\"B\",\"w\",0]]}");
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[1,[[\"X\",\"w\",0],[\"Y\",\"w\",0]]]]}");
+
+            CollectionAssert.AreEqual(
+                new byte[] { 0x43, 0x00, (byte)'A', 0x44, 0x00, (byte)'X' },
+                mockMessageSender.CduDisplayBytes[1]);
+        }
+
+        [TestMethod]
+        public void SetDisplay_CduPatchData_WithoutFullDisplay_SendsNothing()
+        {
+            var device = CreateMcdu();
+
+            device.SetDisplay("Cdu Patch Data",
+                "{\"Target\":\"DisplayPatch\",\"Data\":[[0,[[\"X\",\"w\",0]]]]}");
+
+            Assert.IsEmpty(mockMessageSender.CduDisplayBytes);
+        }
+
+        #endregion
+
         #region Stop / Shutdown
 
         [TestMethod]